@@ -1,2 +1,18 @@
-from .serialize import CellType, serialize, deserialize, SchemaType
-from .merge_sort import SortInfo, merge_sort, split_file, merge_files
+from .serialize import CellType, serialize, deserialize, SchemaType, RowCodec, get_codec
+from .compression import Compression, CompressionStats, COMPRESSIONS
+from .keys import SortKey, build_key_encoder, build_sort_key
+from .index import SparseIndex, INDEX_SUFFIX
+from .memory import MemoryPlan, measure_rows, plan_memory
+from .formats import (
+    FORMAT_V1, FORMAT_V2, BlockStats, FileWriter, FileReader, RowCodecV2, detect_format, iter_rows, write_file,
+    convert_file, encode_schema, decode_schema,
+)
+from .stats import SortStats, PassStats, SortEvent, PHASES, RUN_EVENT, MERGE_EVENT
+from .merge_sort import (
+    SortInfo, FileSegment, NaturalRun, DISTINCT_KEYS, DISTINCT_ROWS, ASCENDING_RUN, DESCENDING_RUN, UNSORTED_RUN,
+    merge_sort, iter_sorted, top_k, split_file, split_segments, merge_files, merge_runs, scan_natural_runs,
+    iter_batches, iter_merged_rows,
+)
+from .segments import SegmentStore
+from .join import merge_join, INNER_JOIN, LEFT_JOIN, RIGHT_JOIN, OUTER_JOIN
+from .group_by import Aggregation, group_by, group_by_schema
@@ -0,0 +1,115 @@
+import queue
+import threading
+from typing import Any, Optional
+from collections.abc import Callable, Iterator
+
+# queues are polled with timeout to notice stop of other side
+_POLL_SECONDS = 0.1
+_END = object()
+
+
+def iter_prefetched(items: Iterator[Any], depth: int = 1) -> Iterator[Any]:
+    """Iterate items in background thread, at most depth items wait in queue.
+
+    File reads, decompression and other calls which release GIL overlap
+    with work of consumer. Exception of iterator is raised in consumer,
+    iterator is closed in background thread if consumer stops early.
+
+    :param items: iterator, for example generator of read blocks.
+    :param depth: number of prefetched items.
+    :return:
+    """
+    results = queue.Queue(depth)
+    is_stopped = threading.Event()
+
+    def put(result: tuple[Any, Optional[BaseException]]) -> bool:
+        while not is_stopped.is_set():
+            try:
+                results.put(result, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as error:
+            put((_END, error))
+        finally:
+            close = getattr(items, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = results.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        is_stopped.set()
+        thread.join()
+
+
+class BackgroundWriter:
+    """Writer which calls write function in background thread.
+
+    At most depth blocks wait in queue, so producer waits for slow disk
+    only when queue is full. Exception of write function is raised by
+    the next write or close.
+    """
+
+    def __init__(self, write: Callable[[Any], None], depth: int = 2):
+        """Start thread.
+
+        :param write: write function, for example write of file.
+        :param depth: number of queued blocks.
+        """
+        self._write = write
+        self._blocks = queue.Queue(depth)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        while True:
+            block = self._blocks.get()
+            if block is _END:
+                return
+            if self._error is None:
+                try:
+                    self._write(block)
+                except BaseException as error:
+                    self._error = error
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, block: Any) -> None:
+        """Queue block for write.
+
+        :param block: block.
+        :return:
+        """
+        self._raise_error()
+        self._blocks.put(block)
+
+    def close(self) -> None:
+        """Wait for write of queued blocks and stop thread.
+
+        :return:
+        """
+        if self._thread.is_alive():
+            self._blocks.put(_END)
+            self._thread.join()
+        self._raise_error()
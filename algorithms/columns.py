@@ -0,0 +1,170 @@
+from array import array
+from typing import Any, Union
+from collections.abc import Callable, Iterator
+
+from .keys import SortKey
+from .serialize import CellType, SchemaType, Buffer, COMPOSITE_TYPES, get_codec
+
+
+def _typecode(kind: str, size: int) -> str:
+    return next(x for x in kind if array(x).itemsize == size)
+
+
+_SIGNED, _UNSIGNED = 'bhilq', 'BHILQ'
+ARRAY_TYPE_BY_STRUCT_MARK = {
+    'c': 'B', '?': 'B',
+    'b': _typecode(_SIGNED, 1), 'B': _typecode(_UNSIGNED, 1),
+    'h': _typecode(_SIGNED, 2), 'H': _typecode(_UNSIGNED, 2),
+    'i': _typecode(_SIGNED, 4), 'I': _typecode(_UNSIGNED, 4),
+    'l': _typecode(_SIGNED, 4), 'L': _typecode(_UNSIGNED, 4),
+    'q': _typecode(_SIGNED, 8), 'Q': _typecode(_UNSIGNED, 8),
+    'e': 'f', 'f': 'f', 'd': 'd',
+}
+OFFSET_TYPE = _typecode(_UNSIGNED, 8)
+
+ColumnType = Union[array, tuple[array, bytearray]]
+
+
+def _encode_string(value: str) -> bytes:
+    return value.encode('utf8')
+
+
+class ColumnBatch:
+    """Block of serialized rows as offsets of rows and columns of some cells.
+
+    Fixed size cells are stored in arrays, strings and bytes in one byte
+    buffer with offsets of values, nulls in bitmaps. Rows are ordered by
+    permutation of indexes and copied from serialized block, so they are
+    never decoded to lists.
+    """
+
+    def __init__(self, schema: SchemaType, indexes: list[int]):
+        """Build empty batch.
+
+        :param schema: row schema.
+        :param indexes: stored cells.
+        """
+        self.schema = schema
+        self.indexes = indexes
+        self.offsets = array(OFFSET_TYPE, [0])
+        self.columns: list[ColumnType] = []
+        for index in indexes:
+            if schema[index] in COMPOSITE_TYPES:
+                self.columns.append((array(OFFSET_TYPE, [0]), bytearray()))
+            else:
+                self.columns.append(array(ARRAY_TYPE_BY_STRUCT_MARK[schema[index].schema[0].mark]))
+        self.nulls = [bytearray() for _ in indexes]
+
+        codec = get_codec(schema)
+        self._read_cells = codec.build_cell_reader(indexes) if len(indexes) > 0 else lambda block, offset: []
+        self._unpack_length, self._row_length_size = codec.row_length.unpack_from, codec.row_length.size
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def extend(self, block: Buffer, start: int, end: int) -> None:
+        """Add rows of part of block, parts of block must be added one after another.
+
+        Offsets of rows are relative to start of the first part.
+
+        :param block: serialized rows.
+        :param start: first byte.
+        :param end: index after last byte, part must have whole rows.
+        :return:
+        """
+        offsets, nulls = self.offsets, self.nulls
+        appends, converters, defaults = [], [], []
+        for index, column in zip(self.indexes, self.columns):
+            if isinstance(column, tuple):
+                appends.append(lambda value, column_offsets=column[0], data=column[1]: (
+                    data.extend(value), column_offsets.append(len(data))
+                ))
+                defaults.append(b'')
+            else:
+                appends.append(column.append)
+                defaults.append(0)
+            converters.append(
+                _encode_string if self.schema[index] == CellType.STRING else
+                ord if self.schema[index] == CellType.CHAR else None
+            )
+        read_cells, unpack_length, row_length_size = self._read_cells, self._unpack_length, self._row_length_size
+        base = offsets[-1] - start
+
+        index = start
+        while index < end:
+            row_size = unpack_length(block, index)[0]
+            if not row_length_size <= row_size <= end - index:
+                raise ValueError(f'Bad row format: block ends with incomplete row of {end - index} bytes.')
+
+            row = len(offsets) - 1
+            for position, value in enumerate(read_cells(block, index + row_length_size)):
+                if value is None:
+                    bitmap = nulls[position]
+                    if len(bitmap) <= row >> 3:
+                        bitmap.extend(bytes((row >> 3) - len(bitmap) + 1))
+                    bitmap[row >> 3] |= 1 << (row & 7)
+                    value = defaults[position]
+                elif converters[position] is not None:
+                    value = converters[position](value)
+                appends[position](value)
+
+            index += row_size
+            offsets.append(base + index)
+
+    def has_nulls(self, position: int) -> bool:
+        return len(self.nulls[position]) > 0
+
+    def is_null(self, position: int) -> Callable[[int], bool]:
+        """Build check of null of column.
+
+        :param position: position of column in stored cells.
+        :return: function of row index.
+        """
+        bitmap = self.nulls[position]
+        return lambda row: row >> 3 < len(bitmap) and bitmap[row >> 3] >> (row & 7) & 1 == 1
+
+    def values(self, position: int) -> Callable[[int], Any]:
+        """Build getter of values of column, null is zero or empty bytes, strings are utf8 bytes.
+
+        :param position: position of column in stored cells.
+        :return: function of row index.
+        """
+        column = self.columns[position]
+        if isinstance(column, array):
+            return column.__getitem__
+        offsets, data = column
+        return lambda row: data[offsets[row]:offsets[row + 1]]
+
+    def sort_order(self, sort_keys: list[SortKey]) -> list[int]:
+        """Stable order of rows by sort keys.
+
+        Rows are sorted by one column at a time from the last sort key,
+        utf8 bytes of strings have the same order as strings.
+
+        :param sort_keys: sort columns, they must be stored cells.
+        :return: indexes of rows.
+        """
+        order = list(range(len(self)))
+        for sort_key in reversed(sort_keys):
+            position = self.indexes.index(sort_key.index)
+            order.sort(key=self.values(position), reverse=not sort_key.is_ascending_order)
+
+            if self.has_nulls(position):
+                if sort_key.is_nulls_first is None:
+                    raise TypeError(f'Sort column {sort_key.index} has nulls, place of nulls is not given by sort key')
+                is_null = self.is_null(position)
+                order.sort(key=(lambda row: not is_null(row)) if sort_key.is_nulls_first else is_null)
+        return order
+
+    def iter_blocks(self, block: Buffer, start: int, order: list[int], batch_rows: int) -> Iterator[bytes]:
+        """Copy rows in order to blocks of serialized rows.
+
+        :param block: serialized rows which were added to batch.
+        :param start: start of the first added part of block.
+        :param order: indexes of rows.
+        :param batch_rows: number of rows in block.
+        :return:
+        """
+        offsets = self.offsets
+        for i in range(0, len(order), batch_rows):
+            yield b''.join([block[start + offsets[x]:start + offsets[x + 1]] for x in order[i:i + batch_rows]])
@@ -0,0 +1,259 @@
+import bz2
+import lzma
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional, Union
+from collections.abc import Iterator
+from collections import namedtuple
+
+from .background import BackgroundWriter
+from .serialize import LENGTH_ROW_TYPE, Buffer
+
+
+Compression = namedtuple('Compression', 'name compress decompress')
+CompressionType = Union[str, Compression]
+
+COMPRESSIONS = {
+    'zlib': Compression('zlib', partial(zlib.compress, level=1), zlib.decompress),
+    'lzma': Compression('lzma', partial(lzma.compress, preset=0), lzma.decompress),
+    'bz2': Compression('bz2', bz2.compress, bz2.decompress),
+}
+
+# zero row length is impossible in raw file, so it marks compressed file
+_MAGIC = bytes(LENGTH_ROW_TYPE.schema[0].size)
+_NAME_LENGTH = struct.Struct('=B')
+_FRAME_HEADER = struct.Struct('=II')
+# statistics are shared by background threads of merge
+_STATS_LOCK = threading.Lock()
+
+
+@dataclass
+class CompressionStats:
+    """Bytes and time of compression of temporary runs."""
+    raw_written: int = 0
+    compressed_written: int = 0
+    raw_read: int = 0
+    compressed_read: int = 0
+    compress_seconds: float = 0.0
+    decompress_seconds: float = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """Ratio of raw size to compressed size of written runs.
+
+        :return:
+        """
+        return self.raw_written / self.compressed_written if self.compressed_written > 0 else 1.0
+
+    @property
+    def saved_bytes(self) -> int:
+        """Bytes of disk I/O saved by compression.
+
+        :return:
+        """
+        return self.raw_written - self.compressed_written + self.raw_read - self.compressed_read
+
+    @property
+    def cpu_seconds(self) -> float:
+        """Time spent by compression and decompression.
+
+        :return:
+        """
+        return self.compress_seconds + self.decompress_seconds
+
+    def add(self, other: 'CompressionStats') -> None:
+        """Add statistics of other object, for example of worker process.
+
+        :param other: statistics.
+        :return:
+        """
+        self.raw_written += other.raw_written
+        self.compressed_written += other.compressed_written
+        self.raw_read += other.raw_read
+        self.compressed_read += other.compressed_read
+        self.compress_seconds += other.compress_seconds
+        self.decompress_seconds += other.decompress_seconds
+
+    def add_locked(self, other: 'CompressionStats') -> None:
+        """Add statistics of other object from one of background threads.
+
+        :param other: statistics.
+        :return:
+        """
+        with _STATS_LOCK:
+            self.add(other)
+
+
+def get_compression(compression: Optional[CompressionType]) -> Optional[Compression]:
+    """Get compression by name, pluggable compression is returned as is.
+
+    :param compression: name of stdlib compression, compression object or None.
+    :return:
+    """
+    if isinstance(compression, str):
+        assert compression in COMPRESSIONS, f'Unknown compression "{compression}"'
+        return COMPRESSIONS[compression]
+    return compression
+
+
+class RunWriter:
+    """Writer of run file.
+
+    Blocks of whole rows are written as is without compression, otherwise
+    they are collected into frames of about frame size and every frame is
+    compressed independently after header with name of compression.
+    """
+
+    def __init__(
+        self, file_name: str, compression: Optional[Compression], stats: CompressionStats, frame_size: int,
+        background: bool = False
+    ):
+        """Open file.
+
+        :param file_name: file name.
+        :param compression: compression or None for raw file.
+        :param stats: statistics of compression.
+        :param frame_size: size of raw frame.
+        :param background: compress and write frames in background thread.
+        """
+        self.compression = compression
+        self.stats = stats
+        self.frame_size = frame_size
+        self.file = open(file_name, 'wb')
+        self.blocks, self.size = [], 0
+        self.writer = BackgroundWriter(self._write_frame) if background else None
+
+        if compression is not None:
+            name = compression.name.encode('utf8')
+            self.file.write(_MAGIC + _NAME_LENGTH.pack(len(name)) + name)
+
+    def _write_frame(self, frame: Buffer) -> None:
+        """Compress and write frame, raw frame is written as is.
+
+        :param frame: bytes.
+        :return:
+        """
+        if self.compression is None:
+            self.file.write(frame)
+            return
+
+        start = time.perf_counter()
+        data = self.compression.compress(frame)
+        self.stats.add_locked(CompressionStats(
+            raw_written=len(frame), compressed_written=_FRAME_HEADER.size + len(data),
+            compress_seconds=time.perf_counter() - start
+        ))
+        self.file.write(_FRAME_HEADER.pack(len(data), len(frame)))
+        self.file.write(data)
+
+    def write(self, block: Buffer) -> None:
+        """Write block of whole rows.
+
+        :param block: bytes.
+        :return:
+        """
+        if self.compression is None:
+            if self.writer is None:
+                self.file.write(block)
+            else:
+                self.writer.write(bytes(block))
+            return
+
+        if self.size + len(block) > self.frame_size:
+            self.flush()
+        self.blocks.append(block)
+        self.size += len(block)
+
+    def flush(self) -> None:
+        """Compress and write collected blocks as frame.
+
+        :return:
+        """
+        if self.size == 0:
+            return
+
+        frame = b''.join(self.blocks)
+        self.blocks, self.size = [], 0
+        if self.writer is None:
+            self._write_frame(frame)
+        else:
+            self.writer.write(frame)
+
+    def close(self) -> None:
+        """Write last frame and close file.
+
+        :return:
+        """
+        try:
+            self.flush()
+        finally:
+            try:
+                if self.writer is not None:
+                    self.writer.close()
+            finally:
+                self.file.close()
+
+    def __enter__(self) -> 'RunWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def read_compression(file_name: str, compression: Optional[CompressionType] = None) -> Optional[Compression]:
+    """Detect compression of run file by header.
+
+    :param file_name: file name.
+    :param compression: pluggable compression which can be named in header.
+    :return: None for raw file.
+    """
+    with open(file_name, 'rb') as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            return None
+        name_length = _NAME_LENGTH.unpack(file.read(_NAME_LENGTH.size))[0]
+        name = file.read(name_length).decode('utf8')
+
+    compression = get_compression(compression)
+    if compression is not None and compression.name == name:
+        return compression
+    if name not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression "{name}" of file {file_name}.')
+    return COMPRESSIONS[name]
+
+
+def iter_frames(file_name: str, compression: Compression, stats: CompressionStats) -> Iterator[bytes]:
+    """Read and decompress frames of compressed run file.
+
+    :param file_name: file name.
+    :param compression: compression of file.
+    :param stats: statistics of compression.
+    :return: raw frames with whole rows.
+    """
+    with open(file_name, 'rb') as file:
+        file.seek(len(_MAGIC))
+        file.seek(_NAME_LENGTH.unpack(file.read(_NAME_LENGTH.size))[0], 1)
+
+        while True:
+            header = file.read(_FRAME_HEADER.size)
+            if len(header) == 0:
+                break
+            if len(header) < _FRAME_HEADER.size:
+                raise ValueError(f'Bad frame format: file {file_name} ends with incomplete frame header.')
+            data_size, frame_size = _FRAME_HEADER.unpack(header)
+            data = file.read(data_size)
+
+            start = time.perf_counter()
+            frame = compression.decompress(data)
+            decompress_seconds = time.perf_counter() - start
+            if len(data) != data_size or len(frame) != frame_size:
+                raise ValueError(f'Bad frame format: frame of file {file_name} has wrong size.')
+            stats.add_locked(CompressionStats(
+                raw_read=frame_size, compressed_read=_FRAME_HEADER.size + data_size,
+                decompress_seconds=decompress_seconds
+            ))
+
+            yield frame
@@ -0,0 +1,502 @@
+import struct
+from typing import Any, BinaryIO, Optional, Union
+from collections.abc import Iterator
+from collections import namedtuple
+
+from .keys import SortKey, as_sort_keys, build_key_encoder, build_prefix_key_encoder
+from .memory import WRITE_BATCH_ROWS
+from .serialize import (
+    BaseCellType, CellType, SchemaType, Buffer, FIXED_RUN, CHAR_CELL, get_codec, serialize, deserialize, mapped_file,
+    split_schema,
+)
+from .serialize import iter_rows as iter_v1_rows
+
+
+FORMAT_V1 = 1
+FORMAT_V2 = 2
+# rows of v1 file start with row length, zero row length is not valid, so v1 file never starts with magic,
+# compressed runs start with zero row length too, so merge of runs converts v2 files before compression is read
+MAGIC = b'\x00\x00\x00\x00FEMP'
+
+# header: magic, version, schema section and sort key section, every section is v1 rows with varint size
+_SCHEMA_SECTION = [CellType.STRING]
+_SORT_KEY_SECTION = [CellType.UNSIGNED_INT, CellType.BOOL, CellType.BOOL]
+# footer: offset, size, number of rows, min and max normalized keys of every block, then trailer
+_FOOTER_SCHEMA = [CellType.UNSIGNED_LONG_LONG, CellType.UNSIGNED_LONG_LONG, CellType.UNSIGNED_INT,
+                  CellType.BYTES, CellType.BYTES]
+_TRAILER = struct.Struct('=QQ')
+
+_CELL_TYPE_NAMES = {id(value): name for name, value in vars(CellType).items() if isinstance(value, BaseCellType)}
+
+# block of v2 file and statistics of its rows, keys are normalized keys of sort keys of file
+BlockStats = namedtuple('BlockStats', 'offset size rows min_key max_key')
+
+_SMALL_VARINTS = [bytes((x,)) for x in range(128)]
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode non-negative integer by 7 bits in every byte, high bit of byte marks next byte.
+
+    :param value: integer.
+    :return:
+    """
+    if value < 128:
+        return _SMALL_VARINTS[value]
+    result = bytearray()
+    while value >= 128:
+        result.append(value & 127 | 128)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def decode_varint(block: Buffer, offset: int) -> tuple[int, int]:
+    """Decode varint.
+
+    :param block: bytes.
+    :param offset: index of the first byte of varint.
+    :return: integer and index of the first byte after varint.
+    """
+    value, shift = 0, 0
+    while True:
+        byte = block[offset]
+        offset += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, offset
+        shift += 7
+
+
+class RowCodecV2:
+    """Encoder and decoder of rows of v2 format for one schema.
+
+    Row is varint length, null bitmap with bit for every cell and values
+    of not null cells. Strings and bytes have varint length. Consecutive
+    fixed size cells are packed by one struct if they are not null.
+    """
+
+    def __init__(self, schema: SchemaType):
+        """Build structs for schema.
+
+        :param schema: row schema by cell types.
+        """
+        self.schema = tuple(schema)
+        self.bitmap_size = (len(schema) + 7) // 8
+
+        self._segments = []
+        for segment in split_schema(self.schema):
+            if segment.kind == FIXED_RUN:
+                marks = [x.schema[0].mark for x in self.schema[segment.start:segment.stop]]
+                segment = segment._replace(
+                    run_structs=(
+                        struct.Struct('=' + ''.join(marks)), (1 << segment.stop) - (1 << segment.start)
+                    ),
+                    cell_structs=tuple(struct.Struct('=' + mark) for mark in marks)
+                )
+            self._segments.append(segment)
+
+    def encode(self, rows: list[list[Any]]) -> bytes:
+        """Serialize rows to bytes.
+
+        :param rows: list of rows.
+        :return:
+        """
+        result = []
+        append = result.append
+        bitmap_size = self.bitmap_size
+
+        for row in rows:
+            nulls = 0
+            parts = [b'']
+            add = parts.append
+            for kind, start, stop, is_string, run_struct, cell_structs in self._segments:
+                if kind == FIXED_RUN:
+                    values = row[start:stop]
+                    if None not in values:
+                        add(run_struct[0].pack(*values))
+                        continue
+                    for index, (value, cell_struct) in enumerate(zip(values, cell_structs), start):
+                        if value is None:
+                            nulls |= 1 << index
+                        else:
+                            add(cell_struct.pack(value))
+                    continue
+
+                value = row[start]
+                if value is None:
+                    nulls |= 1 << start
+                elif kind == CHAR_CELL:
+                    value = value.encode('utf8')
+                    assert len(value) == 1, \
+                        'Type CHAR used only for 1 byte characters.\n' \
+                        f'Now value = {value.decode("utf8")}, length bytes = {len(value)}'
+                    add(value)
+                else:
+                    if is_string:
+                        value = value.encode('utf8')
+                    add(encode_varint(len(value)))
+                    add(value)
+
+            parts[0] = nulls.to_bytes(bitmap_size, 'little')
+            body = b''.join(parts)
+            append(encode_varint(len(body)))
+            append(body)
+
+        return b''.join(result)
+
+    def decode(self, block: Buffer, start: int = 0, end: Optional[int] = None) -> list[list[Any]]:
+        """Deserialize rows of block.
+
+        :param block: bytes.
+        :param start: index of the first byte.
+        :param end: index after the last byte, block must have whole rows, by default length of block.
+        :return:
+        """
+        end = len(block) if end is None else end
+        bitmap_size, segments = self.bitmap_size, self._segments
+
+        rows, offset = [], start
+        while offset < end:
+            row_size = block[offset]
+            if row_size < 128:
+                offset += 1
+            else:
+                row_size, offset = decode_varint(block, offset)
+            row_end = offset + row_size
+            if row_end > end:
+                raise ValueError(f'Bad row format: row from byte {offset} ends after end of block.')
+
+            nulls = int.from_bytes(block[offset:offset + bitmap_size], 'little')
+            offset += bitmap_size
+            row = []
+            append = row.append
+            for kind, index, _, is_string, run_struct, cell_structs in segments:
+                if kind == FIXED_RUN:
+                    if not nulls & run_struct[1]:
+                        row.extend(run_struct[0].unpack_from(block, offset))
+                        offset += run_struct[0].size
+                        continue
+                    for cell_index, cell_struct in enumerate(cell_structs, index):
+                        if nulls >> cell_index & 1:
+                            append(None)
+                        else:
+                            append(cell_struct.unpack_from(block, offset)[0])
+                            offset += cell_struct.size
+                elif nulls >> index & 1:
+                    append(None)
+                elif kind == CHAR_CELL:
+                    append(str(block[offset:offset + 1], 'utf8'))
+                    offset += 1
+                else:
+                    length = block[offset]
+                    if length < 128:
+                        offset += 1
+                    else:
+                        length, offset = decode_varint(block, offset)
+                    value = block[offset:offset + length]
+                    append(str(value, 'utf8') if is_string else bytes(value))
+                    offset += length
+
+            if offset != row_end:
+                raise ValueError(f'Bad row format: row ends at byte {offset}, row length ends at byte {row_end}.')
+            rows.append(row)
+
+        return rows
+
+
+_CODECS: dict[tuple, RowCodecV2] = {}
+
+
+def get_codec_v2(schema: SchemaType) -> RowCodecV2:
+    """Get cached v2 codec for schema.
+
+    :param schema: row schema by cell types.
+    :return:
+    """
+    key = tuple(tuple(cell_type.schema) for cell_type in schema)
+    codec = _CODECS.get(key)
+    if codec is None:
+        codec = _CODECS[key] = RowCodecV2(schema)
+    return codec
+
+
+def detect_format(file_or_path: Union[str, BinaryIO]) -> int:
+    """Detect format of file by magic.
+
+    :param file_or_path: file name or opened binary file, opened file is read from current position.
+    :return: format version.
+    """
+    if isinstance(file_or_path, str):
+        with open(file_or_path, 'rb') as file:
+            head = file.read(len(MAGIC) + 1)
+    else:
+        position = file_or_path.tell()
+        head = file_or_path.read(len(MAGIC) + 1)
+        file_or_path.seek(position)
+    return head[len(MAGIC)] if len(head) > len(MAGIC) and head.startswith(MAGIC) else FORMAT_V1
+
+
+def _encode_section(schema: SchemaType, rows: list[list[Any]]) -> bytes:
+    data = serialize(schema, rows)
+    return encode_varint(len(data)) + data
+
+
+def _decode_section(schema: SchemaType, block: Buffer, offset: int) -> tuple[list[list[Any]], int]:
+    size, offset = decode_varint(block, offset)
+    rows, byte_tail = deserialize(schema, bytes(block[offset:offset + size]))
+    assert len(byte_tail) == 0, 'Error deserialize: bad format of schema section.'
+    return rows, offset + size
+
+
+def encode_schema(schema: SchemaType, sort_keys: list[SortKey]) -> bytes:
+    """Encode schema by names of cell types and sort keys as in header of v2 file.
+
+    :param schema: row schema, it must have builtin cell types.
+    :param sort_keys: sort keys.
+    :return:
+    """
+    assert all(id(x) in _CELL_TYPE_NAMES for x in schema), 'Schema of v2 file must have builtin cell types'
+    return _encode_section(_SCHEMA_SECTION, [[_CELL_TYPE_NAMES[id(x)]] for x in schema]) + _encode_section(
+        _SORT_KEY_SECTION, [[x.index, x.is_ascending_order, x.is_nulls_first] for x in sort_keys]
+    )
+
+
+def decode_schema(block: Buffer, offset: int = 0) -> tuple[SchemaType, list[SortKey], int]:
+    """Decode schema and sort keys encoded by encode_schema.
+
+    :param block: bytes.
+    :param offset: index of the first byte of schema.
+    :return: schema, sort keys and index of the first byte after them.
+    """
+    names, offset = _decode_section(_SCHEMA_SECTION, block, offset)
+    sort_keys, offset = _decode_section(_SORT_KEY_SECTION, block, offset)
+    return [getattr(CellType, x[0]) for x in names], [SortKey(*x) for x in sort_keys], offset
+
+
+class FileWriter:
+    """Writer of v2 file.
+
+    File has header with schema and sort keys, blocks of rows with number
+    of rows and size, and footer with offset, number of rows and min and
+    max normalized keys of every block.
+    """
+
+    def __init__(
+        self, file_name: str, schema: SchemaType, schema_sort_indexes: Optional[list[Union[int, SortKey]]] = None,
+        block_rows: int = WRITE_BATCH_ROWS
+    ):
+        """Open file and write header.
+
+        :param file_name: file name.
+        :param schema: row schema, it must have builtin cell types.
+        :param schema_sort_indexes: sort indexes or sort keys of min and max keys of blocks, no keys by default.
+        :param block_rows: number of rows of block.
+        """
+        assert block_rows >= 1, 'Block must have at least 1 row'
+        self.schema = schema
+        self.sort_keys = as_sort_keys(schema_sort_indexes or [])
+        self.block_rows = block_rows
+        self.codec = get_codec_v2(schema)
+        self.encode_key = build_key_encoder(schema, self.sort_keys) if len(self.sort_keys) > 0 else None
+        self.blocks: list[BlockStats] = []
+        self.rows = 0
+        self._pending: list[list[Any]] = []
+
+        header = MAGIC + bytes((FORMAT_V2,)) + encode_schema(schema, self.sort_keys)
+        self.file = open(file_name, 'wb')
+        self.file.write(header)
+
+    def __enter__(self) -> 'FileWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _write_block(self, rows: list[list[Any]]) -> None:
+        data = self.codec.encode(rows)
+        min_key = max_key = None
+        if self.encode_key is not None:
+            keys = list(map(self.encode_key, rows))
+            min_key, max_key = min(keys), max(keys)
+
+        offset = self.file.tell()
+        head = encode_varint(len(rows)) + encode_varint(len(data))
+        self.file.write(head)
+        self.file.write(data)
+        self.blocks.append(BlockStats(offset, len(head) + len(data), len(rows), min_key, max_key))
+        self.rows += len(rows)
+
+    def write(self, rows: list[list[Any]]) -> None:
+        """Add rows, full blocks are written.
+
+        :param rows: list of rows.
+        :return:
+        """
+        self._pending.extend(rows)
+        if len(self._pending) >= self.block_rows:
+            pending = self._pending
+            for i in range(0, len(pending) - self.block_rows + 1, self.block_rows):
+                self._write_block(pending[i:i + self.block_rows])
+            self._pending = pending[len(pending) - len(pending) % self.block_rows:]
+
+    def close(self) -> None:
+        """Write the last block, footer and trailer.
+
+        :return:
+        """
+        if self.file.closed:
+            return
+        if len(self._pending) > 0:
+            self._write_block(self._pending)
+            self._pending = []
+
+        footer_offset = self.file.tell()
+        self.file.write(serialize(_FOOTER_SCHEMA, [list(x) for x in self.blocks]))
+        self.file.write(_TRAILER.pack(footer_offset, self.rows) + MAGIC)
+        self.file.close()
+
+
+class FileReader:
+    """Reader of v2 file.
+
+    Header and footer are read on open, blocks are decoded from mapped
+    file. Blocks of range scan are chosen by min and max keys of footer,
+    other blocks are not read.
+    """
+
+    def __init__(self, file_name: str):
+        """Read header and footer.
+
+        :param file_name: file name.
+        """
+        self.file_name = file_name
+        with mapped_file(file_name) as mapped:
+            assert mapped is not None and bytes(mapped[1][:len(MAGIC)]) == MAGIC, \
+                f'Error deserialize: file {file_name} is not v2 file.'
+            _, view = mapped
+            self.version = view[len(MAGIC)]
+            assert self.version == FORMAT_V2, f'Unknown format version {self.version} of file {file_name}'
+
+            self.schema, self.sort_keys, self.data_start = decode_schema(view, len(MAGIC) + 1)
+
+            trailer_offset = len(view) - len(MAGIC) - _TRAILER.size
+            assert bytes(view[trailer_offset + _TRAILER.size:]) == MAGIC, \
+                f'Error deserialize: file {file_name} has no footer.'
+            footer_offset, self.rows = _TRAILER.unpack_from(view, trailer_offset)
+            blocks, byte_tail = deserialize(_FOOTER_SCHEMA, bytes(view[footer_offset:trailer_offset]))
+            assert len(byte_tail) == 0, f'Error deserialize: bad format of footer of file {file_name}.'
+            self.blocks = [BlockStats(*x) for x in blocks]
+
+        self.codec = get_codec_v2(self.schema)
+        # key or prefix of key is normalized by sort keys of file
+        self._encode_key = build_prefix_key_encoder(self.schema, self.sort_keys)
+
+    def iter_blocks(self, low: Optional[bytes] = None, high: Optional[bytes] = None) -> Iterator[list[list[Any]]]:
+        """Read rows of blocks which can have normalized keys from low to high.
+
+        :param low: normalized low key, None to read from start.
+        :param high: normalized high key, blocks with bigger min key are skipped, None to read to end.
+        :return: rows of every read block.
+        """
+        with mapped_file(self.file_name) as mapped:
+            if mapped is None:
+                return
+            _, view = mapped
+            for block in self.blocks:
+                if low is not None and block.max_key < low or high is not None and block.min_key >= high:
+                    continue
+                _, offset = decode_varint(view, block.offset)
+                size, offset = decode_varint(view, offset)
+                yield self.codec.decode(view, offset, offset + size)
+
+    def range_scan(self, low: Any = None, high: Any = None) -> Iterator[list[Any]]:
+        """Read rows with low <= key < high, file must have sort keys.
+
+        File does not need to be sorted, blocks without such keys are
+        skipped by footer and rows of other blocks are checked.
+
+        :param low: low key or prefix of key, None for start of file.
+        :param high: high key or prefix of key, rows with this prefix are not read, None for end of file.
+        :return: rows in file order.
+        """
+        assert len(self.sort_keys) > 0, f'File {self.file_name} has no sort keys'
+        low = None if low is None else self._encode_key(low)
+        high = None if high is None else self._encode_key(high)
+        encode_row = build_key_encoder(self.schema, self.sort_keys)
+        for rows in self.iter_blocks(low, high):
+            for row in rows:
+                key = encode_row(row)
+                if (low is None or key >= low) and (high is None or key < high):
+                    yield row
+
+
+def write_file(
+    file_name: str, schema: SchemaType, rows: list[list[Any]],
+    schema_sort_indexes: Optional[list[Union[int, SortKey]]] = None, block_rows: int = WRITE_BATCH_ROWS
+) -> None:
+    """Write rows to v2 file.
+
+    :param file_name: file name.
+    :param schema: row schema.
+    :param rows: list of rows.
+    :param schema_sort_indexes: sort indexes or sort keys of min and max keys of blocks, no keys by default.
+    :param block_rows: number of rows of block.
+    :return:
+    """
+    with FileWriter(file_name, schema, schema_sort_indexes, block_rows) as writer:
+        writer.write(rows)
+
+
+def iter_rows(
+    file_or_path: Union[str, BinaryIO], schema: SchemaType, block_size: int, batches: bool = False
+) -> Iterator[Union[list[Any], list[list[Any]]]]:
+    """Read rows of v1 or v2 file lazily by blocks, format is detected by magic.
+
+    :param file_or_path: file name or opened binary file, opened file is read from current position, it must be v1.
+    :param schema: row schema by cell types, it must be equal to schema of header of v2 file.
+    :param block_size: read size of v1 file, v2 file is read by its blocks.
+    :param batches: yield lists of rows of every block instead of rows.
+    :return:
+    """
+    if not isinstance(file_or_path, str) or detect_format(file_or_path) == FORMAT_V1:
+        yield from iter_v1_rows(file_or_path, schema, block_size, batches)
+        return
+
+    reader = FileReader(file_or_path)
+    assert list(reader.schema) == list(schema), f'Schema of file {file_or_path} is not equal to given schema'
+    for rows in reader.iter_blocks():
+        if batches:
+            if len(rows) > 0:
+                yield rows
+        else:
+            yield from rows
+
+
+def convert_file(
+    file_name: str, schema: SchemaType, result_file_name: str, version: int = FORMAT_V2,
+    schema_sort_indexes: Optional[list[Union[int, SortKey]]] = None, block_size: int = 2 ** 20
+) -> str:
+    """Convert v1 or v2 file to given format by one read of file.
+
+    :param file_name: v1 or v2 file name.
+    :param schema: row schema.
+    :param result_file_name: result file name.
+    :param version: format of result.
+    :param schema_sort_indexes: sort indexes or sort keys of min and max keys of blocks of v2 result.
+    :param block_size: read size of v1 file.
+    :return: result file name.
+    """
+    assert version in (FORMAT_V1, FORMAT_V2), f'Unknown format version {version}'
+    batches = iter_rows(file_name, schema, block_size, batches=True)
+    if version == FORMAT_V2:
+        with FileWriter(result_file_name, schema, schema_sort_indexes) as writer:
+            for rows in batches:
+                writer.write(rows)
+        return result_file_name
+
+    codec = get_codec(schema)
+    with open(result_file_name, 'wb') as result_file:
+        for rows in batches:
+            for i in range(0, len(rows), WRITE_BATCH_ROWS):
+                result_file.write(codec.encode(rows[i:i + WRITE_BATCH_ROWS]))
+    return result_file_name
@@ -0,0 +1,269 @@
+import operator
+import sys
+from os import path, remove
+from dataclasses import dataclass
+from typing import Any, Optional
+from collections.abc import Callable, Iterator
+
+from .keys import build_tuple_key
+from .merge_sort import GENERATOR_ID, WRITE_BATCH_ROWS, iter_batches
+from .formats import iter_rows
+from .serialize import BaseCellType, CellType, SchemaType, StructMark, get_codec
+
+
+COUNT = 'count'
+SUM = 'sum'
+MIN = 'min'
+MAX = 'max'
+FIRST = 'first'
+
+_PARTITION_BITS = 4
+SPILL_PARTITIONS = 1 << _PARTITION_BITS
+MIN_GROUP_READ_SIZE = 2 ** 12
+# every level of partitioning uses own bits of 64-bit hash
+MAX_SPILL_DEPTH = 64 // _PARTITION_BITS - 1
+# size of dict entry and references of group in hash table
+_GROUP_OVERHEAD = 100
+# memory of hash table is number of groups times mean size of every sampled group
+_GROUP_SIZE_SAMPLE = 16
+
+_FLOAT_MARKS = (StructMark.HALF_FLOAT, StructMark.FLOAT, StructMark.DOUBLE)
+
+
+@dataclass
+class Aggregation:
+    """Aggregate function of column.
+
+    Count without column counts rows, other functions skip nulls except
+    first, which returns value of the first row of group in file order.
+    """
+    function: str
+    index: Optional[int] = None
+
+
+def _merge_sum(x: Any, y: Any) -> Any:
+    return y if x is None else x if y is None else x + y
+
+
+def _merge_min(x: Any, y: Any) -> Any:
+    return y if x is None else x if y is None or x <= y else y
+
+
+def _merge_max(x: Any, y: Any) -> Any:
+    return y if x is None else x if y is None or x >= y else y
+
+
+def _merge_first(x: Any, y: Any) -> Any:
+    return x
+
+
+_MERGE_FUNCTIONS = {
+    COUNT: operator.add, SUM: _merge_sum, MIN: _merge_min, MAX: _merge_max, FIRST: _merge_first,
+}
+
+
+def _aggregation_type(schema: SchemaType, aggregation: Aggregation) -> BaseCellType:
+    """Cell type of aggregate.
+
+    :param schema: row schema.
+    :param aggregation: aggregate function.
+    :return:
+    """
+    if aggregation.function == COUNT:
+        return CellType.UNSIGNED_LONG_LONG
+    cell_type = schema[aggregation.index]
+    if aggregation.function == SUM:
+        return CellType.DOUBLE if cell_type.schema[0].mark in _FLOAT_MARKS else CellType.LONG_LONG
+    return cell_type
+
+
+def group_by_schema(schema: SchemaType, key_indexes: list[int], aggregations: list[Aggregation]) -> SchemaType:
+    """Schema of group by result: key columns and aggregates.
+
+    :param schema: row schema.
+    :param key_indexes: key columns.
+    :param aggregations: aggregate functions.
+    :return:
+    """
+    return [schema[x] for x in key_indexes] + [_aggregation_type(schema, x) for x in aggregations]
+
+
+def _build_initial_state(aggregations: list[Aggregation]) -> Callable[[list[Any]], list[Any]]:
+    """Build function which returns aggregates of one row.
+
+    :param aggregations: aggregate functions.
+    :return:
+    """
+    getters = []
+    for aggregation in aggregations:
+        index = aggregation.index
+        if aggregation.function == COUNT:
+            getters.append((lambda row: 1) if index is None else (lambda row, index=index: int(row[index] is not None)))
+        else:
+            getters.append(operator.itemgetter(index))
+    return lambda row: [x(row) for x in getters]
+
+
+@dataclass
+class _GroupByInfo:
+    """All parameters for group by."""
+    partial_schema: SchemaType
+    key_size: int
+    merges: list[Callable[[Any, Any], Any]]
+    tmp_directory: str
+    memory_budget: int
+    read_size: int
+
+
+def _group_size(key: tuple, state: list[Any]) -> int:
+    """Estimate memory of group in hash table.
+
+    :param key: key of group.
+    :param state: aggregates of group.
+    :return:
+    """
+    return (
+        sys.getsizeof(key) + sum(sys.getsizeof(x) for x in key)
+        + sys.getsizeof(state) + sum(sys.getsizeof(x) for x in state) + _GROUP_OVERHEAD
+    )
+
+
+def _spill(table: dict[tuple, list[Any]], info: _GroupByInfo, partition_file_names: list[str], depth: int) -> None:
+    """Append partial aggregates of hash table to partitions by hash of key.
+
+    :param table: hash table of groups.
+    :param info: info object.
+    :param partition_file_names: partition file names.
+    :param depth: level of partitioning, it selects bits of hash of key.
+    :return:
+    """
+    codec = get_codec(info.partial_schema)
+    batches = [[] for _ in partition_file_names]
+    files = [open(x, 'ab') for x in partition_file_names]
+    try:
+        for key, state in table.items():
+            partition = hash(key) >> (depth * _PARTITION_BITS) & (SPILL_PARTITIONS - 1)
+            batches[partition].append(list(key) + state)
+            if len(batches[partition]) == WRITE_BATCH_ROWS:
+                files[partition].write(codec.encode(batches[partition]))
+                batches[partition] = []
+
+        for file, batch in zip(files, batches):
+            if len(batch) > 0:
+                file.write(codec.encode(batch))
+    finally:
+        for file in files:
+            file.close()
+
+
+def _aggregate(
+    rows: Iterator[list[Any]], key: Callable[[list[Any]], tuple], initial_state: Callable[[list[Any]], list[Any]],
+    info: _GroupByInfo, depth: int
+) -> Iterator[list[Any]]:
+    """Aggregate rows by hash table, spill table to partitions if it is bigger than memory budget.
+
+    Memory of hash table is estimated by mean size of sampled groups.
+    Partial aggregates of partition are aggregated by the same way with
+    other bits of hash of key, so every level of partitioning has fewer
+    groups.
+
+    :param rows: rows.
+    :param key: key of row.
+    :param initial_state: aggregates of one row.
+    :param info: info object.
+    :param depth: level of partitioning.
+    :return: rows of partial schema.
+    """
+    assert depth <= MAX_SPILL_DEPTH, 'Groups do not fit into memory budget after max partitioning depth'
+    merges = info.merges
+    table, partition_file_names = {}, []
+    sampled_size, sampled_groups, max_groups = 0, 0, 1
+
+    for row in rows:
+        row_key = key(row)
+        state = table.get(row_key)
+        if state is None:
+            table[row_key] = state = initial_state(row)
+            if len(table) % _GROUP_SIZE_SAMPLE == 1:
+                sampled_size += _group_size(row_key, state)
+                sampled_groups += 1
+                max_groups = max(info.memory_budget * sampled_groups // sampled_size, 1)
+            if len(table) > max_groups:
+                if len(partition_file_names) == 0:
+                    partition_file_names = [
+                        path.join(info.tmp_directory, GENERATOR_ID.next_id()) for _ in range(SPILL_PARTITIONS)
+                    ]
+                _spill(table, info, partition_file_names, depth)
+                table = {}
+            continue
+
+        for i, (merge, value) in enumerate(zip(merges, initial_state(row))):
+            state[i] = merge(state[i], value)
+
+    if len(partition_file_names) == 0:
+        for row_key, state in table.items():
+            yield list(row_key) + state
+        return
+
+    _spill(table, info, partition_file_names, depth)
+    del table
+    partial_key = build_tuple_key(list(range(info.key_size)))
+    partial_state = operator.itemgetter(slice(info.key_size, None))
+    try:
+        for file_name in partition_file_names:
+            yield from _aggregate(
+                iter_rows(file_name, info.partial_schema, info.read_size), partial_key, partial_state, info, depth + 1
+            )
+            remove(file_name)
+    finally:
+        for file_name in partition_file_names:
+            if path.exists(file_name):
+                remove(file_name)
+
+
+def group_by(
+    file_name: str, schema: SchemaType, key_indexes: list[int], aggregations: list[Aggregation],
+    tmp_directory: str, memory_budget: int, result_file_name: Optional[str] = None
+) -> str:
+    """Hash aggregation of file by key.
+
+    Groups are aggregated in hash table while it fits into memory budget,
+    otherwise partial aggregates are spilled to partitions by hash of key
+    and partitions are aggregated one by one. Groups of result are not
+    ordered, result schema is given by group_by_schema.
+
+    :param file_name: original file name.
+    :param schema: row schema.
+    :param key_indexes: key columns.
+    :param aggregations: aggregate functions: count, sum, min, max, first.
+    :param tmp_directory: temporary directory.
+    :param memory_budget: memory for hash table and read buffer in bytes, read buffer is 1/8 of it and at least
+        min group read size.
+    :param result_file_name: result file name, new temporary file by default.
+    :return:
+    """
+    for aggregation in aggregations:
+        assert aggregation.function in _MERGE_FUNCTIONS, f'Unknown aggregate function "{aggregation.function}"'
+        assert aggregation.function == COUNT or aggregation.index is not None, \
+            f'Aggregate function "{aggregation.function}" needs column'
+    if result_file_name is None:
+        result_file_name = path.join(tmp_directory, GENERATOR_ID.next_id())
+
+    read_size = max(memory_budget // 8, MIN_GROUP_READ_SIZE)
+    assert memory_budget > read_size, \
+        f'Memory budget {memory_budget} is too small, it must be more than read buffer of {read_size} bytes'
+    info = _GroupByInfo(
+        group_by_schema(schema, key_indexes, aggregations), len(key_indexes),
+        [_MERGE_FUNCTIONS[x.function] for x in aggregations], tmp_directory, memory_budget - read_size, read_size
+    )
+
+    codec = get_codec(info.partial_schema)
+    rows = _aggregate(
+        iter_rows(file_name, schema, read_size), build_tuple_key(key_indexes), _build_initial_state(aggregations),
+        info, 0
+    )
+    with open(result_file_name, 'wb') as result_file:
+        for batch in iter_batches(rows):
+            result_file.write(codec.encode(batch))
+
+    return result_file_name
@@ -0,0 +1,132 @@
+from bisect import bisect_left
+from dataclasses import replace
+from os import path
+from typing import Any, Optional, Union
+from collections.abc import Callable, Iterator
+
+from .keys import SortKey, as_sort_keys, build_key_encoder, build_prefix_key_encoder
+from .serialize import CellType, SchemaType, Buffer, get_codec, serialize, deserialize, iter_rows
+
+INDEX_SUFFIX = '.idx'
+INDEX_SCHEMA = [CellType.BYTES, CellType.UNSIGNED_LONG_LONG]
+MIN_INDEX_READ_SIZE = 2 ** 12
+
+
+class IndexWriter:
+    """Writer of sparse index of sorted file.
+
+    Index is file with rows of normalized key of first row of every block
+    and byte offset of block, blocks are written by merge one by one.
+    """
+
+    def __init__(self, file_name: str, schema: SchemaType, sort_keys: list[SortKey]):
+        """Build key reader.
+
+        :param file_name: index file name.
+        :param schema: row schema.
+        :param sort_keys: sort columns from high to low power.
+        """
+        self.file_name = file_name
+        codec = get_codec(schema)
+        self.read_cells = codec.build_cell_reader([x.index for x in sort_keys])
+        self.key_offset = codec.row_length.size
+        self.encode = build_key_encoder(
+            [schema[x.index] for x in sort_keys], [replace(x, index=i) for i, x in enumerate(sort_keys)]
+        )
+        self.entries, self.offset = [], 0
+
+    def add(self, block: Buffer) -> None:
+        """Add block of whole rows written after previous block.
+
+        :param block: bytes.
+        :return:
+        """
+        if len(block) > 0:
+            self.entries.append([self.encode(self.read_cells(block, self.key_offset)), self.offset])
+            self.offset += len(block)
+
+    def close(self) -> None:
+        """Write index file.
+
+        :return:
+        """
+        with open(self.file_name, 'wb') as file:
+            file.write(serialize(INDEX_SCHEMA, self.entries))
+
+
+class SparseIndex:
+    """Sparse index of sorted file for search of rows by key.
+
+    Key is value of the first sort column or tuple of values of the first
+    sort columns. Search finds block by binary search on first keys of
+    blocks and reads rows from its offset.
+    """
+
+    def __init__(
+        self, file_name: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]],
+        is_ascending_order: bool = True
+    ):
+        """Load index of sorted file.
+
+        :param file_name: sorted file name, index is read from file with index suffix.
+        :param schema: row schema.
+        :param schema_sort_indexes: sort indexes or sort keys of file from high to low power.
+        :param is_ascending_order: order for sort indexes given without sort key.
+        """
+        self.file_name = file_name
+        self.schema = schema
+        self.sort_keys = as_sort_keys(schema_sort_indexes, is_ascending_order)
+        self.encode_row = build_key_encoder(schema, self.sort_keys)
+        # key or prefix of key is normalized by sort keys of file
+        self._encode_key = build_prefix_key_encoder(self.schema, self.sort_keys)
+
+        with open(file_name + INDEX_SUFFIX, 'rb') as file:
+            entries, byte_tail = deserialize(INDEX_SCHEMA, file.read())
+        assert len(byte_tail) == 0, f'Error deserialize: bad format file {file_name + INDEX_SUFFIX}.'
+        self.keys = [x[0] for x in entries]
+        self.offsets = [x[1] for x in entries]
+        self.read_size = max(path.getsize(file_name) // max(len(entries), 1), MIN_INDEX_READ_SIZE)
+
+    def _scan(self, low: Optional[bytes], is_end: Callable[[bytes], bool]) -> Iterator[list[Any]]:
+        """Read rows with normalized key not less than low until end key.
+
+        Rows equal to the first key of block can be at the end of previous
+        block, so search starts from the last block with smaller first key.
+
+        :param low: normalized low key, None to read from start.
+        :param is_end: check of normalized key of the first row after result.
+        :return:
+        """
+        block_index = 0 if low is None else max(bisect_left(self.keys, low) - 1, 0)
+        if block_index >= len(self.offsets):
+            return
+
+        with open(self.file_name, 'rb') as file:
+            file.seek(self.offsets[block_index])
+            for row in iter_rows(file, self.schema, self.read_size):
+                key = self.encode_row(row)
+                if low is not None and key < low:
+                    continue
+                if is_end(key):
+                    return
+                yield row
+
+    def lookup(self, key: Any) -> list[list[Any]]:
+        """Find rows by key or prefix of key.
+
+        :param key: value or tuple of values of the first sort columns.
+        :return: rows in file order.
+        """
+        key = self._encode_key(key)
+        return list(self._scan(key, lambda x: not x.startswith(key)))
+
+    def range_scan(self, low: Any = None, high: Any = None) -> Iterator[list[Any]]:
+        """Read rows with low <= key < high in order of sort keys.
+
+        :param low: low key or prefix of key, None for start of file.
+        :param high: high key or prefix of key, rows with this prefix are not read, None for end of file.
+        :return:
+        """
+        low = None if low is None else self._encode_key(low)
+        high = None if high is None else self._encode_key(high)
+        return self._scan(low, lambda x: high is not None and x >= high)
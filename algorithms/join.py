@@ -0,0 +1,175 @@
+from os import path, remove
+from contextlib import contextmanager
+from itertools import groupby, islice
+from typing import Any, Optional
+from collections.abc import Callable, Iterator
+
+from .keys import SortKey, build_tuple_key
+from .merge_sort import GENERATOR_ID, WRITE_BATCH_ROWS, iter_sorted, iter_batches
+from .formats import iter_rows
+from .serialize import SchemaType, get_codec
+
+
+INNER_JOIN = 'inner'
+LEFT_JOIN = 'left'
+RIGHT_JOIN = 'right'
+OUTER_JOIN = 'outer'
+JOIN_TYPES = (INNER_JOIN, LEFT_JOIN, RIGHT_JOIN, OUTER_JOIN)
+
+
+def _iter_input_rows(
+    file_name: str, schema: SchemaType, key_indexes: list[int], tmp_directory: str, block_size: int,
+    is_sorted: bool, fan_in: int, workers: int
+) -> Iterator[list[Any]]:
+    """Read rows of input in ascending order of join columns with nulls first.
+
+    :param file_name: input file name.
+    :param schema: row schema.
+    :param key_indexes: join columns.
+    :param tmp_directory: temporary directory.
+    :param block_size: block size.
+    :param is_sorted: input is already sorted by join columns.
+    :param fan_in: max number of runs merged at once.
+    :param workers: number of processes.
+    :return:
+    """
+    if is_sorted:
+        return iter_rows(file_name, schema, block_size)
+    return iter_sorted(
+        file_name, schema, [SortKey(x, True, True) for x in key_indexes], tmp_directory, block_size,
+        fan_in=fan_in, workers=workers
+    )
+
+
+@contextmanager
+def _buffer_group(
+    rows: Iterator[list[Any]], schema: SchemaType, tmp_directory: str, block_size: int
+) -> Iterator[Callable[[], Iterator[list[list[Any]]]]]:
+    """Keep group of rows with equal keys for repeated reads.
+
+    Small group is kept in memory, big group is written to temporary file.
+
+    :param rows: rows of group.
+    :param schema: row schema.
+    :param tmp_directory: temporary directory.
+    :param block_size: read size of temporary file.
+    :return: function which reads group by blocks of rows.
+    """
+    head = list(islice(rows, WRITE_BATCH_ROWS + 1))
+    if len(head) <= WRITE_BATCH_ROWS:
+        yield lambda: iter([head])
+        return
+
+    codec = get_codec(schema)
+    file_name = path.join(tmp_directory, GENERATOR_ID.next_id())
+    try:
+        with open(file_name, 'wb') as file:
+            file.write(codec.encode(head))
+            del head
+            for batch in iter_batches(rows):
+                file.write(codec.encode(batch))
+
+        yield lambda: iter_rows(file_name, schema, block_size, batches=True)
+    finally:
+        remove(file_name)
+
+
+def _iter_joined_rows(
+    left_rows: Iterator[list[Any]], left_schema: SchemaType, left_keys: list[int],
+    right_rows: Iterator[list[Any]], right_schema: SchemaType, right_keys: list[int],
+    how: str, tmp_directory: str, block_size: int
+) -> Iterator[list[Any]]:
+    """Join rows sorted by join columns in ascending order with nulls first.
+
+    Groups of rows with equal keys are read in parallel. Left group is
+    streamed by batches, right group is kept for every batch. Rows with
+    nulls in join columns do not match any row.
+
+    :param left_rows: sorted left rows.
+    :param left_schema: schema of left rows.
+    :param left_keys: join columns of left rows.
+    :param right_rows: sorted right rows.
+    :param right_schema: schema of right rows.
+    :param right_keys: join columns of right rows.
+    :param how: join type.
+    :param tmp_directory: temporary directory.
+    :param block_size: read size of big group.
+    :return: left row cells and right row cells, cells of missing row are nulls.
+    """
+    left_nulls, right_nulls = [None] * len(left_schema), [None] * len(right_schema)
+    is_left_kept, is_right_kept = how in (LEFT_JOIN, OUTER_JOIN), how in (RIGHT_JOIN, OUTER_JOIN)
+
+    left_groups = groupby(left_rows, build_tuple_key(left_keys))
+    right_groups = groupby(right_rows, build_tuple_key(right_keys))
+    left, right = next(left_groups, None), next(right_groups, None)
+    while left is not None or right is not None:
+        if right is None or (left is not None and (None in left[0] or None not in right[0] and left[0] < right[0])):
+            if is_left_kept:
+                for row in left[1]:
+                    yield row + right_nulls
+            left = next(left_groups, None)
+        elif left is None or None in right[0] or right[0] < left[0]:
+            if is_right_kept:
+                for row in right[1]:
+                    yield left_nulls + row
+            right = next(right_groups, None)
+        else:
+            with _buffer_group(right[1], right_schema, tmp_directory, block_size) as read_right_group:
+                for left_batch in iter_batches(left[1]):
+                    for right_batch in read_right_group():
+                        for left_row in left_batch:
+                            for right_row in right_batch:
+                                yield left_row + right_row
+            left, right = next(left_groups, None), next(right_groups, None)
+
+
+def merge_join(
+    left_file_name: str, left_schema: SchemaType, left_keys: list[int],
+    right_file_name: str, right_schema: SchemaType, right_keys: list[int],
+    tmp_directory: str, block_size: int, how: str = INNER_JOIN, result_file_name: Optional[str] = None,
+    is_left_sorted: bool = False, is_right_sorted: bool = False, fan_in: int = 64, workers: int = 1
+) -> str:
+    """Sort-merge join of two files by key.
+
+    Inputs are sorted by join columns with lazy last merge and joined
+    rows are written while both inputs are read. Result schema is left
+    schema and right schema, rows are ordered by join columns.
+
+    :param left_file_name: left file name.
+    :param left_schema: schema of left file.
+    :param left_keys: join columns of left file.
+    :param right_file_name: right file name.
+    :param right_schema: schema of right file.
+    :param right_keys: join columns of right file, types are compared with left columns by python values.
+    :param tmp_directory: temporary directory.
+    :param block_size: block size, it is shared by inputs.
+    :param how: join type: inner, left, right or outer.
+    :param result_file_name: result file name, new temporary file by default.
+    :param is_left_sorted: left file is sorted by join columns in ascending order with nulls first, it is not sorted.
+    :param is_right_sorted: right file is sorted by join columns in ascending order with nulls first, it is not sorted.
+    :param fan_in: max number of runs merged at once.
+    :param workers: number of processes, every process uses own block size of memory.
+    :return:
+    """
+    assert how in JOIN_TYPES, f'Unknown join type "{how}"'
+    assert len(left_keys) == len(right_keys) > 0, 'Left and right files must have the same number of join columns'
+    if result_file_name is None:
+        result_file_name = path.join(tmp_directory, GENERATOR_ID.next_id())
+
+    input_block_size = block_size // 2
+    left_rows = _iter_input_rows(
+        left_file_name, left_schema, left_keys, tmp_directory, input_block_size, is_left_sorted, fan_in, workers
+    )
+    right_rows = _iter_input_rows(
+        right_file_name, right_schema, right_keys, tmp_directory, input_block_size, is_right_sorted, fan_in, workers
+    )
+
+    codec = get_codec(list(left_schema) + list(right_schema))
+    rows = _iter_joined_rows(
+        left_rows, left_schema, left_keys, right_rows, right_schema, right_keys, how, tmp_directory, input_block_size
+    )
+    with open(result_file_name, 'wb') as result_file:
+        for batch in iter_batches(rows):
+            result_file.write(codec.encode(batch))
+
+    return result_file_name
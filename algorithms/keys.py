@@ -0,0 +1,175 @@
+from dataclasses import dataclass, replace
+import struct
+from operator import itemgetter
+from typing import Any, Optional, Union
+from collections.abc import Callable
+
+from .serialize import BaseCellType, CellType, StructMark, SchemaType, COMPOSITE_TYPES
+
+
+@dataclass
+class SortKey:
+    """Sort column with own order.
+
+    Column with nulls needs place of nulls: first or last, by default
+    column must not have nulls.
+    """
+    index: int
+    is_ascending_order: bool = True
+    is_nulls_first: Optional[bool] = None
+
+
+def as_sort_keys(schema_sort_indexes: list[Union[int, SortKey]], is_ascending_order: bool = True) -> list[SortKey]:
+    """Build sort keys for sort indexes.
+
+    :param schema_sort_indexes: sort indexes or sort keys from high to low power.
+    :param is_ascending_order: order for sort indexes given without sort key.
+    :return:
+    """
+    return [x if isinstance(x, SortKey) else SortKey(x, is_ascending_order) for x in schema_sort_indexes]
+
+
+_NULL_FIRST, _NOT_NULL, _NULL_LAST = b'\x00', b'\x01', b'\x02'
+_INVERT = bytes(255 - x for x in range(256))
+
+_SIGNED_MARKS = (
+    StructMark.SIGNED_CHAR, StructMark.SHORT, StructMark.INT, StructMark.LONG, StructMark.LONG_LONG,
+)
+_UNSIGNED_MARKS = (
+    StructMark.UNSIGNED_CHAR, StructMark.UNSIGNED_SHORT, StructMark.UNSIGNED_INT,
+    StructMark.UNSIGNED_LONG, StructMark.UNSIGNED_LONG_LONG, StructMark.BOOL,
+)
+_FLOAT_MARKS = (StructMark.HALF_FLOAT, StructMark.FLOAT, StructMark.DOUBLE)
+_UNSIGNED_MARK_BY_SIZE = {
+    1: StructMark.UNSIGNED_CHAR, 2: StructMark.UNSIGNED_SHORT,
+    4: StructMark.UNSIGNED_INT, 8: StructMark.UNSIGNED_LONG_LONG,
+}
+
+
+def _build_cell_encoder(cell_type: BaseCellType, sort_key: SortKey) -> Callable[[Any], bytes]:
+    """Build encoder of cell to bytes with order of sort key.
+
+    :param cell_type: cell type.
+    :param sort_key: sort key.
+    :return:
+    """
+    null = _NULL_LAST if sort_key.is_nulls_first is False else _NULL_FIRST
+    is_ascending_order = sort_key.is_ascending_order
+
+    if cell_type in COMPOSITE_TYPES or cell_type == CellType.CHAR:
+        is_string = cell_type != CellType.BYTES
+
+        def encode_bytes(value: Any) -> bytes:
+            if value is None:
+                return null
+            if is_string:
+                value = value.encode('utf8')
+            value = value.replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+            return _NOT_NULL + (value if is_ascending_order else value.translate(_INVERT))
+
+        return encode_bytes
+
+    mark, size = cell_type.schema[0]
+    pack = struct.Struct('>B' + _UNSIGNED_MARK_BY_SIZE[size]).pack
+    not_null = _NOT_NULL[0]
+    mask = (1 << (size * 8)) - 1
+
+    if mark in _UNSIGNED_MARKS or mark in _SIGNED_MARKS:
+        bias = 1 << (size * 8 - 1) if mark in _SIGNED_MARKS else 0
+        if is_ascending_order:
+            return lambda value: null if value is None else pack(not_null, value + bias)
+        bias -= mask
+        return lambda value: null if value is None else pack(not_null, -(value + bias))
+
+    if mark in _FLOAT_MARKS:
+        float_struct = struct.Struct('>' + mark)
+        unpack = struct.Struct('>' + _UNSIGNED_MARK_BY_SIZE[size]).unpack
+        sign = 1 << (size * 8 - 1)
+        negative_mask, positive_mask = (mask, sign) if is_ascending_order else (0, mask ^ sign)
+
+        def encode_float(value: float) -> bytes:
+            if value is None:
+                return null
+            bits = unpack(float_struct.pack(value + 0.0))[0]
+            return pack(not_null, bits ^ (negative_mask if bits & sign else positive_mask))
+
+        return encode_float
+
+    raise Exception(f'For cell type "{cell_type.name}" normalized key is not implemented.')
+
+
+def build_key_encoder(schema: SchemaType, sort_keys: list[SortKey]) -> Callable[[list[Any]], bytes]:
+    """Build encoder of row sort key to bytes, order of bytes is order of rows.
+
+    Integers are big-endian with flipped sign bit, floats are bits with
+    flipped sign bit or all bits for negative numbers, strings are escaped
+    and terminated by zero bytes. Every cell has null marker, bytes of
+    cells with descending order are inverted.
+
+    :param schema: row schema.
+    :param sort_keys: sort columns from high to low power.
+    :return:
+    """
+    encoders = [(x.index, _build_cell_encoder(schema[x.index], x)) for x in sort_keys]
+
+    if len(encoders) == 1:
+        index, encode = encoders[0]
+        return lambda row: encode(row[index])
+
+    return lambda row: b''.join([encode(row[index]) for index, encode in encoders])
+
+
+def build_sort_key(schema: SchemaType, sort_keys: list[SortKey]) -> Callable[[list[Any]], Any]:
+    """Build key function for composite sort key.
+
+    Columns in ascending order without nulls are compared as python tuple,
+    it is faster than encode of key. Other keys are normalized to bytes.
+
+    :param schema: row schema.
+    :param sort_keys: sort columns from high to low power.
+    :return:
+    """
+    if all(x.is_ascending_order and x.is_nulls_first is None for x in sort_keys):
+        return itemgetter(*[x.index for x in sort_keys])
+
+    return build_key_encoder(schema, sort_keys)
+
+
+def build_prefix_key_encoder(schema: SchemaType, sort_keys: list[SortKey]) -> Callable[[Any], bytes]:
+    """Build encoder of key or prefix of key to bytes of the same order as normalized keys of rows.
+
+    Encoder of every prefix length is built once on first use.
+
+    :param schema: row schema.
+    :param sort_keys: sort columns from high to low power.
+    :return: function of value or tuple of values of the first sort columns.
+    """
+    encoders: dict[int, Callable[[list[Any]], bytes]] = {}
+
+    def encode(key: Any) -> bytes:
+        values = list(key) if isinstance(key, (tuple, list)) else [key]
+        assert 0 < len(values) <= len(sort_keys), f'Key must have from 1 to {len(sort_keys)} values'
+
+        encode_values = encoders.get(len(values))
+        if encode_values is None:
+            prefix = sort_keys[:len(values)]
+            encode_values = encoders[len(values)] = build_key_encoder(
+                [schema[x.index] for x in prefix], [replace(x, index=i) for i, x in enumerate(prefix)]
+            )
+        return encode_values(values)
+
+    return encode
+
+
+def build_tuple_key(indexes: list[int]) -> Callable[[list[Any]], tuple]:
+    """Build key function which returns tuple of columns.
+
+    :param indexes: columns.
+    :return:
+    """
+    if len(indexes) == 0:
+        return lambda row: ()
+    if len(indexes) == 1:
+        index = indexes[0]
+        return lambda row: (row[index],)
+    return itemgetter(*indexes)
@@ -0,0 +1,129 @@
+import math
+import sys
+from dataclasses import dataclass
+from itertools import islice
+from os import path
+from typing import Any
+
+from .keys import SortKey, build_sort_key
+from .serialize import SchemaType, get_codec, iter_rows
+
+
+MIN_READ_BUFFER_SIZE = 2 ** 16
+WRITE_BATCH_ROWS = 4096
+
+SAMPLE_ROWS = 1000
+# sample is read by small windows, so only about sample rows are decoded whatever memory limit is
+_SAMPLE_READ_SIZE = 2 ** 14
+# pointer to row in list of rows and pointer to key in list of keys of sort, lists are over-allocated
+_ROW_REFERENCES_SIZE = 2 * 8 * 1.125
+# encoder keeps length of row and up to two bytes objects for every cell in list before join
+_ENCODED_PART_SIZE = sys.getsizeof(b'') + 8
+# offset of row in column batch, index of row in order and reference to sort key of index
+_COMPACT_ROW_SIZE = 8 + 8 + sys.getsizeof(2 ** 20) + 8
+# tuple of sort key and view of row in merged batch of raw merge
+_RAW_MERGED_ROW_SIZE = sys.getsizeof((None, None)) + sys.getsizeof(memoryview(b''))
+
+
+@dataclass
+class MemoryPlan:
+    """Sizes of external sort for memory limit.
+
+    Decoded block of block size bytes takes about memory per byte times
+    more memory, read buffer of every merged run is block size divided by
+    fan in.
+    """
+    block_size: int
+    fan_in: int
+    read_buffer_size: int
+    memory_per_byte: float
+    runs: int
+    passes: int
+
+
+def _cell_size(value: Any) -> int:
+    # None and bools are shared objects
+    return 0 if value is None or isinstance(value, bool) else sys.getsizeof(value)
+
+
+def measure_rows(
+    rows: list[list[Any]], schema: SchemaType, sort_keys: list[SortKey], compact: bool = False
+) -> tuple[float, float]:
+    """Measure memory of sorted rows by sample of rows.
+
+    :param rows: sample of rows, at most sample rows are measured.
+    :param schema: row schema.
+    :param sort_keys: sort columns.
+    :param compact: rows are kept as serialized bytes with column batch of sort columns instead of decoded rows.
+    :return: memory for one byte of serialized rows with the byte itself and mean size of serialized row.
+    """
+    rows = rows[:SAMPLE_ROWS]
+    if len(rows) == 0:
+        return 1.0, 1.0
+
+    key = build_sort_key(schema, sort_keys)
+    memory = 0
+    for row in rows:
+        if compact:
+            # value in column and its python object, which is key of sort by column
+            memory += _COMPACT_ROW_SIZE + sum(2 * _cell_size(row[x.index]) for x in sort_keys)
+            continue
+
+        memory += sys.getsizeof(row) + sum(_cell_size(x) for x in row) + _ROW_REFERENCES_SIZE
+        row_key = key(row)
+        # key of one column is cell of row
+        if isinstance(row_key, (tuple, bytes)):
+            memory += sys.getsizeof(row_key)
+
+    size = len(get_codec(schema).encode(rows))
+    return memory / size + 1, size / len(rows)
+
+
+def plan_memory(
+    file_name: str, schema: SchemaType, sort_keys: list[SortKey], memory_limit: int, workers: int = 1,
+    replacement_selection: bool = False, compact: bool = False
+) -> MemoryPlan:
+    """Choose block size and fan in of sort for memory limit with the least number of merge passes.
+
+    Memory of every process is one decoded block: block of run or read
+    buffers of merged runs, and batch of written rows with parts of its
+    serialized rows. Fan in is the
+    least one which merges runs in the least number of passes, so read
+    buffers are as big as possible.
+
+    :param file_name: original file name.
+    :param schema: row schema.
+    :param sort_keys: sort columns.
+    :param memory_limit: memory of all processes in bytes.
+    :param workers: number of processes.
+    :param replacement_selection: runs are generated by replacement selection, they are about twice block size.
+    :param compact: runs are sorted without decoded rows and merged by raw merge.
+    :return:
+    """
+    rows = list(islice(iter_rows(file_name, schema, _SAMPLE_READ_SIZE), SAMPLE_ROWS))
+    memory_per_byte, row_size = measure_rows(rows, schema, sort_keys, compact)
+    if compact:
+        batch_memory = WRITE_BATCH_ROWS * (_RAW_MERGED_ROW_SIZE + 2 * row_size)
+    else:
+        encoded_row_memory = (2 * len(schema) + 1) * _ENCODED_PART_SIZE + 2 * row_size
+        batch_memory = WRITE_BATCH_ROWS * (row_size * memory_per_byte + encoded_row_memory)
+
+    block_size = int((memory_limit / workers - batch_memory) / memory_per_byte)
+    assert block_size >= 2 * MIN_READ_BUFFER_SIZE, \
+        f'Memory limit {memory_limit} is too small, it must be at least ' \
+        f'{math.ceil(workers * (2 * MIN_READ_BUFFER_SIZE * memory_per_byte + batch_memory))} bytes'
+
+    max_fan_in = block_size // MIN_READ_BUFFER_SIZE
+    runs = math.ceil(path.getsize(file_name) / (block_size * (2 if replacement_selection else 1)))
+    passes, merged_runs = 0, 1
+    while merged_runs < runs:
+        passes, merged_runs = passes + 1, merged_runs * max_fan_in
+
+    fan_in = max_fan_in
+    if passes > 0:
+        fan_in = max(math.ceil(runs ** (1 / passes)), 2)
+        while fan_in ** passes < runs:
+            fan_in += 1
+        fan_in = min(fan_in, max_fan_in)
+
+    return MemoryPlan(block_size, fan_in, block_size // fan_in, memory_per_byte, runs, passes)
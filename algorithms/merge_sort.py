@@ -1,22 +1,88 @@
+import shutil
 from os import path, remove
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+import heapq
+import mmap
 import struct
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from itertools import chain, groupby, islice, repeat
+from operator import itemgetter
+from typing import Any, Optional, Union
+from collections.abc import Callable, Generator, Iterable, Iterator
+from collections import namedtuple
 
+from .background import iter_prefetched
+from .columns import ColumnBatch
+from .formats import FORMAT_V1, convert_file, detect_format
+from .compression import (
+    Compression, CompressionStats, CompressionType, RunWriter, get_compression, iter_frames, read_compression,
+)
+from .index import INDEX_SUFFIX, IndexWriter
+from .keys import SortKey, as_sort_keys, build_sort_key
+from .memory import MIN_READ_BUFFER_SIZE, WRITE_BATCH_ROWS, measure_rows, plan_memory
+from .stats import (
+    SortEvent, SortStats, COMPARE, DESERIALIZE, READ, SERIALIZE, SORT, WRITE, MERGE_EVENT, RUN_EVENT,
+)
 from .serialize import (
-    CellType, serialize, deserialize, SchemaType,
-    LENGTH_ROW_TYPE,
+    CellType, SchemaType, Buffer, get_codec, iter_chunk_blocks, iter_chunks, iter_mapped_blocks, iter_rows,
+    mapped_file, release_pages, LENGTH_ROW_TYPE,
 )
 
 
+DISTINCT_KEYS = 'keys'
+DISTINCT_ROWS = 'rows'
+
+ASCENDING_RUN = 'ascending'
+DESCENDING_RUN = 'descending'
+UNSORTED_RUN = 'unsorted'
+SCAN_SHORT_RUNS = 1024
+
+FileSegment = namedtuple('FileSegment', 'file_name start end')
+# part of file with rows in ascending order, rows in strictly descending order or rows without order
+NaturalRun = namedtuple('NaturalRun', 'segment order')
+FileType = Union[str, FileSegment]
+CombineType = Callable[[list[Any], list[Any]], list[Any]]
+
+
 @dataclass
 class SortInfo:
     """All parameters for sort."""
     schema: SchemaType
-    schema_sort_index: int
+    sort_keys: list[SortKey]
     tmp_directory: str
     block_size: int
-    is_ascending_order: bool = True
     input_file_name: str = ''
+    fan_in: int = 64
+    replacement_selection: bool = False
+    workers: int = 1
+    raw_merge: bool = True
+    compression: Optional[CompressionType] = None
+    compression_stats: Optional[CompressionStats] = None
+    index_interval: Optional[int] = None
+    limit: Optional[int] = None
+    distinct: Optional[str] = None
+    combine: Optional[CombineType] = None
+    background_io: bool = False
+    sort_stats: Optional[SortStats] = None
+    progress: Optional[Callable[[SortEvent], None]] = None
+    natural_runs: bool = False
+
+    def __post_init__(self):
+        assert self.fan_in >= 2, 'Fan in must be at least 2'
+        assert self.workers >= 1, 'Number of workers must be at least 1'
+        assert self.index_interval is None or self.index_interval >= 1, 'Index interval must be at least 1'
+        assert self.limit is None or self.limit >= 0, 'Limit must be non-negative'
+        assert self.distinct in (None, DISTINCT_KEYS, DISTINCT_ROWS), f'Unknown distinct mode "{self.distinct}"'
+        assert self.combine is None or self.distinct != DISTINCT_ROWS, 'Combine needs one row for every key'
+        assert not self.natural_runs or (
+            not self.replacement_selection and self.distinct is None and self.combine is None
+        ), 'Natural runs are used without replacement selection, distinct and combine'
+        self.compression = get_compression(self.compression)
+        if self.compression_stats is None:
+            self.compression_stats = CompressionStats()
+        if self.sort_stats is None:
+            self.sort_stats = SortStats()
 
 
 class GeneratorID:
@@ -47,188 +113,1204 @@ class GeneratorID:
 GENERATOR_ID = GeneratorID()
 
 
-def split_file(file_name: str, info: SortInfo) -> tuple[str, str]:
-    """Split file by two files.
+def _as_segment(file: FileType) -> FileSegment:
+    return file if isinstance(file, FileSegment) else FileSegment(file, 0, path.getsize(file))
 
-    :param file_name: original file name.
+
+def _is_temp(file: FileType, info: SortInfo) -> bool:
+    return not isinstance(file, FileSegment) and info.input_file_name != file
+
+
+def _remove_run(file: FileType, info: SortInfo) -> None:
+    """Remove temporary run, segments and input file are kept.
+
+    :param file: file name or segment.
     :param info: info object.
     :return:
     """
-    file_size = path.getsize(file_name)
+    if _is_temp(file, info):
+        remove(file)
+
+
+def _measure_inputs(files: list[FileType], info: SortInfo) -> tuple[int, int, int]:
+    """Measure inputs of merge before they are removed.
+
+    :param files: file names or segments.
+    :param info: info object.
+    :return: read bytes, number and size of temporary files.
+    """
+    sizes = [(_as_segment(x).end - _as_segment(x).start, _is_temp(x, info)) for x in files]
+    temp_sizes = [size for size, is_temp in sizes if is_temp]
+    return sum(size for size, _ in sizes), len(temp_sizes), sum(temp_sizes)
+
+
+def _finish_run(
+    file_name: Optional[str], info: SortInfo, kind: str, inputs: tuple[int, int, int] = (0, 0, 0)
+) -> None:
+    """Count finished run or merge in statistics of pass and report progress.
+
+    :param file_name: written file name, None for merge streamed to consumer.
+    :param info: info object.
+    :param kind: run or merge.
+    :param inputs: read bytes, number and size of removed temporary inputs.
+    :return:
+    """
+    stats = info.sort_stats
+    size = 0 if file_name is None else path.getsize(file_name)
+    read_bytes, temp_files, temp_bytes = inputs
+
+    pass_stats = stats.passes[-1]
+    pass_stats.runs += file_name is not None
+    pass_stats.read_bytes += read_bytes
+    pass_stats.written_bytes += size
+    if file_name is not None:
+        stats.add_temp_file(size)
+    stats.remove_temp_files(temp_files, temp_bytes)
+
+    if info.progress is not None:
+        info.progress(SortEvent(kind, len(stats.passes) - 1, file_name, size, stats))
+
+
+def _open_run(file_name: str, info: SortInfo) -> RunWriter:
+    """Open temporary run for write, frame of compressed run is read buffer of merge.
+
+    :param file_name: run file name.
+    :param info: info object.
+    :return:
+    """
+    frame_size = max(info.block_size // info.fan_in, MIN_READ_BUFFER_SIZE)
+    return RunWriter(file_name, info.compression, info.compression_stats, frame_size, info.background_io)
+
+
+def _run_compression(file: FileType, info: SortInfo) -> Optional[Compression]:
+    """Detect compression of run, segments are parts of raw input.
+
+    :param file: file name or segment.
+    :param info: info object.
+    :return:
+    """
+    return None if isinstance(file, FileSegment) else read_compression(file, info.compression)
+
+
+def split_segments(file: FileType, block_size: int) -> list[FileSegment]:
+    """Split file by segments with whole rows and size at most block size.
+
+    Only row length prefixes are read, row bigger than block size has own segment.
 
-    with open(file_name, 'rb') as file:
+    :param file: file name or segment.
+    :param block_size: max segment size.
+    :return:
+    """
+    segment = _as_segment(file)
+    if segment.start == segment.end:
+        return []
+
+    row_length = struct.Struct('=' + LENGTH_ROW_TYPE.schema[0].mark)
+    result = []
+    with open(segment.file_name, 'rb') as file_, \
+            mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        start = index = segment.start
+        while index < segment.end:
+            row_size = row_length.unpack_from(buffer, index)[0]
+            assert row_size >= row_length.size, f'Error deserialize: bad format file {segment.file_name}.'
+            if index + row_size - start > block_size and index > start:
+                result.append(FileSegment(segment.file_name, start, index))
+                start = index
+            index += row_size
+
+        assert index == segment.end, f'Error deserialize: bad format file {segment.file_name}.'
+        result.append(FileSegment(segment.file_name, start, index))
+
+    return result
+
+
+def split_file(file: FileType, info: SortInfo) -> tuple[FileSegment, FileSegment]:
+    """Split file by two segments without copy.
+
+    :param file: original file name or segment.
+    :param info: info object.
+    :return:
+    """
+    segment = _as_segment(file)
+
+    with open(segment.file_name, 'rb') as file_:
         row_length_size = LENGTH_ROW_TYPE.schema[0].size
 
-        index = 0
-        while index < file_size // 2:
-            row_size = struct.unpack('=' + LENGTH_ROW_TYPE.schema[0].mark, file.read(row_length_size))[0]
+        index = segment.start
+        file_.seek(index)
+        while index < segment.start + (segment.end - segment.start) // 2:
+            row_size = struct.unpack('=' + LENGTH_ROW_TYPE.schema[0].mark, file_.read(row_length_size))[0]
             index += row_size
-            file.seek(index)
+            file_.seek(index)
 
-        left_file_end = index
-        right_file_end = file_size
+    return FileSegment(segment.file_name, segment.start, index), FileSegment(segment.file_name, index, segment.end)
 
-        left_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
-        right_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
 
-        with open(left_file_name, 'wb') as left_file, \
-                open(right_file_name, 'wb') as right_file:
-            file.seek(0)
+def _read_segment_rows(segment: FileSegment, info: SortInfo) -> list[list[Any]]:
+    """Read all rows of segment.
 
-            index = 0
-            while index < left_file_end:
-                read_size = min(info.block_size, left_file_end - index)
-                left_file.write(file.read(read_size))
-                index += read_size
-            while index < right_file_end:
-                read_size = min(info.block_size, right_file_end - index)
-                right_file.write(file.read(read_size))
-                index += read_size
+    :param segment: segment with whole rows.
+    :param info: info object.
+    :return:
+    """
+    rows = []
+    for block_rows, _ in iter_mapped_blocks(
+        segment.file_name, info.schema, segment.end - segment.start, segment.start, segment.end
+    ):
+        rows.extend(block_rows)
+    return rows
 
-    if info.input_file_name != file_name:
-        remove(file_name)
 
-    return left_file_name, right_file_name
+def _iter_run_chunks(
+    file: FileType, compression: Optional[Compression], info: SortInfo, chunk_size: int
+) -> Iterator[bytes]:
+    """Read file or segment by chunks of bytes, compressed run is read by decompressed frames.
 
+    :param file: file name or segment.
+    :param compression: compression of run.
+    :param info: info object.
+    :param chunk_size: read size of raw file.
+    :return:
+    """
+    if compression is not None:
+        yield from iter_frames(file, compression, info.compression_stats)
+        return
 
-def merge_files(left_file_name: str, right_file_name: str, info: SortInfo) -> str:
-    """Merge two files into one file.
+    segment = _as_segment(file)
+    with open(segment.file_name, 'rb') as run_file:
+        run_file.seek(segment.start)
+        yield from iter_chunks(run_file, chunk_size, segment.end - segment.start)
+
+
+def _iter_prefetched_chunks(
+    file: FileType, compression: Optional[Compression], info: SortInfo, buffer_size: int
+) -> Iterator[bytes]:
+    """Read chunks of file or segment in background thread, next chunk is read while current one is merged.
+
+    Read buffer is shared by current and prefetched chunks.
+
+    :param file: file name or segment.
+    :param compression: compression of run.
+    :param info: info object.
+    :param buffer_size: read buffer size.
+    :return:
+    """
+    return iter_prefetched(_iter_run_chunks(file, compression, info, max(buffer_size // 2, 1)))
+
+
+def _iter_run_blocks(file: FileType, info: SortInfo, buffer_size: int) -> Iterator[tuple[list[list[Any]], int]]:
+    """Read rows of file or segment by blocks.
+
+    :param file: file name or segment.
+    :param info: info object.
+    :param buffer_size: read buffer size.
+    :return: rows of block and their size in bytes.
+    """
+    compression = _run_compression(file, info)
+    if info.background_io:
+        chunks = info.sort_stats.iter_measured(_iter_prefetched_chunks(file, compression, info, buffer_size), READ)
+        yield from iter_chunk_blocks(chunks, info.schema)
+        return
+
+    if compression is not None:
+        codec = get_codec(info.schema)
+        for frame in info.sort_stats.iter_measured(iter_frames(file, compression, info.compression_stats), READ):
+            rows, end = codec.decode(frame)
+            if end != len(frame):
+                raise ValueError(f'Bad row format: frame of file {file} ends with incomplete row.')
+            yield rows, end
+        return
+
+    segment = _as_segment(file)
+    yield from iter_mapped_blocks(segment.file_name, info.schema, buffer_size, segment.start, segment.end)
+
+
+def _iter_run_rows(file: FileType, info: SortInfo, buffer_size: int) -> Iterator[list[Any]]:
+    """Read rows of file or segment.
+
+    :param file: file name or segment.
+    :param info: info object.
+    :param buffer_size: read buffer size.
+    :return:
+    """
+    for rows, _ in info.sort_stats.iter_measured(_iter_run_blocks(file, info, buffer_size), DESERIALIZE):
+        yield from rows
 
-    :param left_file_name: first file name.
-    :param right_file_name: second file name.
-    :param info: info object.
-    :return:
-    """
-    result_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
-    left_size, right_size = path.getsize(left_file_name), path.getsize(right_file_name)
-    less, greater = info.schema[info.schema_sort_index].less, info.schema[info.schema_sort_index].greater
-    with open(left_file_name, 'rb') as left_file, \
-            open(right_file_name, 'rb') as right_file, \
-            open(result_file_name, 'wb') as result_file:
-        left_rows, left_head = [], b''
-        right_rows, right_head = [], b''
-        left_index, right_index = 0, 0
-        left_row_index, right_row_index = 0, 0
-
-        while left_index < left_size or right_index < right_size:
-            if left_row_index == len(left_rows):
-                left_read_size = min(info.block_size, left_size - left_index)
-                if left_read_size == 0:
-                    break
-                left_block = left_head + left_file.read(left_read_size)
-                left_rows, left_head = deserialize(info.schema, left_block)
-                left_index += left_read_size
-                left_row_index = 0
-            if right_row_index == len(right_rows):
-                right_read_size = min(info.block_size, right_size - right_index)
-                if right_read_size == 0:
-                    break
-                right_block = right_head + right_file.read(right_read_size)
-                right_rows, right_head = deserialize(info.schema, right_block)
-                right_index += right_read_size
-                right_row_index = 0
-
-            result_rows = []
-            while left_row_index < len(left_rows) and right_row_index < len(right_rows):
-                x, y = left_rows[left_row_index], right_rows[right_row_index]
-                x_key, y_key = x[info.schema_sort_index], y[info.schema_sort_index]
-
-                assert x_key is not None and y_key is not None, 'Null does not compare'
-
-                if (less(x_key, y_key) and info.is_ascending_order) or (greater(x_key, y_key) and not info.is_ascending_order):
-                    result_rows.append(x)
-                    left_row_index += 1
-                elif (greater(x_key, y_key) and info.is_ascending_order) or (less(x_key, y_key) and not info.is_ascending_order):
-                    result_rows.append(y)
-                    right_row_index += 1
-                else:
-                    result_rows.append(x)
-                    left_row_index += 1
-
-            result_file.write(serialize(info.schema, result_rows))
-
-        result_rows = []
-        if left_row_index < len(left_rows):
-            result_rows = left_rows[left_row_index:]
-        if right_row_index < len(right_rows):
-            result_rows = right_rows[right_row_index:]
-
-        if len(result_rows) > 0:
-            result_file.write(serialize(info.schema, result_rows))
-
-        while left_index < left_size:
-            left_read_size = min(info.block_size, left_size - left_index)
-            left_block = left_head + left_file.read(left_read_size)
-            result_file.write(left_block)
-            left_index += left_read_size
-            left_head = b''
-        while right_index < right_size:
-            right_read_size = min(info.block_size, right_size - right_index)
-            right_block = right_head + right_file.read(right_read_size)
-            result_file.write(right_block)
-            right_index += right_read_size
-            right_head = b''
-
-    if info.input_file_name not in (left_file_name, right_file_name):
-        remove(left_file_name)
-        remove(right_file_name)
+
+def iter_merged_rows(files: list[FileType], info: SortInfo) -> Iterator[list[Any]]:
+    """Merge sorted files or segments by heap.
+
+    Read buffer of every file is part of block size, rows with equal keys
+    keep order of files. Duplicates are dropped or combined, merge stops
+    after limit rows of info.
+
+    :param files: sorted file names or segments.
+    :param info: info object.
+    :return:
+    """
+    buffer_size = max(info.block_size // max(len(files), 1), MIN_READ_BUFFER_SIZE)
+    runs = [_iter_run_rows(file, info, buffer_size) for file in files]
+    key = build_sort_key(info.schema, info.sort_keys)
+    return islice(_iter_reduced_rows(heapq.merge(*runs, key=key), info, key), info.limit)
+
+
+def iter_batches(rows: Iterator[Any], batch_rows: int = WRITE_BATCH_ROWS) -> Iterator[list[Any]]:
+    """Group rows by batches for write.
+
+    :param rows: rows.
+    :param batch_rows: number of rows in batch.
+    :return:
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_rows:
+            yield batch
+            batch = []
+
+    if len(batch) > 0:
+        yield batch
+
+
+_NO_KEY = object()
+
+
+def _iter_reduced_rows(
+    rows: Iterator[Any], info: SortInfo, key: Callable[[Any], Any], as_value: Callable[[Any], Any] = tuple
+) -> Iterator[Any]:
+    """Drop duplicates or combine rows with equal keys of sorted rows.
+
+    Rows with equal keys are neighbours, so only the current key is kept:
+    the first row of key, or the first rows with distinct values, or the
+    row combined by combine function of info.
+
+    :param rows: sorted rows.
+    :param info: info object.
+    :param key: sort key of row.
+    :param as_value: hashable value of whole row.
+    :return:
+    """
+    if info.distinct is None and info.combine is None:
+        yield from rows
+        return
+
+    last_key = _NO_KEY
+    if info.distinct == DISTINCT_ROWS:
+        values = set()
+        for row in rows:
+            row_key = key(row)
+            if row_key != last_key:
+                last_key, values = row_key, set()
+            value = as_value(row)
+            if value not in values:
+                values.add(value)
+                yield row
+        return
+
+    combine, last_row = info.combine, None
+    for row in rows:
+        row_key = key(row)
+        if row_key != last_key:
+            if last_key is not _NO_KEY:
+                yield last_row
+            last_key, last_row = row_key, row
+        elif combine is not None:
+            last_row = combine(last_row, row)
+
+    if last_key is not _NO_KEY:
+        yield last_row
+
+
+def _build_raw_key(info: SortInfo) -> Callable[[Buffer, int], Any]:
+    """Build function which decodes sort key of row from bytes.
+
+    :param info: info object.
+    :return: function of view and index of row after length prefix.
+    """
+    read_cells = get_codec(info.schema).build_cell_reader([x.index for x in info.sort_keys])
+    key = build_sort_key(
+        [info.schema[x.index] for x in info.sort_keys],
+        [replace(x, index=i) for i, x in enumerate(info.sort_keys)]
+    )
+    return lambda view, index: key(read_cells(view, index))
+
+
+def _iter_view_rows(
+    view: memoryview, segment: FileSegment, raw_key: Callable[[Buffer, int], Any], buffer_size: int,
+    buffer: Optional[mmap.mmap] = None
+) -> Generator[tuple[Any, memoryview], None, int]:
+    """Read rows of view as bytes with decoded sort key until incomplete row.
+
+    :param view: view of mapped file or read bytes.
+    :param segment: segment of view.
+    :param raw_key: sort key of row bytes.
+    :param buffer_size: size of read bytes after which pages are released.
+    :param buffer: mapped file for release of read pages.
+    :return: sort key and row bytes, returns index of the first byte after whole rows.
+    """
+    row_length = LENGTH_ROW_TYPE.schema[0]
+    unpack_length, row_length_size = struct.Struct('=' + row_length.mark).unpack_from, row_length.size
+
+    index = released_index = segment.start
+    while segment.end - index >= row_length_size:
+        row_size = unpack_length(view, index)[0]
+        assert row_size >= row_length_size, f'Error deserialize: bad format file {segment.file_name}.'
+        if row_size > segment.end - index:
+            break
+
+        yield raw_key(view, index + row_length_size), view[index:index + row_size]
+        index += row_size
+
+        if buffer is not None and index - released_index > buffer_size:
+            release_pages(buffer, released_index, index)
+            released_index = index
+
+    return index
+
+
+def _iter_raw_rows(
+    view: memoryview, segment: FileSegment, info: SortInfo, buffer_size: int, buffer: Optional[mmap.mmap] = None
+) -> Iterator[tuple[Any, memoryview]]:
+    """Read rows of view as bytes with decoded sort key.
+
+    :param view: view of mapped file or decompressed frame.
+    :param segment: segment of view with whole rows.
+    :param info: info object.
+    :param buffer_size: size of read bytes after which pages are released.
+    :param buffer: mapped file for release of read pages.
+    :return: sort key and row bytes.
+    """
+    end = yield from _iter_view_rows(view, segment, _build_raw_key(info), buffer_size, buffer)
+    if end != segment.end:
+        raise ValueError(
+            f'Bad row format: file {segment.file_name} ends with incomplete row of {segment.end - end} bytes.'
+        )
+
+
+def _iter_raw_frame_rows(
+    file_name: str, compression: Compression, info: SortInfo, buffer_size: int
+) -> Iterator[tuple[Any, memoryview]]:
+    """Read rows of compressed run as bytes with decoded sort key.
+
+    :param file_name: run file name.
+    :param compression: compression of run.
+    :param info: info object.
+    :param buffer_size: read buffer size.
+    :return: sort key and row bytes.
+    """
+    for frame in info.sort_stats.iter_measured(iter_frames(file_name, compression, info.compression_stats), READ):
+        yield from _iter_raw_rows(memoryview(frame), FileSegment(file_name, 0, len(frame)), info, buffer_size)
+
+
+def _iter_raw_chunk_rows(
+    chunks: Iterable[bytes], file_name: str, info: SortInfo, buffer_size: int
+) -> Iterator[tuple[Any, memoryview]]:
+    """Read rows of chunks as bytes with decoded sort key, incomplete row is continued in next chunk.
+
+    :param chunks: parts of serialized rows.
+    :param file_name: run file name.
+    :param info: info object.
+    :param buffer_size: read buffer size.
+    :return: sort key and row bytes.
+    """
+    raw_key, head = _build_raw_key(info), b''
+    for data in chunks:
+        block = head + data if len(head) > 0 else data
+        end = yield from _iter_view_rows(memoryview(block), FileSegment(file_name, 0, len(block)), raw_key, buffer_size)
+        head = block[end:]
+
+    if len(head) > 0:
+        raise ValueError(f'Bad row format: file {file_name} ends with incomplete row of {len(head)} bytes.')
+
+
+def _iter_raw_merged_blocks(files: list[FileType], info: SortInfo, batch_rows: int) -> Iterator[bytes]:
+    """Merge sorted files or segments by keys and copy bytes of rows.
+
+    :param files: sorted file names or segments.
+    :param info: info object.
+    :param batch_rows: number of rows in block.
+    :return: blocks of merged rows.
+    """
+    buffer_size = max(info.block_size // max(len(files), 1), MIN_READ_BUFFER_SIZE)
+    with ExitStack() as stack:
+        runs = []
+        for file in files:
+            compression = _run_compression(file, info)
+            if info.background_io:
+                chunks = _iter_prefetched_chunks(file, compression, info, buffer_size)
+                chunks = info.sort_stats.iter_measured(chunks, READ)
+                runs.append(_iter_raw_chunk_rows(chunks, _as_segment(file).file_name, info, buffer_size))
+                continue
+            if compression is not None:
+                runs.append(_iter_raw_frame_rows(file, compression, info, buffer_size))
+                continue
+
+            segment = _as_segment(file)
+            mapped = stack.enter_context(mapped_file(segment.file_name))
+            if mapped is not None:
+                buffer, view = mapped
+                runs.append(_iter_raw_rows(view, segment, info, buffer_size, buffer))
+
+        rows = _iter_reduced_rows(heapq.merge(*runs, key=itemgetter(0)), info, itemgetter(0), lambda x: bytes(x[1]))
+        rows = islice(rows, info.limit)
+        for batch in iter_batches(rows, batch_rows):
+            with info.sort_stats.measure(SERIALIZE):
+                block = b''.join([row for _, row in batch])
+            # slices of views must be released before maps are closed
+            del batch
+            yield block
+
+
+def _encode(codec: Any, rows: list[list[Any]], info: SortInfo) -> bytes:
+    with info.sort_stats.measure(SERIALIZE):
+        return codec.encode(rows)
+
+
+def _write_blocks(run_file: RunWriter, blocks: Iterator[bytes], info: SortInfo) -> None:
+    """Write blocks to run, time of getting of blocks is serialize.
+
+    :param run_file: run writer.
+    :param blocks: lazy serialized blocks.
+    :param info: info object.
+    :return:
+    """
+    for block in info.sort_stats.iter_measured(blocks, SERIALIZE):
+        with info.sort_stats.measure(WRITE):
+            run_file.write(block)
+
+
+def merge_runs(
+    files: list[FileType], info: SortInfo, result_file_name: Optional[str] = None,
+    index_interval: Optional[int] = None
+) -> str:
+    """Merge sorted files or segments into one file by heap.
+
+    In raw merge mode only sort columns are decoded and bytes of rows are
+    copied to result, rows are decoded for combine function. Result is
+    compressed if info has compression. Files of v2 format are converted
+    to temporary v1 runs first.
+    Merged temporary files are removed.
+
+    :param files: sorted file names or segments.
+    :param info: info object.
+    :param result_file_name: result file name, new temporary file by default.
+    :param index_interval: write sparse index of raw result with entry for every index interval rows.
+    :return:
+    """
+    if result_file_name is None:
+        result_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
+    codec = get_codec(info.schema)
+    files = [_v1_run(x, info) for x in files]
+
+    index = None
+    if index_interval is not None:
+        assert info.compression is None, 'Sparse index is written only for raw result'
+        index = IndexWriter(result_file_name + INDEX_SUFFIX, info.schema, info.sort_keys)
+    batch_rows = WRITE_BATCH_ROWS if index_interval is None else index_interval
+
+    if info.raw_merge and info.combine is None:
+        blocks = _iter_raw_merged_blocks(files, info, batch_rows)
+    else:
+        blocks = (_encode(codec, x, info) for x in iter_batches(iter_merged_rows(files, info), batch_rows))
+    with _open_run(result_file_name, info) as result_file, info.sort_stats.measure(COMPARE):
+        for block in blocks:
+            with info.sort_stats.measure(WRITE):
+                result_file.write(block)
+            if index is not None:
+                index.add(block)
+
+    if index is not None:
+        index.close()
+
+    for file in files:
+        _remove_run(file, info)
 
     return result_file_name
 
 
-def _merge_sort(file_name: str, info: SortInfo) -> str:
-    """Merge sort for file by one key.
+def _v1_run(file: FileType, info: SortInfo) -> FileType:
+    """Convert v2 file to temporary v1 run, v2 file is removed as merged run.
+
+    Compressed runs and v2 files both start with zero row length, so v2
+    file must be converted before compression of run is read.
+
+    :param file: file name or segment.
+    :param info: info object.
+    :return: v1 file name or segment.
+    """
+    if isinstance(file, FileSegment) or detect_format(file) == FORMAT_V1:
+        return file
+    v1_file_name = _v1_input(file, info.schema, info.tmp_directory)
+    _remove_run(file, info)
+    return v1_file_name
+
+
+def merge_files(left_file: FileType, right_file: FileType, info: SortInfo) -> str:
+    """Merge two files into one file.
+
+    :param left_file: first file name or segment.
+    :param right_file: second file name or segment.
+    :param info: info object.
+    :return:
+    """
+    return merge_runs([left_file, right_file], info)
+
+
+def scan_natural_runs(file_name: str, info: SortInfo) -> Optional[list[NaturalRun]]:
+    """Find runs of sorted rows of file by one read of sort columns.
+
+    Run of rows in ascending order or in strictly descending order is
+    natural run if it is at least block size or the whole file, rows
+    between natural runs are unsorted. Descending runs are strict, so
+    reversed run keeps order of rows with equal keys. Scan stops if the
+    first block size bytes or the first scan short runs runs of file have
+    no natural run.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :return: runs of file in order of file, None if scan is stopped.
+    """
+    file_size = path.getsize(file_name)
+    min_size = min(info.block_size, file_size)
+    buffer_size = max(info.block_size // info.fan_in, MIN_READ_BUFFER_SIZE)
+
+    runs = []
+    with mapped_file(file_name) as mapped:
+        if mapped is None:
+            return runs
+
+        def add_run(start: int, end: int, order: str) -> None:
+            nonlocal unsorted_start
+            if end - start < min_size:
+                return
+            if start > unsorted_start:
+                runs.append(NaturalRun(FileSegment(file_name, unsorted_start, start), UNSORTED_RUN))
+            runs.append(NaturalRun(FileSegment(file_name, start, end), order))
+            unsorted_start = end
+
+        buffer, view = mapped
+        segment = FileSegment(file_name, 0, file_size)
+        start = unsorted_start = index = short_runs = 0
+        order, last_key = None, _NO_KEY
+        for row_key, row in _iter_view_rows(view, segment, _build_raw_key(info), buffer_size, buffer):
+            if last_key is not _NO_KEY:
+                is_less = row_key < last_key
+                if order is None:
+                    order = DESCENDING_RUN if is_less else ASCENDING_RUN
+                elif is_less != (order == DESCENDING_RUN):
+                    add_run(start, index, order)
+                    short_runs += 1
+                    if len(runs) == 0 and (index >= info.block_size or short_runs >= SCAN_SHORT_RUNS):
+                        return None
+                    start, order = index, None
+            last_key = row_key
+            index += len(row)
+
+    if index != file_size:
+        raise ValueError(f'Bad row format: file {file_name} ends with incomplete row of {file_size - index} bytes.')
+    add_run(start, index, order or ASCENDING_RUN)
+    if unsorted_start < file_size:
+        runs.append(NaturalRun(FileSegment(file_name, unsorted_start, file_size), UNSORTED_RUN))
+    return runs
+
+
+def _sort_mapped_segment(
+    mapped: tuple[mmap.mmap, memoryview], segment: FileSegment, info: SortInfo
+) -> Optional[Iterator[bytes]]:
+    """Sort segment of mapped file without python rows.
+
+    :param mapped: mapped file and its view.
+    :param segment: segment with whole rows.
+    :param info: info object.
+    :return: sorted blocks, None if segment must be sorted as python rows.
+    """
+    buffer, view = mapped
+    codec = get_codec(info.schema)
+    if codec.arrays is not None:
+        array = codec.arrays.view(view, segment.start, segment.end)
+        if len(array) * codec.arrays.row_size == segment.end - segment.start:
+            array = array[codec.arrays.sort_order(array, info.sort_keys)]
+            if info.distinct is not None:
+                array = array[codec.arrays.distinct_indexes(array, info.sort_keys, info.distinct == DISTINCT_ROWS)]
+            array = array[:info.limit]
+            return (array[i:i + WRITE_BATCH_ROWS].tobytes() for i in range(0, len(array), WRITE_BATCH_ROWS))
+
+    if info.distinct is not None:
+        return None
+    batch = ColumnBatch(info.schema, sorted({x.index for x in info.sort_keys}))
+    with info.sort_stats.measure(DESERIALIZE):
+        batch.extend(view, segment.start, segment.end)
+    order = batch.sort_order(info.sort_keys)[:info.limit]
+    return batch.iter_blocks(buffer, segment.start, order, WRITE_BATCH_ROWS)
+
+
+def _sort_segment(
+    segment: FileSegment, info: SortInfo, run_file_name: str
+) -> tuple[str, CompressionStats, SortStats]:
+    """Sort segment of input into run file.
+
+    Segment without nulls of schema with fixed size cells is sorted as
+    numpy array without python rows, if rows are not combined. Other
+    segments without duplicates are sorted as column batch of sort
+    columns. Duplicates are dropped or combined by python rows, only
+    limit rows of info are written.
+
+    :param segment: segment with whole rows.
+    :param info: info object.
+    :param run_file_name: run file name.
+    :return: run file name, statistics of compression and sort of worker.
+    """
+    info = replace(info, compression_stats=CompressionStats(), sort_stats=SortStats())
+    stats = info.sort_stats
+    codec = get_codec(info.schema)
+    blocks = None
+    with stats.measure(SORT), mapped_file(segment.file_name) as mapped:
+        if mapped is not None and info.combine is None:
+            blocks = _sort_mapped_segment(mapped, segment, info)
+
+        if blocks is None:
+            with stats.measure(DESERIALIZE):
+                rows = _read_segment_rows(segment, info)
+            key = build_sort_key(info.schema, info.sort_keys)
+            rows.sort(key=key)
+            blocks = map(codec.encode, iter_batches(islice(_iter_reduced_rows(rows, info, key), info.limit)))
+
+        with _open_run(run_file_name, info) as run_file:
+            _write_blocks(run_file, blocks, info)
+
+    return run_file_name, info.compression_stats, stats
+
+
+def _reverse_segment(
+    segment: FileSegment, info: SortInfo, run_file_name: str
+) -> tuple[str, CompressionStats, SortStats]:
+    """Write rows of segment in reverse order into run file.
+
+    Segment is read by parts of block size from its end, part is reversed
+    as numpy array or by offsets of its rows.
+
+    :param segment: segment with whole rows.
+    :param info: info object.
+    :param run_file_name: run file name.
+    :return: run file name, statistics of compression and sort of worker.
+    """
+    info = replace(info, compression_stats=CompressionStats(), sort_stats=SortStats())
+    stats = info.sort_stats
+    codec = get_codec(info.schema)
+    with stats.measure(SORT), mapped_file(segment.file_name) as mapped, \
+            _open_run(run_file_name, info) as run_file:
+        buffer, view = mapped
+        for part in reversed(split_segments(segment, info.block_size)):
+            array = codec.arrays.view(view, part.start, part.end) if codec.arrays is not None else None
+            if array is not None and len(array) * codec.arrays.row_size == part.end - part.start:
+                array = array[::-1]
+                blocks = (array[i:i + WRITE_BATCH_ROWS].tobytes() for i in range(0, len(array), WRITE_BATCH_ROWS))
+            else:
+                batch = ColumnBatch(info.schema, [])
+                with stats.measure(DESERIALIZE):
+                    batch.extend(view, part.start, part.end)
+                order = range(len(batch) - 1, -1, -1)
+                blocks = batch.iter_blocks(buffer, part.start, order, WRITE_BATCH_ROWS)
+            _write_blocks(run_file, blocks, info)
+            # array view must be released before map is closed
+            del array
+
+    return run_file_name, info.compression_stats, stats
+
+
+def _sort_natural_run(
+    run: NaturalRun, info: SortInfo, run_file_name: str
+) -> tuple[str, CompressionStats, SortStats]:
+    """Write descending natural run in reverse order or sort unsorted rows into run file.
+
+    :param run: descending run or unsorted run of at most block size.
+    :param info: info object.
+    :param run_file_name: run file name.
+    :return: run file name, statistics of compression and sort of worker.
+    """
+    if run.order == DESCENDING_RUN:
+        return _reverse_segment(run.segment, info, run_file_name)
+    return _sort_segment(run.segment, info, run_file_name)
+
+
+def _replacement_selection(file_name: str, info: SortInfo) -> Iterator[tuple[int, list[Any]]]:
+    """Stream rows of file through heap with block size of rows.
+
+    Row goes to the current run if its key is not less than the last
+    output key, otherwise it waits in heap for the next run.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :return: run number and row in output order.
+    """
+    key = build_sort_key(info.schema, info.sort_keys)
+    buffer_size = max(info.block_size // info.fan_in, MIN_READ_BUFFER_SIZE)
+
+    heap, heap_size = [], 0
+    run_number, last_key = 0, None
+    sequence = 0
+    for rows, rows_size in info.sort_stats.iter_measured(_iter_run_blocks(file_name, info, buffer_size), DESERIALIZE):
+        row_size = rows_size / max(len(rows), 1)
+        for row in rows:
+            row_key = key(row)
+            row_run_number = run_number + 1 if last_key is not None and row_key < last_key else run_number
+            heapq.heappush(heap, (row_run_number, row_key, sequence, row_size, row))
+            heap_size += row_size
+            sequence += 1
+
+            while heap_size > info.block_size:
+                run_number, last_key, _, size, popped_row = heapq.heappop(heap)
+                heap_size -= size
+                yield run_number, popped_row
+
+    while len(heap) > 0:
+        popped_run_number, _, _, _, popped_row = heapq.heappop(heap)
+        yield popped_run_number, popped_row
+
+
+def _generate_replacement_selection_runs(file_name: str, info: SortInfo) -> list[str]:
+    """Write runs of replacement selection, runs are about twice block size on random data.
+
+    Duplicates are dropped or combined inside every run.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :return:
+    """
+    codec = get_codec(info.schema)
+    key = build_sort_key(info.schema, info.sort_keys)
+    info.sort_stats.passes[-1].read_bytes += path.getsize(file_name)
+
+    run_file_names = []
+    with info.sort_stats.measure(SORT):
+        for _, run_rows in groupby(_replacement_selection(file_name, info), key=itemgetter(0)):
+            run_file_names.append(path.join(info.tmp_directory, GENERATOR_ID.next_id()))
+            with _open_run(run_file_names[-1], info) as run_file:
+                for rows in iter_batches(_iter_reduced_rows(map(itemgetter(1), run_rows), info, key)):
+                    block = _encode(codec, rows, info)
+                    with info.sort_stats.measure(WRITE):
+                        run_file.write(block)
+            _finish_run(run_file_names[-1], info, RUN_EVENT)
+
+    return run_file_names
+
+
+def _scan_runs(file_name: str, info: SortInfo) -> list[NaturalRun]:
+    """Split input into natural runs and unsorted runs of at most block size.
+
+    Descending natural runs are not split, every one of them is reversed
+    into one run file.
+
+    Without natural runs of info, or if scan is stopped, all runs are unsorted.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :return: runs in order of file.
+    """
+    natural_runs = None
+    if info.natural_runs:
+        with info.sort_stats.measure(SORT):
+            natural_runs = scan_natural_runs(file_name, info)
+        # stopped scan reads about the first block
+        file_size = path.getsize(file_name)
+        info.sort_stats.passes[-1].read_bytes += file_size if natural_runs is not None else min(
+            info.block_size, file_size
+        )
+    if natural_runs is None:
+        natural_runs = [NaturalRun(FileSegment(file_name, 0, path.getsize(file_name)), UNSORTED_RUN)]
+
+    runs = []
+    for run in natural_runs:
+        if run.order == UNSORTED_RUN:
+            runs.extend(NaturalRun(x, UNSORTED_RUN) for x in split_segments(run.segment, info.block_size))
+        else:
+            runs.append(run)
+    return runs
+
+
+def _generate_runs(file_name: str, info: SortInfo, map_: Callable) -> list[FileType]:
+    """Sort input into runs.
+
+    Ascending natural runs are segments of input, they are not copied.
 
     :param file_name: original file name.
     :param info: info object.
+    :param map_: map function of worker pool.
+    :return: run file names and segments in order of input.
+    """
+    info.sort_stats.start_pass()
+    if info.replacement_selection:
+        return _generate_replacement_selection_runs(file_name, info)
+
+    runs = _scan_runs(file_name, info)
+    written_runs = [x for x in runs if x.order != ASCENDING_RUN]
+    run_file_names = [path.join(info.tmp_directory, GENERATOR_ID.next_id()) for _ in written_runs]
+    run_file_names = iter(_collect_stats(
+        map_(_sort_natural_run, written_runs, repeat(_task_info(info)), run_file_names), info, RUN_EVENT,
+        [_measure_inputs([x.segment], info) for x in written_runs]
+    ))
+    return [x.segment if x.order == ASCENDING_RUN else next(run_file_names) for x in runs]
+
+
+def _task_info(info: SortInfo) -> SortInfo:
+    # progress callback is called by main process only, it may be not picklable
+    return replace(info, progress=None)
+
+
+def _collect_stats(
+    results: Iterator[tuple[str, CompressionStats, SortStats]], info: SortInfo, kind: str,
+    inputs: list[tuple[int, int, int]]
+) -> list[str]:
+    """Add statistics of workers to info object and report finished runs or merges.
+
+    :param results: file names and statistics of workers.
+    :param info: info object.
+    :param kind: run or merge.
+    :param inputs: read bytes, number and size of removed temporary inputs of every worker task.
+    :return: file names.
+    """
+    file_names = []
+    for (file_name, compression_stats, sort_stats), task_inputs in zip(results, inputs):
+        info.compression_stats.add(compression_stats)
+        info.sort_stats.add(sort_stats)
+        _finish_run(file_name, info, kind, task_inputs)
+        file_names.append(file_name)
+    return file_names
+
+
+def _merge_group(
+    files: list[FileType], info: SortInfo, result_file_name: str
+) -> tuple[str, CompressionStats, SortStats]:
+    """Merge group of runs in worker.
+
+    :param files: sorted file names or segments.
+    :param info: info object.
+    :param result_file_name: result file name.
+    :return: result file name, statistics of compression and sort of worker.
+    """
+    info = replace(info, compression_stats=CompressionStats(), sort_stats=SortStats())
+    return merge_runs(files, info, result_file_name), info.compression_stats, info.sort_stats
+
+
+@contextmanager
+def _pool_map(workers: int) -> Iterator[Callable]:
+    """Map function over process pool or builtin map for one worker.
+
+    :param workers: number of processes.
     :return:
     """
-    if path.getsize(file_name) > info.block_size:
-        left_file_name, right_file_name = split_file(file_name, info)
-        left_file_name = _merge_sort(left_file_name, info)
-        right_file_name = _merge_sort(right_file_name, info)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            yield executor.map
     else:
-        with open(file_name, 'rb') as file:
-            rows, tail = deserialize(info.schema, file.read())
-            assert len(tail) == 0, f'Error deserialize: bad format file {file_name}.'
+        yield map
 
-            rows.sort(key=lambda x: x[info.schema_sort_index])
-            new_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
-            with open(new_file_name, 'wb') as new_file:
-                new_file.write(serialize(info.schema, rows))
 
-        if info.input_file_name != file_name:
-            remove(file_name)
+def _sorted_runs(file_name: str, info: SortInfo, max_runs: int) -> list[FileType]:
+    """Sort file into runs and merge them until at most max runs are left.
 
-        return new_file_name
+    Sorted runs are merged by groups of fan in runs. Runs and merges of
+    one pass are spread over worker processes.
 
-    return merge_files(left_file_name, right_file_name, info)
+    :param file_name: original file name.
+    :param info: info object.
+    :param max_runs: max number of result runs.
+    :return: run file names and segments of input.
+    """
+    with _pool_map(info.workers) as map_:
+        run_file_names = _generate_runs(file_name, info, map_)
 
+        while len(run_file_names) > max_runs:
+            groups = [run_file_names[i:i + info.fan_in] for i in range(0, len(run_file_names), info.fan_in)]
+            merged_groups = [x for x in groups if len(x) > 1]
+            inputs = [_measure_inputs(x, info) for x in merged_groups]
+            info.sort_stats.start_pass()
+            merged_file_names = iter(_collect_stats(map_(
+                _merge_group, merged_groups, repeat(_task_info(info)),
+                [path.join(info.tmp_directory, GENERATOR_ID.next_id()) for _ in merged_groups]
+            ), info, MERGE_EVENT, inputs))
+            run_file_names = [next(merged_file_names) if len(x) > 1 else x[0] for x in groups]
+
+    return run_file_names
+
+
+def _merge_sort(file_name: str, info: SortInfo) -> str:
+    """Merge sort for file by composite key.
+
+    Temporary runs can be compressed, the last merge writes raw result
+    and its sparse index. Sorted input with natural runs is copied to
+    result.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :return:
+    """
+    run_file_names = _sorted_runs(file_name, info, info.fan_in)
+    if len(run_file_names) == 1 and info.compression is None and info.index_interval is None:
+        if not isinstance(run_file_names[0], FileSegment):
+            return run_file_names[0]
+        # the only segment of input is the whole sorted input, result is its copy, so input is never owned by caller
+        result_file_name = path.join(info.tmp_directory, GENERATOR_ID.next_id())
+        with info.sort_stats.measure(WRITE):
+            shutil.copyfile(run_file_names[0].file_name, result_file_name)
+        return result_file_name
+
+    inputs = _measure_inputs(run_file_names, info)
+    info.sort_stats.start_pass()
+    result_file_name = merge_runs(run_file_names, replace(info, compression=None), index_interval=info.index_interval)
+    _finish_run(result_file_name, info, MERGE_EVENT, inputs)
+    return result_file_name
+
+
+def _v1_input(file_name: str, schema: SchemaType, tmp_directory: str) -> str:
+    """Convert v2 input to temporary v1 file, runs and raw merge read rows of v1 format.
+
+    :param file_name: v1 or v2 file name.
+    :param schema: row schema.
+    :param tmp_directory: temporary directory.
+    :return: v1 file name, it is input file name for v1 input.
+    """
+    if detect_format(file_name) == FORMAT_V1:
+        return file_name
+    return convert_file(file_name, schema, path.join(tmp_directory, GENERATOR_ID.next_id()), FORMAT_V1)
 
-def merge_sort(
-    file_name: str, schema: SchemaType, schema_sort_indexes: list[int],
-    tmp_directory: str, block_size: int, is_ascending_order: bool = True
-) -> str:
-    """Merge sort for file.
+
+def _build_sort_info(
+    file_name: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]],
+    tmp_directory: str, block_size: Optional[int], is_ascending_order: bool, memory_limit: Optional[int] = None,
+    **options
+) -> SortInfo:
+    """Check parameters and build info object.
 
     :param file_name: original file name.
     :param schema: row schema.
-    :param schema_sort_indexes: sort indexes from high to low power.
+    :param schema_sort_indexes: sort indexes or sort keys from high to low power.
     :param tmp_directory: temporary directory.
     :param block_size: block size.
-    :param is_ascending_order: ascending order or not.
+    :param is_ascending_order: order for sort indexes given without sort key.
+    :param memory_limit: memory limit for which block size and fan in are planned.
+    :param options: other fields of info object.
     :return:
     """
+    sort_keys = as_sort_keys(schema_sort_indexes, is_ascending_order)
     assert len([
         x
-        for i, x in enumerate(schema)
-        if i in schema_sort_indexes and x == CellType.BYTES
+        for x in sort_keys
+        if schema[x.index] == CellType.BYTES
     ]) == 0, 'Selected for sort columns have type BYTES'
+    assert block_size is not None or memory_limit is not None, 'Block size or memory limit must be given'
 
-    info = SortInfo(schema, -1, tmp_directory, block_size, is_ascending_order, file_name)
-    result = file_name
-    for schema_sort_index in reversed(schema_sort_indexes):
-        info.schema_sort_index = schema_sort_index
-        result = _merge_sort(result, info)
+    if memory_limit is not None and len(sort_keys) == 0:
+        # rows are only streamed
+        block_size = MIN_READ_BUFFER_SIZE
+    elif memory_limit is not None:
+        replacement_selection = options.get('replacement_selection', False)
+        # runs of replacement selection and merges of combined rows have python rows
+        compact = (
+            not replacement_selection and options.get('raw_merge', True) and options.get('combine') is None
+            and options.get('distinct') is None
+        )
+        plan = plan_memory(
+            file_name, schema, sort_keys, memory_limit, options.get('workers', 1), replacement_selection, compact
+        )
+        block_size, options['fan_in'] = plan.block_size, plan.fan_in
 
-    return result
+    return SortInfo(schema, sort_keys, tmp_directory, block_size, file_name, **options)
+
+
+def merge_sort(
+    file_name: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]],
+    tmp_directory: str, block_size: Optional[int], is_ascending_order: bool = True, fan_in: int = 64,
+    replacement_selection: bool = False, workers: int = 1, raw_merge: bool = True,
+    compression: Optional[CompressionType] = None, compression_stats: Optional[CompressionStats] = None,
+    index_interval: Optional[int] = None, distinct: Optional[str] = None, combine: Optional[CombineType] = None,
+    background_io: bool = False, sort_stats: Optional[SortStats] = None,
+    progress: Optional[Callable[[SortEvent], None]] = None, memory_limit: Optional[int] = None,
+    natural_runs: bool = False
+) -> str:
+    """Merge sort for file.
+
+    All sort columns are compared as one composite key, so data is sorted in one pass.
+
+    :param file_name: original file name, v2 file is converted to temporary v1 file.
+    :param schema: row schema.
+    :param schema_sort_indexes: sort indexes or sort keys from high to low power.
+    :param tmp_directory: temporary directory.
+    :param block_size: block size, it can be None if memory limit is given.
+    :param is_ascending_order: order for sort indexes given without sort key.
+    :param fan_in: max number of runs merged at once.
+    :param replacement_selection: generate runs by replacement selection instead of sorted blocks.
+    :param workers: number of processes, every process uses own block size of memory.
+    :param raw_merge: merge bytes of rows with decoded sort columns only instead of decoded rows.
+    :param compression: compression of temporary runs: name of stdlib compression (zlib, lzma, bz2) or object.
+    :param compression_stats: object to which statistics of compression are added.
+    :param index_interval: write sparse index of result to file with index suffix, with entry for every index
+        interval rows.
+    :param distinct: drop rows with duplicate keys ("keys") or duplicate whole rows ("rows") in every run and merge.
+    :param combine: function of two rows with equal keys which returns one row with the same keys, for example
+        with sum of count column, it is applied in every run and merge.
+    :param background_io: read runs ahead and write runs behind in background threads of every process, so
+        disk waits overlap with decode and compare of rows.
+    :param sort_stats: object to which time of phases, bytes of passes and peak of temporary files are added.
+    :param progress: function which is called with event of every finished run and merge.
+    :param memory_limit: memory of all processes in bytes, block size and fan in are chosen by memory of decoded
+        rows of schema, given block size and fan in are ignored.
+    :param natural_runs: scan input for runs of sorted rows of at least block size: ascending runs are merged in
+        place and descending runs are reversed instead of sorted, sorted input is copied to result.
+    :return:
+    """
+    input_file_name = _v1_input(file_name, schema, tmp_directory)
+    result_file_name = None
+    try:
+        info = _build_sort_info(
+            input_file_name, schema, schema_sort_indexes, tmp_directory, block_size, is_ascending_order,
+            fan_in=fan_in, replacement_selection=replacement_selection, workers=workers, raw_merge=raw_merge,
+            compression=compression, compression_stats=compression_stats, index_interval=index_interval,
+            distinct=distinct, combine=combine, background_io=background_io, sort_stats=sort_stats,
+            progress=progress, memory_limit=memory_limit, natural_runs=natural_runs
+        )
+        result_file_name = _merge_sort(input_file_name, info) if len(info.sort_keys) > 0 else input_file_name
+    finally:
+        if input_file_name not in (file_name, result_file_name):
+            remove(input_file_name)
+    return result_file_name
+
+
+def iter_sorted(
+    file_name: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]],
+    tmp_directory: str, block_size: Optional[int], is_ascending_order: bool = True, fan_in: int = 64,
+    replacement_selection: bool = False, workers: int = 1, raw_merge: bool = True,
+    compression: Optional[CompressionType] = None, compression_stats: Optional[CompressionStats] = None,
+    distinct: Optional[str] = None, combine: Optional[CombineType] = None, background_io: bool = False,
+    sort_stats: Optional[SortStats] = None, progress: Optional[Callable[[SortEvent], None]] = None,
+    memory_limit: Optional[int] = None, natural_runs: bool = False, batches: bool = False
+) -> Iterator[Union[list[Any], list[list[Any]]]]:
+    """Merge sort for file with lazy result.
+
+    Runs are merged until at most fan in runs are left, the last merge
+    goes straight to the consumer and is not written to disk.
+
+    :param file_name: original file name, v2 file is converted to temporary v1 file.
+    :param schema: row schema.
+    :param schema_sort_indexes: sort indexes or sort keys from high to low power.
+    :param tmp_directory: temporary directory.
+    :param block_size: block size, it can be None if memory limit is given.
+    :param is_ascending_order: order for sort indexes given without sort key.
+    :param fan_in: max number of runs merged at once.
+    :param replacement_selection: generate runs by replacement selection instead of sorted blocks.
+    :param workers: number of processes, every process uses own block size of memory.
+    :param raw_merge: merge bytes of rows with decoded sort columns only instead of decoded rows.
+    :param compression: compression of temporary runs: name of stdlib compression (zlib, lzma, bz2) or object.
+    :param compression_stats: object to which statistics of compression are added.
+    :param distinct: drop rows with duplicate keys ("keys") or duplicate whole rows ("rows") in every run and merge.
+    :param combine: function of two rows with equal keys which returns one row with the same keys, for example
+        with sum of count column, it is applied in every run and merge.
+    :param background_io: read runs ahead and write runs behind in background threads of every process, so
+        disk waits overlap with decode and compare of rows.
+    :param sort_stats: object to which time of phases, bytes of passes and peak of temporary files are added.
+    :param progress: function which is called with event of every finished run and merge.
+    :param memory_limit: memory of all processes in bytes, block size and fan in are chosen by memory of decoded
+        rows of schema, given block size and fan in are ignored.
+    :param natural_runs: scan input for runs of sorted rows of at least block size: ascending runs are merged in
+        place and descending runs are reversed instead of sorted.
+    :param batches: yield lists of rows instead of rows.
+    :return:
+    """
+    input_file_name = _v1_input(file_name, schema, tmp_directory)
+    try:
+        info = _build_sort_info(
+            input_file_name, schema, schema_sort_indexes, tmp_directory, block_size, is_ascending_order,
+            fan_in=fan_in, replacement_selection=replacement_selection, workers=workers, raw_merge=raw_merge,
+            compression=compression, compression_stats=compression_stats, distinct=distinct, combine=combine,
+            background_io=background_io, sort_stats=sort_stats, progress=progress, memory_limit=memory_limit,
+            natural_runs=natural_runs
+        )
+        if len(info.sort_keys) == 0:
+            yield from iter_rows(input_file_name, schema, info.block_size, batches)
+            return
+
+        yield from _iter_sorted(input_file_name, info, batches)
+    finally:
+        if input_file_name != file_name:
+            remove(input_file_name)
+
+
+def _iter_sorted(file_name: str, info: SortInfo, batches: bool) -> Iterator[Union[list[Any], list[list[Any]]]]:
+    """Sort file into at most fan in runs and stream their merge.
+
+    :param file_name: original file name.
+    :param info: info object.
+    :param batches: yield lists of rows instead of rows.
+    :return:
+    """
+    run_file_names = _sorted_runs(file_name, info, info.fan_in)
+    inputs = _measure_inputs(run_file_names, info)
+    info.sort_stats.start_pass()
+    try:
+        merged_batches = info.sort_stats.iter_measured(iter_batches(iter_merged_rows(run_file_names, info)), COMPARE)
+        if batches:
+            yield from merged_batches
+        else:
+            for batch in merged_batches:
+                yield from batch
+    finally:
+        for run_file_name in run_file_names:
+            _remove_run(run_file_name, info)
+    _finish_run(None, info, MERGE_EVENT, inputs)
+
+
+def top_k(
+    file_name: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]], k: int,
+    tmp_directory: str, block_size: int, is_ascending_order: bool = True, fan_in: int = 64,
+    workers: int = 1, raw_merge: bool = True,
+    compression: Optional[CompressionType] = None, compression_stats: Optional[CompressionStats] = None,
+    batches: bool = False
+) -> Iterator[Union[list[Any], list[list[Any]]]]:
+    """First k rows of sorted file with lazy result.
+
+    File is read once and the first k rows are kept by bounded heap. If
+    decoded k rows do not fit into block size, file is sorted into runs
+    of at most k rows and they are merged until k rows.
+
+    :param file_name: original file name, v2 file is converted to temporary v1 file.
+    :param schema: row schema.
+    :param schema_sort_indexes: sort indexes or sort keys from high to low power.
+    :param k: number of rows.
+    :param tmp_directory: temporary directory.
+    :param block_size: block size.
+    :param is_ascending_order: order for sort indexes given without sort key.
+    :param fan_in: max number of runs merged at once.
+    :param workers: number of processes, every process uses own block size of memory.
+    :param raw_merge: merge bytes of rows with decoded sort columns only instead of decoded rows.
+    :param compression: compression of temporary runs: name of stdlib compression (zlib, lzma, bz2) or object.
+    :param compression_stats: object to which statistics of compression are added.
+    :param batches: yield lists of rows instead of rows.
+    :return:
+    """
+    input_file_name = _v1_input(file_name, schema, tmp_directory)
+    try:
+        info = _build_sort_info(
+            input_file_name, schema, schema_sort_indexes, tmp_directory, block_size, is_ascending_order,
+            fan_in=fan_in, workers=workers, raw_merge=raw_merge,
+            compression=compression, compression_stats=compression_stats, limit=k
+        )
+        if len(info.sort_keys) == 0:
+            rows = islice(iter_rows(input_file_name, schema, block_size), k)
+            yield from iter_batches(rows) if batches else rows
+            return
+
+        # heap keeps decoded rows, their memory is measured by rows of the first block
+        blocks = _iter_run_blocks(input_file_name, info, block_size)
+        first_rows, first_size = next(blocks, ([], 0))
+        memory_per_byte, _ = measure_rows(first_rows, info.schema, info.sort_keys)
+        if k * first_size * memory_per_byte > block_size * max(len(first_rows), 1):
+            blocks.close()
+            yield from _iter_sorted(input_file_name, info, batches)
+            return
+
+        rows = chain(first_rows, chain.from_iterable(x for x, _ in blocks))
+        rows = heapq.nsmallest(k, rows, key=build_sort_key(info.schema, info.sort_keys))
+        yield from iter_batches(rows) if batches else rows
+    finally:
+        if input_file_name != file_name:
+            remove(input_file_name)
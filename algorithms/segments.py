@@ -0,0 +1,163 @@
+import os
+from os import path, remove
+from typing import Any, Union
+from collections.abc import Iterator
+
+from .keys import SortKey, as_sort_keys
+from .merge_sort import SortInfo, FileSegment, merge_sort, merge_runs, iter_batches, iter_merged_rows
+from .formats import encode_schema, decode_schema
+from .serialize import CellType, SchemaType, serialize, deserialize
+
+
+MANIFEST_NAME = 'MANIFEST'
+# manifest is schema and sort keys of store, then segment file name and tier of segment from old segments to new ones
+MANIFEST_SCHEMA = [CellType.STRING, CellType.UNSIGNED_INT]
+SEGMENT_PREFIX = 'segment_'
+
+
+class SegmentStore:
+    """Sorted data set as sorted segment files of directory with tiered compaction.
+
+    New batch is sorted into segment of tier 0. When tier has tier size
+    segments, they are merged into one segment of the next tier, so batch
+    is merged about log of number of batches times and number of segments
+    is at most tier size minus one for every tier. Segments are kept from
+    old to new, tiers of old segments are higher, so only neighbours are
+    merged and rows with equal keys are read in order of batches.
+
+    List of segments is written to manifest file of directory after every
+    change, merged segments are removed after manifest is written. Manifest
+    keeps schema and sort keys, so store is reopened only with them. Rows
+    must not be read while batch is added.
+    """
+
+    def __init__(
+        self, directory: str, schema: SchemaType, schema_sort_indexes: list[Union[int, SortKey]], block_size: int,
+        is_ascending_order: bool = True, tier_size: int = 4, fan_in: int = 64, workers: int = 1
+    ):
+        """Open store, segments of directory are read from manifest.
+
+        :param directory: directory of segments, it is temporary directory of sort of batches.
+        :param schema: row schema, it must have builtin cell types and it is checked by manifest.
+        :param schema_sort_indexes: sort indexes or sort keys from high to low power, they are checked by manifest.
+        :param block_size: block size of sort of batches and of merges.
+        :param is_ascending_order: order for sort indexes given without sort key.
+        :param tier_size: number of segments of one tier which are merged into segment of the next tier.
+        :param fan_in: max number of runs merged at once by sort of batch.
+        :param workers: number of processes of sort of batch.
+        """
+        assert tier_size >= 2, 'Tier size must be at least 2'
+        sort_keys = as_sort_keys(schema_sort_indexes, is_ascending_order)
+        assert len(sort_keys) > 0, 'Segments must have sort columns'
+        self.directory = directory
+        self.tier_size = tier_size
+        self.info = SortInfo(schema, sort_keys, directory, block_size, fan_in=fan_in, workers=workers)
+
+        self._header = encode_schema(schema, sort_keys)
+        self._segments: list[list[Any]] = []
+        manifest_file_name = path.join(directory, MANIFEST_NAME)
+        if path.exists(manifest_file_name):
+            with open(manifest_file_name, 'rb') as file:
+                data = file.read()
+            manifest_schema, manifest_sort_keys, offset = decode_schema(data)
+            assert manifest_schema == list(schema) and manifest_sort_keys == sort_keys, \
+                f'Store {directory} has schema {manifest_schema} and sort keys {manifest_sort_keys}'
+            self._segments, byte_tail = deserialize(MANIFEST_SCHEMA, data[offset:])
+            assert len(byte_tail) == 0, f'Error deserialize: bad format file {manifest_file_name}.'
+        self._next_number = max((int(x[0][len(SEGMENT_PREFIX):]) + 1 for x in self._segments), default=0)
+
+    @property
+    def segments(self) -> list[str]:
+        """Segment file names from old to new.
+
+        :return:
+        """
+        return [path.join(self.directory, x[0]) for x in self._segments]
+
+    @property
+    def tiers(self) -> list[int]:
+        """Tiers of segments from old to new.
+
+        :return:
+        """
+        return [x[1] for x in self._segments]
+
+    def _new_segment_name(self) -> str:
+        name = f'{SEGMENT_PREFIX}{self._next_number:015d}'
+        self._next_number += 1
+        return name
+
+    def _write_manifest(self) -> None:
+        """Replace manifest file by list of segments.
+
+        :return:
+        """
+        manifest_file_name = path.join(self.directory, MANIFEST_NAME)
+        with open(manifest_file_name + '.tmp', 'wb') as file:
+            file.write(self._header + serialize(MANIFEST_SCHEMA, self._segments))
+        os.replace(manifest_file_name + '.tmp', manifest_file_name)
+
+    def add(self, file_name: str) -> None:
+        """Sort batch and add it as new segment, then merge full tiers.
+
+        :param file_name: file of batch, it is kept.
+        :return:
+        """
+        if path.getsize(file_name) == 0:
+            return
+
+        sorted_file_name = merge_sort(
+            file_name, self.info.schema, self.info.sort_keys, self.directory, self.info.block_size,
+            fan_in=self.info.fan_in, workers=self.info.workers
+        )
+        name = self._new_segment_name()
+        os.replace(sorted_file_name, path.join(self.directory, name))
+        self._segments.append([name, 0])
+        self._write_manifest()
+
+        tier = 0
+        while True:
+            positions = [i for i, x in enumerate(self._segments) if x[1] == tier]
+            if len(positions) < self.tier_size:
+                break
+            self._merge(positions[0], positions[-1] + 1, tier + 1)
+            tier += 1
+
+    def compact(self) -> None:
+        """Merge all segments into one segment of the highest tier.
+
+        :return:
+        """
+        if len(self._segments) > 1:
+            self._merge(0, len(self._segments), max(self.tiers))
+
+    def _merge(self, start: int, end: int, tier: int) -> None:
+        """Merge neighbour segments into one segment.
+
+        Segments are merged as file segments, so they are kept until new
+        manifest is written.
+
+        :param start: position of the first merged segment.
+        :param end: position after the last merged segment.
+        :param tier: tier of merged segment.
+        :return:
+        """
+        file_names = self.segments[start:end]
+        name = self._new_segment_name()
+        merge_runs(
+            [FileSegment(x, 0, path.getsize(x)) for x in file_names], self.info, path.join(self.directory, name)
+        )
+        self._segments[start:end] = [[name, tier]]
+        self._write_manifest()
+        for file_name in file_names:
+            remove(file_name)
+
+    def iter_rows(self, batches: bool = False) -> Iterator[Union[list[Any], list[list[Any]]]]:
+        """Read rows of all segments in sorted order by merge of segments.
+
+        :param batches: yield lists of rows instead of rows.
+        :return:
+        """
+        segments = [FileSegment(x, 0, path.getsize(x)) for x in self.segments]
+        rows = iter_merged_rows(segments, self.info)
+        return iter_batches(rows) if batches else rows
@@ -1,11 +1,16 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
+import mmap
+import os
 import struct
-from typing import Any, Optional, Union
-from collections.abc import Callable
+from typing import Any, BinaryIO, Optional, Union
+from collections.abc import Callable, Iterable, Iterator
 from collections import namedtuple
 
+from .vectorized import RowArrays, MIN_VECTOR_ROWS
 
-CELL_SCHEMA = namedtuple('CellSchema', 'mark size')
+
+CELL_SCHEMA = namedtuple('CELL_SCHEMA', 'mark size')
 
 
 @dataclass
@@ -22,6 +27,16 @@ class BaseCellType:
     def __eq__(self, x: 'BaseCellType') -> bool:
         return self.schema == x.schema
 
+    def __reduce__(self) -> Union[str, tuple]:
+        """Pickle builtin cell types by name, they have lambdas for compare.
+
+        :return:
+        """
+        for name, cell_type in vars(CellType).items():
+            if cell_type is self:
+                return getattr, (CellType, name)
+        return super().__reduce__()
+
     def less(self, x: Any, y: Any) -> Optional[bool]:
         if self.less_ is None:
             raise Exception(f'For cell type "{self.name}" method less is not implemented.')
@@ -138,85 +153,310 @@ NULL_FLAG_TYPE = CellType.BOOL
 COMPOSITE_TYPES = (CellType.STRING, CellType.BYTES)
 
 SchemaType = Union[list[BaseCellType], tuple[BaseCellType, ...]]
+Buffer = Union[bytes, bytearray, memoryview]
 
 
-def _build_template_struct_pattern(schema: SchemaType, with_null: bool) -> list[str]:
-    composite_indexes = [i for i, x in enumerate(schema) if x in COMPOSITE_TYPES]
+_NULL_FLAG = struct.pack('=' + NULL_FLAG_TYPE.schema[0].mark, True)
+# kinds of segments of row codecs: run of fixed size cells from start to stop, char cell, string or bytes cell
+FIXED_RUN, CHAR_CELL, COMPOSITE_CELL = range(3)
+CodecSegment = namedtuple('CodecSegment', 'kind start stop is_string run_structs cell_structs')
 
-    result = []
-    for index, cell_type in enumerate(schema):
-        if with_null:
-            result.append(NULL_FLAG_TYPE.schema[0].mark)
 
-        value = cell_type.schema[0].mark
-        if index in composite_indexes:
-            value += '{}' + cell_type.schema[1].mark
+def _is_fixed(cell_type: BaseCellType) -> bool:
+    return cell_type not in COMPOSITE_TYPES and cell_type != CellType.CHAR and \
+        len(cell_type.schema) == 1 and cell_type.schema[0].size is not None
 
-        result.append(value)
 
-    return result
+def split_schema(schema: SchemaType) -> list[CodecSegment]:
+    """Split schema by segments of row codecs without structs.
 
-
-def serialize(schema: SchemaType, rows: list[list[Any]]) -> bytes:
-    """Serialize data to bytes.
+    Consecutive fixed size cells are one run, CHAR, STRING and BYTES cells
+    have own segments.
 
     :param schema: row schema by cell types.
-    :param rows: list of rows.
     :return:
     """
-    composite_indexes = {i for i, x in enumerate(schema) if x in COMPOSITE_TYPES}
-
-    result = []
-    for row in rows:
-        template_struct_pattern = []
-        for index, cell_type in enumerate(schema):
-            template_struct_pattern.append(NULL_FLAG_TYPE.schema[0].mark)
-            if row[index] is not None:
-                value = cell_type.schema[0].mark
-                if index in composite_indexes:
-                    value += '{}' + cell_type.schema[1].mark
-
-                template_struct_pattern.append(value)
-        template_struct_pattern = ''.join(template_struct_pattern)
-
-        composite_element_sizes = []
-        for index in composite_indexes:
-            if row[index] is not None:
-                composite_element_sizes.append(len(row[index]))
-        pattern = template_struct_pattern.format(*composite_element_sizes)
-
-        new_row = []
-        length_bytes = LENGTH_ROW_TYPE.schema[0].size
-        for index, value in enumerate(row):
-            length_bytes += NULL_FLAG_TYPE.schema[0].size
-
-            if value is not None:
-                new_row.append(False)
-
-                length_bytes += schema[index].schema[0].size
-                if index in composite_indexes:
-                    if schema[index] == CellType.STRING:
-                        value = value.encode('utf8')
-                    length = len(value)
-
-                    new_row.append(length)
-                    new_row.append(value)
+    segments = []
+    index = 0
+    while index < len(schema):
+        cell_type = schema[index]
+        if cell_type in COMPOSITE_TYPES:
+            segments.append(CodecSegment(COMPOSITE_CELL, index, index + 1, cell_type == CellType.STRING, None, None))
+            index += 1
+        elif cell_type == CellType.CHAR:
+            segments.append(CodecSegment(CHAR_CELL, index, index + 1, False, None, None))
+            index += 1
+        else:
+            stop = index
+            while stop < len(schema) and _is_fixed(schema[stop]):
+                stop += 1
+            assert stop > index, f'Cell type "{cell_type.name}" is not supported.'
+            segments.append(CodecSegment(FIXED_RUN, index, stop, False, None, None))
+            index = stop
+    return segments
+
+
+class RowCodec:
+    """Precompiled encoder and decoder of rows for one schema.
+
+    Consecutive fixed size cells are grouped into runs and every run has
+    one cached struct for the case without nulls. Cells of a run are
+    handled one by one only if the row has null in this run. CHAR, STRING
+    and BYTES cells always have own segments.
+    """
 
-                    length_bytes += length
+    def __init__(self, schema: SchemaType):
+        """Build structs for schema.
+
+        :param schema: row schema by cell types.
+        """
+        self.schema = tuple(schema)
+        self.row_length = struct.Struct('=' + LENGTH_ROW_TYPE.schema[0].mark)
+        self._null_flag_size = NULL_FLAG_TYPE.schema[0].size
+        self._composite_length = struct.Struct('=x' + LENGTH_ROW_TYPE.schema[0].mark)
+        self._char = struct.Struct('=x' + CellType.CHAR.schema[0].mark)
+        self.arrays = None
+        if all(x not in COMPOSITE_TYPES for x in self.schema):
+            self.arrays = RowArrays.build(
+                [x.schema[0].mark for x in self.schema], LENGTH_ROW_TYPE.schema[0].mark, NULL_FLAG_TYPE.schema[0].mark
+            )
+
+        self._segments = []
+        for segment in split_schema(self.schema):
+            if segment.kind == FIXED_RUN:
+                marks = [x.schema[0].mark for x in self.schema[segment.start:segment.stop]]
+                segment = segment._replace(
+                    run_structs=(
+                        struct.Struct('=' + ''.join('x' + mark for mark in marks)),
+                        struct.Struct('=' + ''.join(NULL_FLAG_TYPE.schema[0].mark + mark for mark in marks))
+                    ),
+                    cell_structs=tuple((struct.Struct('=x' + mark), struct.Struct('=' + mark)) for mark in marks)
+                )
+            self._segments.append(segment)
+
+    def encode(self, rows: list[list[Any]]) -> bytes:
+        """Serialize rows to bytes.
+
+        Rows without nulls of schema with fixed size cells are encoded as numpy array.
+
+        :param rows: list of rows.
+        :return:
+        """
+        if self.arrays is not None and len(rows) >= MIN_VECTOR_ROWS:
+            array = self.arrays.from_rows(rows)
+            if array is not None:
+                return array.tobytes()
+
+        result = []
+        append = result.append
+        pack_length = self.row_length.pack
+        null_flag, null_flag_size = _NULL_FLAG, self._null_flag_size
+        pack_composite_length, composite_head_size = self._composite_length.pack, self._composite_length.size
+        pack_char, char_size = self._char.pack, self._char.size
+
+        for row in rows:
+            length_index = len(result)
+            append(None)
+            length_bytes = self.row_length.size
+
+            for kind, start, stop, is_string, run_structs, cell_structs in self._segments:
+                if kind == FIXED_RUN:
+                    values = row[start:stop]
+                    if None not in values:
+                        append(run_structs[0].pack(*values))
+                        length_bytes += run_structs[0].size
+                        continue
+
+                    for value, (cell_struct, _) in zip(values, cell_structs):
+                        if value is None:
+                            append(null_flag)
+                            length_bytes += null_flag_size
+                        else:
+                            append(cell_struct.pack(value))
+                            length_bytes += cell_struct.size
+                    continue
+
+                value = row[start]
+                if value is None:
+                    append(null_flag)
+                    length_bytes += null_flag_size
+                elif kind == CHAR_CELL:
+                    value = value.encode('utf8')
+                    assert len(value) == 1, \
+                        'Type CHAR used only for 1 byte characters.\n' \
+                        f'Now value = {value.decode("utf8")}, length bytes = {len(value)}'
+                    append(pack_char(value))
+                    length_bytes += char_size
                 else:
-                    if schema[index] == CellType.CHAR:
+                    if is_string:
                         value = value.encode('utf8')
-                        assert len(value) == 1, \
-                            'Type CHAR used only for 1 byte characters.\n' \
-                            f'Now value = {value.decode("utf8")}, length bytes = {len(value)}'
+                    append(pack_composite_length(len(value)))
+                    append(value)
+                    length_bytes += composite_head_size + len(value)
+
+            result[length_index] = pack_length(length_bytes)
+
+        return b''.join(result)
 
-                    new_row.append(value)
+    def decode_row(self, block: Buffer, offset: int, end: int) -> list[Any]:
+        """Deserialize one row without length prefix.
+
+        :param block: bytes.
+        :param offset: index of first byte after length prefix.
+        :param end: index of first byte after row.
+        :return:
+        """
+        row = []
+        append = row.append
+        null_flag_size = self._null_flag_size
+        unpack_composite_length, composite_head_size = self._composite_length.unpack_from, self._composite_length.size
+        row_offset = offset
+
+        for kind, start, stop, is_string, run_structs, cell_structs in self._segments:
+            if kind == FIXED_RUN:
+                run_struct = run_structs[1]
+                if end - offset >= run_struct.size:
+                    values = run_struct.unpack_from(block, offset)
+                    if not any(values[0::2]):
+                        row.extend(values[1::2])
+                        offset += run_struct.size
+                        continue
+
+                for _, cell_struct in cell_structs:
+                    if block[offset]:
+                        append(None)
+                        offset += null_flag_size
+                    else:
+                        append(cell_struct.unpack_from(block, offset + null_flag_size)[0])
+                        offset += null_flag_size + cell_struct.size
+            elif block[offset]:
+                append(None)
+                offset += null_flag_size
+            elif kind == CHAR_CELL:
+                offset += null_flag_size
+                append(str(block[offset:offset + 1], 'utf8'))
+                offset += 1
+            else:
+                length = unpack_composite_length(block, offset)[0]
+                offset += composite_head_size
+                value = block[offset:offset + length]
+                append(str(value, 'utf8') if is_string else bytes(value))
+                offset += length
+
+        if offset != end:
+            raise ValueError(f'Bad row format: row from byte {row_offset} has {end - row_offset} bytes, '
+                             f'schema reads {offset - row_offset} bytes.')
+
+        return row
+
+    def build_cell_reader(self, indexes: list[int]) -> Callable[[Buffer, int], list[Any]]:
+        """Build function for decode only some cells of row, other cells are skipped.
+
+        :param indexes: cell indexes.
+        :return: function of block and index of first byte after length prefix, returns cells by indexes.
+        """
+        needed_indexes = sorted(set(indexes))
+        order = [needed_indexes.index(x) for x in indexes]
+
+        plan = []
+        for index, cell_type in enumerate(self.schema[:needed_indexes[-1] + 1]):
+            if cell_type in COMPOSITE_TYPES:
+                plan.append((COMPOSITE_CELL, cell_type == CellType.STRING, index in needed_indexes))
+            elif cell_type == CellType.CHAR:
+                plan.append((CHAR_CELL, None, index in needed_indexes))
             else:
-                new_row.append(True)
+                plan.append((FIXED_RUN, struct.Struct('=' + cell_type.schema[0].mark), index in needed_indexes))
+        plan = tuple(plan)
+
+        null_flag_size = self._null_flag_size
+        unpack_composite_length, composite_head_size = self._composite_length.unpack_from, self._composite_length.size
+
+        def read_cells(block: Buffer, offset: int) -> list[Any]:
+            values = []
+            for kind, cell_struct, is_needed in plan:
+                if block[offset]:
+                    offset += null_flag_size
+                    if is_needed:
+                        values.append(None)
+                elif kind == FIXED_RUN:
+                    if is_needed:
+                        values.append(cell_struct.unpack_from(block, offset + null_flag_size)[0])
+                    offset += null_flag_size + cell_struct.size
+                elif kind == CHAR_CELL:
+                    offset += null_flag_size
+                    if is_needed:
+                        values.append(str(block[offset:offset + 1], 'utf8'))
+                    offset += 1
+                else:
+                    length = unpack_composite_length(block, offset)[0]
+                    offset += composite_head_size
+                    if is_needed:
+                        value = block[offset:offset + length]
+                        values.append(str(value, 'utf8') if cell_struct else bytes(value))
+                    offset += length
+
+            return [values[i] for i in order]
+
+        return read_cells
+
+    def decode(self, block: Buffer, start: int = 0, end: Optional[int] = None) -> tuple[list[list[Any]], int]:
+        """Deserialize all complete rows of block.
+
+        Prefix of rows without nulls of schema with fixed size cells is decoded as numpy array.
+
+        :param block: bytes.
+        :param start: index of first byte.
+        :param end: index after last byte, by default length of block.
+        :return: rows and index of first byte after last complete row.
+        """
+        end = len(block) if end is None else end
+        row_length_size = self.row_length.size
+        unpack_length = self.row_length.unpack_from
+        decode_row = self.decode_row
+
+        rows, offset = [], start
+        if self.arrays is not None:
+            array = self.arrays.view(block, start, end)
+            rows = self.arrays.to_rows(array)
+            offset += len(array) * self.arrays.row_size
+        append = rows.append
+
+        while end - offset >= row_length_size:
+            row_size = unpack_length(block, offset)[0]
+            if row_size < row_length_size:
+                raise ValueError(f'Bad row format: row from byte {offset} has size {row_size}.')
+            if end - offset < row_size:
+                break
+            append(decode_row(block, offset + row_length_size, offset + row_size))
+            offset += row_size
+
+        return rows, offset
+
+
+_CODECS: dict[tuple, RowCodec] = {}
+
+
+def get_codec(schema: SchemaType) -> RowCodec:
+    """Get cached codec for schema.
+
+    :param schema: row schema by cell types.
+    :return:
+    """
+    key = tuple(tuple(cell_type.schema) for cell_type in schema)
+    codec = _CODECS.get(key)
+    if codec is None:
+        codec = _CODECS[key] = RowCodec(schema)
+    return codec
 
-        result.append(struct.pack(f'={LENGTH_ROW_TYPE.schema[0].mark}{pattern}', length_bytes, *new_row))
 
-    return b''.join(result)
+def serialize(schema: SchemaType, rows: list[list[Any]]) -> bytes:
+    """Serialize data to bytes.
+
+    :param schema: row schema by cell types.
+    :param rows: list of rows.
+    :return:
+    """
+    return get_codec(schema).encode(rows)
 
 
 def deserialize(schema: SchemaType, block: bytes) -> tuple[list[list[Any]], bytes]:
@@ -226,91 +466,162 @@ def deserialize(schema: SchemaType, block: bytes) -> tuple[list[list[Any]], byte
     :param block: bytes.
     :return:
     """
-    rows = []
-    composite_indexes = {i for i, x in enumerate(schema) if x in COMPOSITE_TYPES}
+    rows, index = get_codec(schema).decode(block)
+    return rows, block[index:]
 
-    block_size = len(block)
-    row_length_size = LENGTH_ROW_TYPE.schema[0].size
-    row_size = struct.unpack('=' + LENGTH_ROW_TYPE.schema[0].mark, block[:row_length_size])[0]
-    null_flag_pattern, null_flag_size = NULL_FLAG_TYPE.schema[0].mark, NULL_FLAG_TYPE.schema[0].size
 
-    byte_index = 0
-    while block_size - byte_index >= row_size:
-        row_size -= row_length_size
-        byte_index += row_length_size
+def iter_chunks(file: BinaryIO, chunk_size: int, size: Optional[int] = None) -> Iterator[bytes]:
+    """Read opened file by chunks from current position.
 
-        row = []
-        cell_index = 0
-        is_second_composite_variable = False
-        while row_size > 0:
-            if not is_second_composite_variable:
-                is_null = struct.unpack('=' + null_flag_pattern, block[byte_index:byte_index + null_flag_size])[0]
-                row_size -= null_flag_size
-                byte_index += null_flag_size
-            else:
-                is_null = False
+    :param file: opened binary file.
+    :param chunk_size: read size.
+    :param size: number of bytes to read, by default read to end of file.
+    :return:
+    """
+    index = 0
+    while size is None or index < size:
+        data = file.read(chunk_size if size is None else min(chunk_size, size - index))
+        if len(data) == 0:
+            break
+        index += len(data)
+        yield data
 
-            if is_null:
-                value = None
-                cell_index += 1
-            else:
-                if cell_index in composite_indexes and is_second_composite_variable:
-                    value_size = row.pop()
+    if size is not None and index != size:
+        raise ValueError(f'Bad row format: file ends after {index} bytes of {size}.')
 
-                    if value_size > 0:
-                        value = struct.unpack(
-                            f'={value_size}{schema[cell_index].schema[1].mark}',
-                            block[byte_index:byte_index + value_size]
-                        )[0]
 
-                        row_size -= value_size
-                        byte_index += value_size
-                    else:
-                        value = b''
+def iter_chunk_blocks(chunks: Iterable[Buffer], schema: SchemaType) -> Iterator[tuple[list[list[Any]], int]]:
+    """Deserialize rows of chunks, incomplete row at end of chunk is continued in next chunk.
 
-                    if schema[cell_index] == CellType.STRING:
-                        value = value.decode('utf8')
+    :param chunks: parts of serialized rows.
+    :param schema: row schema by cell types.
+    :return: rows of block and their size in bytes.
+    """
+    codec = get_codec(schema)
+    head = b''
+    for data in chunks:
+        block = head + data if len(head) > 0 else data
+        rows, row_end = codec.decode(block)
+        head = block[row_end:]
+        yield rows, row_end
 
-                    cell_index += 1
-                    is_second_composite_variable = False
-                else:
-                    value_size = schema[cell_index].schema[0].size
-                    value = struct.unpack(
-                        '=' + schema[cell_index].schema[0].mark,
-                        block[byte_index:byte_index + value_size]
-                    )[0]
+    if len(head) > 0:
+        raise ValueError(f'Bad row format: file ends with incomplete row of {len(head)} bytes.')
 
-                    if schema[cell_index] == CellType.CHAR:
-                        value = value.decode('utf8')
 
-                    row_size -= value_size
-                    byte_index += value_size
+def iter_blocks(
+    file: BinaryIO, schema: SchemaType, block_size: int, size: Optional[int] = None
+) -> Iterator[tuple[list[list[Any]], int]]:
+    """Read rows of opened file by blocks from current position.
 
-                    if cell_index in composite_indexes:
-                        is_second_composite_variable = True
-                    else:
-                        cell_index += 1
+    :param file: opened binary file.
+    :param schema: row schema by cell types.
+    :param block_size: read size.
+    :param size: number of bytes to read, by default read to end of file.
+    :return: rows of block and their size in bytes.
+    """
+    yield from iter_chunk_blocks(iter_chunks(file, block_size, size), schema)
 
-            if row_size == 0 and is_second_composite_variable and value is not None:
-                if schema[-1] == CellType.STRING:
-                    value = ''
-                else:
-                    value = b''
 
-            row.append(value)
+@contextmanager
+def mapped_file(file_name: str) -> Iterator[Optional[tuple[mmap.mmap, memoryview]]]:
+    """Map file to memory for read.
 
-        rows.append(row)
+    Map is not closed while slices of view are alive, it is closed by
+    garbage collector in this case.
 
-        if block_size - byte_index >= row_length_size:
-            row_size = struct.unpack(
-                '=' + LENGTH_ROW_TYPE.schema[0].mark,
-                block[byte_index:byte_index + row_length_size]
-            )[0]
-        else:
-            break
+    :param file_name: file name.
+    :return: map and its view, None for empty file.
+    """
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield None
+            return
+
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(buffer)
+    try:
+        yield buffer, view
+    finally:
+        view.release()
+        try:
+            buffer.close()
+        except BufferError:
+            pass
+
+
+def release_pages(buffer: mmap.mmap, start: int, end: int) -> None:
+    """Drop read pages of mapped file from resident memory.
+
+    :param buffer: mapped file.
+    :param start: first byte of read range.
+    :param end: index after last byte of read range.
+    :return:
+    """
+    start -= start % mmap.PAGESIZE
+    end -= end % mmap.PAGESIZE
+    if end > start and hasattr(mmap, 'MADV_DONTNEED'):
+        buffer.madvise(mmap.MADV_DONTNEED, start, end - start)
 
-    bytes_tail = b''
-    if byte_index < block_size:
-        bytes_tail = block[byte_index:]
 
-    return rows, bytes_tail
+def iter_mapped_blocks(
+    file_name: str, schema: SchemaType, block_size: int, start: int = 0, end: Optional[int] = None
+) -> Iterator[tuple[list[list[Any]], int]]:
+    """Read rows of file by blocks through memory map without copy of bytes.
+
+    Rows are decoded straight from the mapped file, row bigger than block
+    size is read as one block. Pages of read blocks are released.
+
+    :param file_name: file name.
+    :param schema: row schema by cell types.
+    :param block_size: block size.
+    :param start: first byte.
+    :param end: index after last byte, by default size of file.
+    :return: rows of block and their size in bytes.
+    """
+    codec = get_codec(schema)
+    with mapped_file(file_name) as mapped:
+        if mapped is None:
+            return
+        buffer, view = mapped
+        end = len(buffer) if end is None else end
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            buffer.madvise(mmap.MADV_SEQUENTIAL)
+
+        index = start
+        while index < end:
+            rows, row_end = codec.decode(view, index, min(index + block_size, end))
+            if row_end == index and end - index >= codec.row_length.size:
+                row_size = codec.row_length.unpack_from(view, index)[0]
+                rows, row_end = codec.decode(view, index, min(index + row_size, end))
+            if row_end == index:
+                raise ValueError(f'Bad row format: file {file_name} ends with incomplete row of {end - index} bytes.')
+
+            yield rows, row_end - index
+            release_pages(buffer, index, row_end)
+            index = row_end
+
+
+def iter_rows(
+    file_or_path: Union[str, BinaryIO], schema: SchemaType, block_size: int, batches: bool = False
+) -> Iterator[Union[list[Any], list[list[Any]]]]:
+    """Read rows lazily by blocks.
+
+    :param file_or_path: file name or opened binary file, opened file is read from current position.
+    :param schema: row schema by cell types.
+    :param block_size: read size.
+    :param batches: yield lists of rows of every block instead of rows.
+    :return:
+    """
+    if isinstance(file_or_path, str):
+        blocks = iter_mapped_blocks(file_or_path, schema, block_size)
+    else:
+        blocks = iter_blocks(file_or_path, schema, block_size)
+
+    for rows, _ in blocks:
+        if batches:
+            if len(rows) > 0:
+                yield rows
+        else:
+            yield from rows
@@ -0,0 +1,158 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from collections.abc import Iterable, Iterator
+from collections import namedtuple
+
+
+READ = 'read'
+DESERIALIZE = 'deserialize'
+SORT = 'sort'
+COMPARE = 'compare'
+SERIALIZE = 'serialize'
+WRITE = 'write'
+PHASES = (READ, DESERIALIZE, SORT, COMPARE, SERIALIZE, WRITE)
+
+RUN_EVENT = 'run'
+MERGE_EVENT = 'merge'
+
+# event of finished run or merge, file name is None for merge streamed to consumer
+SortEvent = namedtuple('SortEvent', 'kind pass_number file_name size stats')
+
+_END = object()
+
+
+@dataclass
+class PassStats:
+    """Bytes of one pass of sort: run generation or merge pass."""
+    runs: int = 0
+    read_bytes: int = 0
+    written_bytes: int = 0
+
+
+@dataclass
+class SortStats:
+    """Time of sort phases, passes and temporary files of sort.
+
+    Time of phases is exclusive: time of read inside of deserialize is
+    counted only as read. Reads of mapped files are counted as deserialize,
+    compare is time of merge which is not read, deserialize, serialize or
+    write, in raw merge it has decode of sort columns. Time of workers is
+    summed.
+    """
+    read_seconds: float = 0.0
+    deserialize_seconds: float = 0.0
+    sort_seconds: float = 0.0
+    compare_seconds: float = 0.0
+    serialize_seconds: float = 0.0
+    write_seconds: float = 0.0
+    passes: list[PassStats] = field(default_factory=list)
+    temp_files: int = 0
+    temp_bytes: int = 0
+    peak_temp_files: int = 0
+    peak_temp_bytes: int = 0
+    _phase: Optional[str] = field(default=None, repr=False, compare=False)
+    _phase_start: float = field(default=0.0, repr=False, compare=False)
+
+    @property
+    def runs(self) -> int:
+        """Number of runs of run generation.
+
+        :return:
+        """
+        return self.passes[0].runs if len(self.passes) > 0 else 0
+
+    @property
+    def merge_passes(self) -> int:
+        """Number of merge passes, the last merge is a pass too.
+
+        :return:
+        """
+        return max(len(self.passes) - 1, 0)
+
+    @property
+    def seconds(self) -> float:
+        """Time of all phases.
+
+        :return:
+        """
+        return sum(getattr(self, f'{x}_seconds') for x in PHASES)
+
+    def add(self, other: 'SortStats') -> None:
+        """Add time of phases of other object, for example of worker process.
+
+        Passes and temporary files are counted by process which runs sort.
+
+        :param other: statistics.
+        :return:
+        """
+        for phase in PHASES:
+            name = f'{phase}_seconds'
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def _add_time(self, now: float) -> None:
+        if self._phase is not None:
+            name = f'{self._phase}_seconds'
+            setattr(self, name, getattr(self, name) + now - self._phase_start)
+        self._phase_start = now
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Count time of block as phase, time of nested phases is not counted.
+
+        :param phase: phase name.
+        :return:
+        """
+        previous = self._phase
+        self._add_time(time.perf_counter())
+        self._phase = phase
+        try:
+            yield
+        finally:
+            self._add_time(time.perf_counter())
+            self._phase = previous
+
+    def iter_measured(self, items: Iterable[Any], phase: str) -> Iterator[Any]:
+        """Count time of getting of every item as phase, time of consumer is not counted.
+
+        :param items: items, for example lazy read blocks.
+        :param phase: phase name.
+        :return:
+        """
+        items = iter(items)
+        while True:
+            with self.measure(phase):
+                item = next(items, _END)
+            if item is _END:
+                return
+            yield item
+
+    def start_pass(self) -> PassStats:
+        """Start pass of sort.
+
+        :return:
+        """
+        self.passes.append(PassStats())
+        return self.passes[-1]
+
+    def add_temp_file(self, size: int) -> None:
+        """Count new temporary file.
+
+        :param size: file size.
+        :return:
+        """
+        self.temp_files += 1
+        self.temp_bytes += size
+        self.peak_temp_files = max(self.peak_temp_files, self.temp_files)
+        self.peak_temp_bytes = max(self.peak_temp_bytes, self.temp_bytes)
+
+    def remove_temp_files(self, files: int, size: int) -> None:
+        """Count removed temporary files.
+
+        :param files: number of files.
+        :param size: size of files.
+        :return:
+        """
+        self.temp_files -= files
+        self.temp_bytes -= size
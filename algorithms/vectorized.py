@@ -0,0 +1,178 @@
+from operator import itemgetter
+from typing import Any, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NUMPY_TYPE_BY_STRUCT_MARK = {
+    'c': 'u1', 'b': 'i1', 'B': 'u1', '?': '?',
+    'h': 'i2', 'H': 'u2', 'e': 'f2',
+    'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4', 'f': 'f4',
+    'q': 'i8', 'Q': 'u8', 'd': 'f8',
+}
+CHAR_MARK = 'c'
+BOOL_MARK = '?'
+FLOAT_MARKS = ('e', 'f', 'd')
+# finite python float can overflow to infinity in these types
+NARROW_FLOAT_MARKS = ('e', 'f')
+
+MIN_VECTOR_ROWS = 16
+
+
+def _fits(values: Any, mark: str) -> bool:
+    """Check that numpy converts values of column to type of mark as struct does.
+
+    :param values: array of column.
+    :param mark: struct mark of integer or float cell.
+    :return:
+    """
+    kind = values.dtype.kind
+    if mark in FLOAT_MARKS:
+        return kind in 'biuf'
+    if kind not in 'biu':
+        return False
+    limits = np.iinfo(NUMPY_TYPE_BY_STRUCT_MARK[mark])
+    return len(values) == 0 or (values.min() >= limits.min and values.max() <= limits.max)
+
+
+class RowArrays:
+    """Vectorized encoder and decoder of rows without nulls for schema with fixed size cells.
+
+    Row without nulls always has the same size, so block of such rows is
+    array of numpy structured type: length prefix, null flag and value of
+    every cell.
+    """
+
+    def __init__(self, marks: list[str], length_mark: str, null_flag_mark: str):
+        """Build structured type.
+
+        :param marks: struct marks of cells.
+        :param length_mark: struct mark of row length.
+        :param null_flag_mark: struct mark of null flag.
+        """
+        self.marks = marks
+        fields = [('length', '=' + NUMPY_TYPE_BY_STRUCT_MARK[length_mark])]
+        for index, mark in enumerate(marks):
+            fields.append((f'null_{index}', '=' + NUMPY_TYPE_BY_STRUCT_MARK[null_flag_mark]))
+            fields.append((f'cell_{index}', '=' + NUMPY_TYPE_BY_STRUCT_MARK[mark]))
+        self.dtype = np.dtype(fields)
+        self.row_size = self.dtype.itemsize
+
+    @classmethod
+    def build(cls, marks: list[str], length_mark: str, null_flag_mark: str) -> Optional['RowArrays']:
+        """Build object if numpy is installed and all cells have fixed size.
+
+        :param marks: struct marks of cells.
+        :param length_mark: struct mark of row length.
+        :param null_flag_mark: struct mark of null flag.
+        :return:
+        """
+        if np is None or len(marks) == 0 or any(x not in NUMPY_TYPE_BY_STRUCT_MARK for x in marks):
+            return None
+        return cls(marks, length_mark, null_flag_mark)
+
+    def view(self, block: Any, start: int = 0, end: Optional[int] = None) -> Any:
+        """View longest prefix of rows without nulls as array without copy.
+
+        Row with null is shorter, so rows before the first row with other
+        length prefix are exactly at multiples of row size.
+
+        :param block: bytes.
+        :param start: index of first byte.
+        :param end: index after last byte, by default length of block.
+        :return:
+        """
+        end = len(block) if end is None else end
+        count = (end - start) // self.row_size
+        if count < MIN_VECTOR_ROWS:
+            return np.empty(0, self.dtype)
+
+        array = np.frombuffer(block, self.dtype, count, start)
+        is_full = array['length'] == self.row_size
+        if not is_full.all():
+            array = array[:int(is_full.argmin())]
+        return array
+
+    def to_rows(self, array: Any) -> list[list[Any]]:
+        """Convert array to rows.
+
+        :param array: array of rows.
+        :return:
+        """
+        columns = []
+        for index, mark in enumerate(self.marks):
+            column = array[f'cell_{index}'].tolist()
+            if mark == CHAR_MARK:
+                column = list(map(chr, column))
+            columns.append(column)
+        return list(map(list, zip(*columns)))
+
+    def from_rows(self, rows: list[list[Any]]) -> Optional[Any]:
+        """Convert rows to array.
+
+        :param rows: list of rows.
+        :return: None if some row has null or value which struct does not pack, so struct reports error of value.
+        """
+        columns = [list(map(itemgetter(index), rows)) for index in range(len(self.marks))]
+        if any(None in column for column in columns):
+            return None
+
+        array = np.empty(len(rows), self.dtype)
+        array['length'] = self.row_size
+        for index, (mark, column) in enumerate(zip(self.marks, columns)):
+            if mark == CHAR_MARK:
+                column = [x.encode('utf8') for x in column]
+                assert all(len(x) == 1 for x in column), 'Type CHAR used only for 1 byte characters.'
+                column = [x[0] for x in column]
+            elif mark != BOOL_MARK:
+                column = np.array(column)
+                if not _fits(column, mark):
+                    return None
+            array[f'null_{index}'] = False
+            with np.errstate(over='ignore'):
+                array[f'cell_{index}'] = column
+            if mark in NARROW_FLOAT_MARKS and (np.isinf(array[f'cell_{index}']) & np.isfinite(column)).any():
+                return None
+        return array
+
+    def sort_order(self, array: Any, sort_keys: list[Any]) -> Any:
+        """Stable order of rows by sort keys.
+
+        :param array: array of rows.
+        :param sort_keys: sort keys from high to low power.
+        :return: indexes of rows in sorted order.
+        """
+        columns = []
+        for sort_key in reversed(sort_keys):
+            column = array[f'cell_{sort_key.index}']
+            mark = self.marks[sort_key.index]
+            if not sort_key.is_ascending_order:
+                column = -column if mark in FLOAT_MARKS else ~column
+            columns.append(column)
+
+        if len(columns) == 1:
+            return np.argsort(columns[0], kind='stable')
+        return np.lexsort(columns)
+
+    def distinct_indexes(self, array: Any, sort_keys: list[Any], is_whole_row: bool) -> Any:
+        """Indexes of first rows with distinct keys or distinct whole rows of sorted array.
+
+        :param array: array of rows sorted by sort keys.
+        :param sort_keys: sort keys.
+        :param is_whole_row: compare bytes of whole rows instead of sort keys.
+        :return: increasing indexes of rows.
+        """
+        if is_whole_row:
+            _, indexes = np.unique(array.view(np.dtype((np.void, self.row_size))), return_index=True)
+            return np.sort(indexes)
+
+        is_first = np.ones(len(array), dtype=bool)
+        if len(array) > 1:
+            is_first[1:] = False
+            for sort_key in sort_keys:
+                column = array[f'cell_{sort_key.index}']
+                is_first[1:] |= column[1:] != column[:-1]
+        return np.flatnonzero(is_first)
@@ -0,0 +1,51 @@
+"""Benchmark for serialize and deserialize on the test data set.
+
+Run from the repository root:
+
+    python benchmark/serialize_benchmark.py
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.abspath(__file__))), 'test'))
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from algorithms import serialize, deserialize  # noqa: E402
+from util import generate_ordered_data  # noqa: E402
+
+
+def _best_time(function, repeat: int) -> float:
+    """Run function several times and return the best wall time.
+
+    :param function: function without arguments.
+    :param repeat: number of runs.
+    :return:
+    """
+    result = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def main(repeat: int = 3) -> None:
+    """Print rows per second for serialize and deserialize.
+
+    :param repeat: number of runs for every measure.
+    :return:
+    """
+    schema, data = generate_ordered_data()
+    raw_data = serialize(schema, data)
+
+    serialize_time = _best_time(lambda: serialize(schema, data), repeat)
+    deserialize_time = _best_time(lambda: deserialize(schema, raw_data), repeat)
+
+    print(f'rows: {len(data)}, bytes: {len(raw_data)}')
+    print(f'serialize: {serialize_time:.3f} s, {len(data) / serialize_time:,.0f} rows/s')
+    print(f'deserialize: {deserialize_time:.3f} s, {len(data) / deserialize_time:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""Benchmark suite for serialize, deserialize and external sort on synthetic data sets.
+
+Every data shape is measured for serialize, deserialize and split_file,
+and for merge_files and merge_sort at every block size. Results are
+written as JSON, so runs of different commits can be compared.
+
+Run from the repository root:
+
+    python benchmark/suite.py --output before.json
+    python benchmark/suite.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from operator import itemgetter
+from os import path
+from typing import Any, Optional
+from collections.abc import Callable
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from algorithms import (  # noqa: E402
+    CellType, SchemaType, SortKey, SortInfo, build_sort_key, serialize, deserialize, merge_sort, split_file,
+    merge_files,
+)
+
+SHAPES = ('numeric', 'strings', 'nulls', 'presorted', 'reversed', 'duplicates')
+BLOCK_SIZES = (2 ** 18, 2 ** 20, 2 ** 22)
+# keys without nulls are compared as tuples, the first column of nulls shape has nulls, so its keys are normalized
+SORT_KEYS = [SortKey(0)]
+NULL_SORT_KEYS = [SortKey(0, True, True)]
+
+_NUMERIC_SCHEMA = [CellType.LONG_LONG, CellType.DOUBLE, CellType.INT, CellType.UNSIGNED_SHORT, CellType.BOOL]
+_STRING_SCHEMA = [CellType.STRING, CellType.STRING, CellType.STRING, CellType.INT]
+_NULL_SCHEMA = [CellType.LONG_LONG, CellType.STRING, CellType.DOUBLE, CellType.INT, CellType.STRING]
+_NULL_FRACTION = 0.8
+_DUPLICATE_KEYS = 16
+
+
+def _random_string(random_: random.Random, min_length: int = 5, max_length: int = 40) -> str:
+    return ''.join(random_.choices(string.ascii_letters, k=random_.randint(min_length, max_length)))
+
+
+def _numeric_row(random_: random.Random) -> list[Any]:
+    return [
+        random_.randrange(-2 ** 63, 2 ** 63), random_.random(), random_.randrange(-2 ** 31, 2 ** 31),
+        random_.randrange(2 ** 16), random_.random() < 0.5,
+    ]
+
+
+def generate_data(shape: str, rows: int, seed: int = 0) -> tuple[SchemaType, list[list[Any]]]:
+    """Generate synthetic data set, the first column is sort key.
+
+    :param shape: numeric, strings (string-heavy rows), nulls (most cells are null), presorted, reversed (numeric
+        rows in order or reverse order of key) or duplicates (numeric rows with few distinct keys).
+    :param rows: number of rows.
+    :param seed: seed of random values.
+    :return: schema and rows.
+    """
+    assert shape in SHAPES, f'Unknown data shape "{shape}"'
+    random_ = random.Random(seed)
+
+    if shape == 'strings':
+        return _STRING_SCHEMA, [
+            [_random_string(random_), _random_string(random_), _random_string(random_, 0, 200),
+             random_.randrange(-2 ** 31, 2 ** 31)]
+            for _ in range(rows)
+        ]
+
+    if shape == 'nulls':
+        data = []
+        for _ in range(rows):
+            row = [
+                random_.randrange(-2 ** 63, 2 ** 63), _random_string(random_), random_.random(),
+                random_.randrange(-2 ** 31, 2 ** 31), _random_string(random_),
+            ]
+            data.append([None if random_.random() < _NULL_FRACTION else x for x in row])
+        return _NULL_SCHEMA, data
+
+    data = [_numeric_row(random_) for _ in range(rows)]
+    if shape == 'presorted':
+        data.sort(key=lambda x: x[0])
+    elif shape == 'reversed':
+        data.sort(key=lambda x: x[0], reverse=True)
+    elif shape == 'duplicates':
+        for row in data:
+            row[0] %= _DUPLICATE_KEYS
+    return _NUMERIC_SCHEMA, data
+
+
+def _written_bytes() -> Optional[int]:
+    """Bytes passed to write calls by this process, known only on Linux.
+
+    :return:
+    """
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                name, value = line.split(':')
+                if name == 'wchar':
+                    return int(value)
+    except OSError:
+        pass
+    return None
+
+
+def _measure(
+    function: Callable[[], Any], repeat: int, memory: bool, teardown: Optional[Callable[[Any], None]] = None
+) -> dict[str, Any]:
+    """Measure the best wall time of function, peak memory and bytes written by the best run.
+
+    Peak memory is measured by separate run with allocation tracing, it
+    counts memory of python objects and buffers of this process.
+
+    :param function: function without arguments.
+    :param repeat: number of timed runs.
+    :param memory: measure peak memory.
+    :param teardown: function of function result which cleans after every run, it is not timed.
+    :return: seconds, peak memory and written bytes, peak memory is None if it is not measured.
+    """
+    def run() -> tuple[float, Optional[int]]:
+        written = _written_bytes()
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+        if written is not None:
+            written = _written_bytes() - written
+        if teardown is not None:
+            teardown(result)
+        return seconds, written
+
+    seconds, written = min((run() for _ in range(repeat)), key=itemgetter(0))
+
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak_memory': peak_memory, 'written_bytes': written}
+
+
+def _remove(file_name: str) -> None:
+    if path.exists(file_name):
+        os.remove(file_name)
+
+
+def run_shape(
+    shape: str, rows: int, block_sizes: list[int], tmp_directory: str, repeat: int, memory: bool
+) -> list[dict[str, Any]]:
+    """Run all benchmarks of one data shape.
+
+    Temporary bytes of sort are bytes written by the process except
+    result file.
+
+    :param shape: data shape.
+    :param rows: number of rows.
+    :param block_sizes: block sizes of merge_files and merge_sort.
+    :param tmp_directory: temporary directory.
+    :param repeat: number of timed runs of every benchmark.
+    :param memory: measure peak memory.
+    :return: results.
+    """
+    schema, data = generate_data(shape, rows)
+    raw_data = serialize(schema, data)
+    file_name = path.join(tmp_directory, f'{shape}_input')
+    with open(file_name, 'wb') as file:
+        file.write(raw_data)
+    sort_keys = NULL_SORT_KEYS if shape == 'nulls' else SORT_KEYS
+    key = build_sort_key(schema, sort_keys)
+
+    results = []
+
+    def add(benchmark: str, measure: dict[str, Any], block_size: Optional[int] = None,
+            result_size: int = 0) -> None:
+        written = measure.pop('written_bytes')
+        results.append({
+            'benchmark': benchmark, 'shape': shape, 'rows': len(data), 'bytes': len(raw_data),
+            'block_size': block_size, **measure,
+            'rows_per_second': len(data) / measure['seconds'] if measure['seconds'] > 0 else None,
+            'temp_bytes': None if written is None or result_size == 0 else max(written - result_size, 0),
+        })
+
+    add('serialize', _measure(lambda: serialize(schema, data), repeat, memory))
+    add('deserialize', _measure(lambda: deserialize(schema, raw_data), repeat, memory))
+
+    info = SortInfo(schema, sort_keys, tmp_directory, BLOCK_SIZES[0], file_name)
+    add('split_file', _measure(lambda: split_file(file_name, info), repeat, memory))
+
+    # two sorted halves in one file are merged as segments, so input is kept
+    middle = len(data) // 2
+    runs_file_name = path.join(tmp_directory, f'{shape}_runs')
+    with open(runs_file_name, 'wb') as file:
+        file.write(serialize(schema, sorted(data[:middle], key=key)))
+        middle_offset = file.tell()
+        file.write(serialize(schema, sorted(data[middle:], key=key)))
+    segments = split_file(runs_file_name, info)
+    segments = segments[0]._replace(end=middle_offset), segments[1]._replace(start=middle_offset)
+
+    for block_size in block_sizes:
+        info = SortInfo(schema, sort_keys, tmp_directory, block_size, runs_file_name)
+        add('merge_files', _measure(lambda: merge_files(*segments, info), repeat, memory, teardown=_remove),
+            block_size)
+
+        def sort() -> str:
+            return merge_sort(file_name, schema, sort_keys, tmp_directory, block_size)
+
+        # result of sort has the same size as input
+        add('merge_sort', _measure(sort, repeat, memory, teardown=_remove), block_size, len(raw_data))
+
+    os.remove(runs_file_name)
+    os.remove(file_name)
+    return results
+
+
+def _commit() -> Optional[str]:
+    """Commit of repository, None outside of git repository.
+
+    :return:
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=path.dirname(path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _result_key(result: dict[str, Any]) -> tuple:
+    return result['benchmark'], result['shape'], result['rows'], result['block_size']
+
+
+def compare(old_report: dict[str, Any], new_report: dict[str, Any]) -> list[str]:
+    """Compare times of two reports.
+
+    :param old_report: report of previous run.
+    :param new_report: report of current run.
+    :return: lines with speedup of every benchmark which is in both reports.
+    """
+    old_results = {_result_key(x): x for x in old_report['results']}
+    lines = []
+    for result in new_report['results']:
+        old_result = old_results.get(_result_key(result))
+        if old_result is None or result['seconds'] == 0:
+            continue
+        benchmark, shape, _, block_size = _result_key(result)
+        lines.append(
+            f'{benchmark:12} {shape:11} {block_size or "":>8}: {old_result["seconds"]:.3f} s -> '
+            f'{result["seconds"]:.3f} s, x{old_result["seconds"] / result["seconds"]:.2f}'
+        )
+    return lines
+
+
+def main() -> None:
+    """Run suite, print results and write JSON report.
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=100_000, help='number of rows of every data set')
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES), help='data shapes')
+    parser.add_argument('--block-sizes', nargs='+', type=int, default=list(BLOCK_SIZES), help='block sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs, the best time is reported')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+    parser.add_argument('--output', help='JSON report file name')
+    parser.add_argument('--compare', help='JSON report of previous run')
+    arguments = parser.parse_args()
+
+    report = {
+        'commit': _commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+        'rows': arguments.rows, 'repeat': arguments.repeat, 'results': [],
+    }
+    tmp_directory = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        for shape in arguments.shapes:
+            for result in run_shape(
+                shape, arguments.rows, arguments.block_sizes, tmp_directory, arguments.repeat,
+                not arguments.no_memory
+            ):
+                report['results'].append(result)
+                print(
+                    f'{result["benchmark"]:12} {shape:11} {result["block_size"] or "":>8}: '
+                    f'{result["seconds"]:.3f} s, {result["rows_per_second"] or 0:,.0f} rows/s', flush=True
+                )
+    finally:
+        shutil.rmtree(tmp_directory)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as file:
+            print('\n'.join(compare(json.load(file), report)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import os
+import threading
+from os import path
+
+from algorithms import serialize, deserialize, iter_sorted, merge_sort, CompressionStats
+from algorithms.background import BackgroundWriter, iter_prefetched
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+def test_iter_prefetched():
+    assert list(iter_prefetched(iter(range(100)), 3)) == list(range(100))
+
+    def fail():
+        yield 1
+        raise ValueError('read error')
+
+    with pytest.raises(ValueError, match='read error'):
+        list(iter_prefetched(fail()))
+
+    is_closed = threading.Event()
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            is_closed.set()
+
+    items = iter_prefetched(endless())
+    assert [next(items) for _ in range(10)] == list(range(10))
+    items.close()
+    assert is_closed.is_set()
+
+
+def test_background_writer():
+    blocks = []
+    writer = BackgroundWriter(blocks.append)
+    for i in range(100):
+        writer.write(i)
+    writer.close()
+    assert blocks == list(range(100))
+
+    def fail(block):
+        raise OSError('disk is full')
+
+    writer = BackgroundWriter(fail)
+    writer.write(0)
+    with pytest.raises(OSError, match='disk is full'):
+        writer.close()
+
+
+@pytest.mark.parametrize('workers, raw_merge, compression', [
+    (1, True, None), (1, False, None), (2, True, 'zlib'), (1, False, 'zlib'),
+])
+def test_merge_sort_background_io(ordered_data, workers, raw_merge, compression):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_background_io')
+    schema, data = ordered_data
+    data = data[::-5]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_background_io_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    stats = CompressionStats()
+    sorted_file_name = merge_sort(
+        file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3, workers=workers, raw_merge=raw_merge,
+        compression=compression, compression_stats=stats, background_io=True
+    )
+    assert os.listdir(tmp_directory) == [path.basename(sorted_file_name)]
+    assert compression is None or stats.raw_read == stats.raw_written > 0
+
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_file_name)
+
+    rows = list(iter_sorted(
+        file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3, raw_merge=raw_merge, compression=compression,
+        background_io=True
+    ))
+    assert len(os.listdir(tmp_directory)) == 0
+
+    data.sort(key=lambda x: (x[16], x[9]))
+    assert check_equal_data(data, new_data)
+    assert check_equal_data(data, rows)
@@ -0,0 +1,52 @@
+from algorithms import serialize, build_sort_key, SortKey
+from algorithms.columns import ColumnBatch
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+@pytest.mark.parametrize('sort_keys', [
+    [SortKey(16), SortKey(9)],
+    [SortKey(0, False), SortKey(15), SortKey(10, False)],
+    [SortKey(14, True, True), SortKey(13, False, False), SortKey(11, True, False)],
+    [SortKey(1, False, True), SortKey(3, True, False), SortKey(2)],
+])
+def test_column_batch(ordered_data, sort_keys):
+    schema, data = ordered_data
+    data = data[::-7]
+    block = serialize(schema, data)
+    start = 100
+    block = bytes(start) + block
+
+    batch = ColumnBatch(schema, sorted({x.index for x in sort_keys}))
+    middle = len(serialize(schema, data[:len(data) // 2])) + start
+    batch.extend(block, start, middle)
+    batch.extend(block, middle, len(block))
+    assert len(batch) == len(data)
+
+    order = batch.sort_order(sort_keys)
+    new_data = [data[x] for x in order]
+    data.sort(key=build_sort_key(schema, sort_keys))
+    assert check_equal_data(data, new_data)
+
+    blocks = list(batch.iter_blocks(block, start, order, 1000))
+    assert len(blocks) == -(-len(data) // 1000)
+    assert b''.join(blocks) == serialize(schema, new_data)
+
+
+def test_column_batch_nulls(ordered_data):
+    schema, data = ordered_data
+    block = serialize(schema, data[:100])
+
+    batch = ColumnBatch(schema, [1])
+    batch.extend(block, 0, len(block))
+    assert batch.has_nulls(0) and batch.is_null(0)(0) and not batch.is_null(0)(1)
+    with pytest.raises(TypeError):
+        batch.sort_order([SortKey(1)])
+
+    with pytest.raises(ValueError):
+        ColumnBatch(schema, [1]).extend(block, 0, len(block) - 1)
@@ -0,0 +1,74 @@
+import os
+import zlib
+from os import path
+
+from algorithms import serialize, deserialize, iter_sorted, merge_sort, Compression, CompressionStats, COMPRESSIONS
+from algorithms.compression import RunWriter, read_compression, iter_frames
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+@pytest.mark.parametrize('compression', [*COMPRESSIONS.values(), Compression('custom', zlib.compress, zlib.decompress)])
+def test_run_writer(ordered_data, compression):
+    file_name = path.join('.', 'test', 'data', 'test_run_writer')
+    schema, data = ordered_data
+    blocks = [serialize(schema, data[i:i + 1000]) for i in range(0, len(data), 1000)]
+
+    stats = CompressionStats()
+    with RunWriter(file_name, compression, stats, 2 ** 16) as run_file:
+        for block in blocks:
+            run_file.write(block)
+
+    assert read_compression(file_name, compression) == compression
+    assert stats.raw_written == sum(len(x) for x in blocks)
+    assert stats.compressed_written < os.path.getsize(file_name) < stats.raw_written
+
+    frames = list(iter_frames(file_name, compression, stats))
+    assert len(frames) > 1
+    assert b''.join(frames) == b''.join(blocks)
+    assert stats.raw_read == stats.raw_written and stats.compressed_read == stats.compressed_written
+
+    new_data = []
+    for frame in frames:
+        rows, byte_tail = deserialize(schema, frame)
+        assert len(byte_tail) == 0
+        new_data.extend(rows)
+    assert check_equal_data(data, new_data)
+
+
+@pytest.mark.parametrize('workers, raw_merge', [(1, True), (2, False)])
+def test_merge_sort_compression(ordered_data, workers, raw_merge):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_compression')
+    schema, data = ordered_data
+    data = data[::-5]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+    assert read_compression(file_name) is None
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_compression_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    stats = CompressionStats()
+    sorted_file_name = merge_sort(
+        file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3, workers=workers, raw_merge=raw_merge,
+        compression='zlib', compression_stats=stats
+    )
+    assert os.listdir(tmp_directory) == [path.basename(sorted_file_name)]
+    assert stats.ratio > 2 and stats.saved_bytes > 0 and stats.cpu_seconds > 0
+
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_file_name)
+
+    rows = list(iter_sorted(file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3, compression='lzma'))
+    assert len(os.listdir(tmp_directory)) == 0
+
+    data.sort(key=lambda x: (x[16], x[9]))
+    assert check_equal_data(data, new_data)
+    assert check_equal_data(data, rows)
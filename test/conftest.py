@@ -0,0 +1,13 @@
+import os
+from os import path
+
+import pytest
+
+
+@pytest.fixture(autouse=True, scope='session')
+def data_directory():
+    """Create directory of test files, test files are not tracked.
+
+    :return:
+    """
+    os.makedirs(path.join('.', 'test', 'data'), exist_ok=True)
@@ -0,0 +1,128 @@
+import os
+from os import path
+
+from algorithms import (
+    CellType, SortKey, SortInfo, serialize, deserialize, merge_sort, merge_files, iter_sorted, top_k, iter_rows,
+    FORMAT_V1, FORMAT_V2, FileReader, RowCodecV2, detect_format, write_file, convert_file,
+)
+from algorithms.formats import encode_varint, decode_varint
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+def test_varint():
+    for value in [0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 - 1]:
+        data = b'\xff' + encode_varint(value) + b'\xff'
+        assert decode_varint(data, 1) == (value, len(data) - 1)
+    assert len(encode_varint(127)) == 1 and len(encode_varint(128)) == 2
+
+
+def test_row_codec_v2(ordered_data):
+    schema, data = ordered_data
+    data = data[::3]
+    codec = RowCodecV2(schema)
+    raw_data = codec.encode(data)
+    assert check_equal_data(data, codec.decode(raw_data))
+    assert len(raw_data) < len(serialize(schema, data))
+
+    schema = [CellType.STRING, CellType.INT, CellType.CHAR, CellType.DOUBLE, CellType.BYTES, CellType.STRING]
+    data = [
+        ['', None, 'a', 1.5, b'', ''],
+        [None, 3, None, None, b'\x00\x01', 'xyz' * 100],
+        ['юникод', -1, 'b', None, None, None],
+    ]
+    raw_data = RowCodecV2(schema).encode(data)
+    assert RowCodecV2(schema).decode(raw_data) == data
+    with pytest.raises(ValueError):
+        RowCodecV2(schema).decode(raw_data, 0, len(raw_data) - 1)
+
+
+def test_v2_file(ordered_data):
+    schema, data = ordered_data
+    data = data[::7]
+    v1_file_name = path.join('.', 'test', 'data', 'test_v2_file_v1')
+    file_name = path.join('.', 'test', 'data', 'test_v2_file')
+    with open(v1_file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+    assert detect_format(v1_file_name) == FORMAT_V1
+
+    sort_keys = [SortKey(16), SortKey(1, False, True)]
+    write_file(file_name, schema, data, sort_keys, block_rows=1000)
+    assert detect_format(file_name) == FORMAT_V2
+    assert path.getsize(file_name) < path.getsize(v1_file_name)
+
+    reader = FileReader(file_name)
+    assert reader.schema == schema and reader.sort_keys == sort_keys and reader.rows == len(data)
+    assert [x.rows for x in reader.blocks] == [1000] * (len(data) // 1000) + [len(data) % 1000]
+    assert check_equal_data(data, list(iter_rows(file_name, schema, 2 ** 12)))
+    assert check_equal_data(data[:1000], next(iter_rows(file_name, schema, 2 ** 12, batches=True)))
+
+    # file is sorted by the first sort key, so only blocks with the key are read
+    low, high = data[len(data) // 3][16], data[len(data) // 2][16]
+    rows = list(reader.range_scan(low, high))
+    assert check_equal_data([x for x in data if low <= x[16] < high], rows)
+    low_key, high_key = reader._encode_key(low), reader._encode_key(high)
+    assert sum(len(x) for x in reader.iter_blocks(low_key, high_key)) < len(data) // 4
+
+    convert_file(file_name, schema, v1_file_name + '_copy', FORMAT_V1)
+    with open(v1_file_name, 'rb') as file, open(v1_file_name + '_copy', 'rb') as copy_file:
+        assert file.read() == copy_file.read()
+    convert_file(v1_file_name, schema, file_name + '_copy', FORMAT_V2, sort_keys, 2 ** 12)
+    copy_reader = FileReader(file_name + '_copy')
+    assert copy_reader.rows == len(data) and copy_reader.blocks[0].min_key == reader.blocks[0].min_key
+    assert check_equal_data(data, list(iter_rows(file_name + '_copy', schema, 2 ** 12)))
+    for name in (v1_file_name, v1_file_name + '_copy', file_name + '_copy'):
+        os.remove(name)
+
+
+def test_merge_sort_v2(ordered_data):
+    schema, data = ordered_data
+    data = data[::-5]
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_v2')
+    write_file(file_name, schema, data)
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_v2_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    sorted_file_name = merge_sort(file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3)
+    assert os.listdir(tmp_directory) == [path.basename(sorted_file_name)]
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_file_name)
+
+    rows = list(iter_sorted(file_name, schema, [16, 9], tmp_directory, 2 ** 18, fan_in=3))
+    first_rows = list(top_k(file_name, schema, [16, 9], 10, tmp_directory, 2 ** 18))
+    assert len(os.listdir(tmp_directory)) == 0
+
+    data.sort(key=lambda x: (x[16], x[9]))
+    assert check_equal_data(data, new_data)
+    assert check_equal_data(data, rows)
+    assert check_equal_data(data[:10], first_rows)
+
+
+def test_merge_files_v2(ordered_data):
+    schema, data = ordered_data
+    data = sorted(data[::5], key=lambda x: x[16])
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_files_v2_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    left_file_name = path.join(tmp_directory, 'left')
+    right_file_name = path.join(tmp_directory, 'right')
+    write_file(left_file_name, schema, data[::2], [16])
+    write_file(right_file_name, schema, data[1::2], [16])
+
+    info = SortInfo(schema, [SortKey(16)], tmp_directory, 2 ** 18)
+    merged_file_name = merge_files(left_file_name, right_file_name, info)
+    assert os.listdir(tmp_directory) == [path.basename(merged_file_name)]
+    assert detect_format(merged_file_name) == FORMAT_V1
+    with open(merged_file_name, 'rb') as merged_file:
+        new_data, byte_tail = deserialize(schema, merged_file.read())
+        assert len(byte_tail) == 0
+    os.remove(merged_file_name)
+
+    assert [x[16] for x in new_data] == [x[16] for x in data]
+    assert check_equal_data(sorted(data, key=str), sorted(new_data, key=str))
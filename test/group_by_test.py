@@ -0,0 +1,113 @@
+import importlib
+import os
+import random
+from os import path
+
+from algorithms import CellType, Aggregation, serialize, deserialize, group_by, group_by_schema
+from algorithms.group_by import MIN_GROUP_READ_SIZE
+import pytest
+
+
+def generate_group_data(rows_number: int, keys_number: int) -> tuple[list, list[list]]:
+    """Generate rows with repeated keys and nulls.
+
+    :param rows_number: number of rows.
+    :param keys_number: number of distinct keys.
+    :return:
+    """
+    schema = [CellType.STRING, CellType.INT, CellType.SHORT, CellType.DOUBLE]
+    rng = random.Random(11)
+    data = [
+        [
+            f'k{rng.randint(0, keys_number)}', rng.randint(0, 3),
+            None if rng.random() < 0.1 else rng.randint(-100, 100), float(rng.randint(0, 10)),
+        ]
+        for _ in range(rows_number)
+    ]
+    return schema, data
+
+
+@pytest.mark.parametrize('keys_number, memory_budget', [(50, 2 ** 20), (5000, 2 ** 16)])
+def test_group_by(keys_number, memory_budget):
+    tmp_directory = path.join('.', 'test', 'data', 'test_group_by_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    file_name = path.join('.', 'test', 'data', 'test_group_by')
+    schema, data = generate_group_data(30000, keys_number)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    aggregations = [
+        Aggregation('count'), Aggregation('count', 2), Aggregation('sum', 2), Aggregation('sum', 3),
+        Aggregation('min', 2), Aggregation('max', 0), Aggregation('first', 2),
+    ]
+    result_file_name = group_by(file_name, schema, [0, 1], aggregations, tmp_directory, memory_budget)
+    assert os.listdir(tmp_directory) == [path.basename(result_file_name)]
+    with open(result_file_name, 'rb') as result_file:
+        new_data, byte_tail = deserialize(group_by_schema(schema, [0, 1], aggregations), result_file.read())
+        assert len(byte_tail) == 0
+    os.remove(result_file_name)
+
+    groups = {}
+    for row in data:
+        groups.setdefault((row[0], row[1]), []).append(row)
+    expected = []
+    for key, rows in groups.items():
+        values = [x[2] for x in rows if x[2] is not None]
+        expected.append([
+            *key, len(rows), len(values), sum(values) if values else None, sum(x[3] for x in rows),
+            min(values) if values else None, key[0], rows[0][2],
+        ])
+
+    assert sorted(new_data, key=str) == sorted(expected, key=str)
+
+
+def test_group_by_without_keys():
+    file_name = path.join('.', 'test', 'data', 'test_group_by_without_keys')
+    schema, data = generate_group_data(1000, 10)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    aggregations = [Aggregation('count'), Aggregation('max', 2)]
+    result_file_name = group_by(file_name, schema, [], aggregations, path.join('.', 'test', 'data'), 2 ** 20)
+    with open(result_file_name, 'rb') as result_file:
+        new_data, _ = deserialize(group_by_schema(schema, [], aggregations), result_file.read())
+    os.remove(result_file_name)
+
+    assert new_data == [[len(data), max(x[2] for x in data if x[2] is not None)]]
+
+    with pytest.raises(AssertionError, match='Memory budget'):
+        group_by(file_name, schema, [], aggregations, path.join('.', 'test', 'data'), MIN_GROUP_READ_SIZE)
+
+
+def test_group_by_growing_groups(monkeypatch):
+    tmp_directory = path.join('.', 'test', 'data', 'test_group_by_growing_groups_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    file_name = path.join('.', 'test', 'data', 'test_group_by_growing_groups')
+    schema = [CellType.STRING, CellType.INT]
+    data = [['', 0]] + [[f'{i:05d}' * 200, i] for i in range(2000)]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    # the first group is small, memory of table is checked by sizes of all spilled groups
+    group_by_module = importlib.import_module('algorithms.group_by')
+    spill, table_sizes = group_by_module._spill, []
+
+    def measured_spill(table, *args):
+        table_sizes.append(sum(group_by_module._group_size(*x) for x in table.items()))
+        spill(table, *args)
+
+    monkeypatch.setattr(group_by_module, '_spill', measured_spill)
+
+    memory_budget = 2 ** 18
+    aggregations = [Aggregation('count')]
+    result_file_name = group_by(file_name, schema, [0], aggregations, tmp_directory, memory_budget)
+    assert os.listdir(tmp_directory) == [path.basename(result_file_name)]
+    with open(result_file_name, 'rb') as result_file:
+        new_data, _ = deserialize(group_by_schema(schema, [0], aggregations), result_file.read())
+    os.remove(result_file_name)
+
+    assert sorted(new_data) == sorted([x[0], 1] for x in data)
+    assert len(table_sizes) > 0 and max(table_sizes) < 2 * memory_budget
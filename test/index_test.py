@@ -0,0 +1,51 @@
+import os
+from os import path
+
+from algorithms import serialize, deserialize, merge_sort, SortKey, SparseIndex, INDEX_SUFFIX
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+@pytest.mark.parametrize('raw_merge', [True, False])
+def test_sparse_index(ordered_data, raw_merge):
+    file_name = path.join('.', 'test', 'data', 'test_sparse_index')
+    schema, data = ordered_data
+    data = data[::-7]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sort_keys = [SortKey(16, False), 2]
+    sorted_file_name = merge_sort(
+        file_name, schema, sort_keys, path.join('.', 'test', 'data'), 2 ** 18, fan_in=3, raw_merge=raw_merge,
+        index_interval=100
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+
+    index = SparseIndex(sorted_file_name, schema, sort_keys)
+    assert len(index.keys) == (len(data) + 99) // 100
+    assert index.offsets[0] == 0 and index.offsets == sorted(index.offsets)
+
+    for key in ('', 'abc', 'zzz', ('abc', 3), ('b', 0), ('abc', 5)):
+        values = key if isinstance(key, tuple) else (key,)
+        expected = [x for x in new_data if [x[16], x[2]][:len(values)] == list(values)]
+        assert check_equal_data(expected, index.lookup(key))
+        assert len(index.lookup(key)) == len(expected)
+
+    rows = list(index.range_scan('c', ('abc', 2)))
+    expected = [x for x in new_data if 'c' >= x[16] > 'abc' or (x[16] == 'abc' and x[2] < 2)]
+    assert len(rows) == len(expected) > 0
+    assert check_equal_data(expected, rows)
+
+    assert len(list(index.range_scan())) == len(data)
+    assert list(index.range_scan(high='zzz')) == []
+
+    os.remove(sorted_file_name)
+    os.remove(sorted_file_name + INDEX_SUFFIX)
@@ -0,0 +1,131 @@
+import os
+import random
+from os import path
+
+from algorithms import CellType, serialize, deserialize, merge_sort, merge_join
+from algorithms.join import JOIN_TYPES
+from util import check_equal_data
+import pytest
+
+
+def generate_join_data(rows_number: int, keys_number: int, seed: int) -> tuple[list, list[list]]:
+    """Generate rows with repeated keys and null keys.
+
+    :param rows_number: number of rows.
+    :param keys_number: number of distinct keys.
+    :param seed: random seed.
+    :return:
+    """
+    schema = [CellType.STRING, CellType.INT, CellType.LONG_LONG]
+    rng = random.Random(seed)
+    data = [
+        [rng.choice(['a', 'b', None]), None if rng.random() < 0.05 else rng.randint(0, keys_number), i]
+        for i in range(rows_number)
+    ]
+    return schema, data
+
+
+def join(left_data, right_data, how):
+    right_groups, left_keys = {}, {tuple(x[:2]) for x in left_data}
+    for row in right_data:
+        right_groups.setdefault(tuple(row[:2]), []).append(row)
+
+    result = []
+    for row in left_data:
+        matched = [] if None in row[:2] else right_groups.get(tuple(row[:2]), [])
+        result.extend(row + x for x in matched)
+        if how in ('left', 'outer') and len(matched) == 0:
+            result.append(row + [None] * 3)
+    if how in ('right', 'outer'):
+        result.extend([None] * 3 + x for x in right_data if None in x[:2] or tuple(x[:2]) not in left_keys)
+    return result
+
+
+@pytest.mark.parametrize('how', JOIN_TYPES)
+def test_merge_join(how):
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_join_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    left_file_name = path.join('.', 'test', 'data', 'test_join_left')
+    right_file_name = path.join('.', 'test', 'data', 'test_join_right')
+    left_schema, left_data = generate_join_data(3000, 300, 1)
+    right_schema, right_data = generate_join_data(2000, 400, 2)
+    right_data += [['b', 7, -i] for i in range(5000)]
+
+    with open(left_file_name, 'wb') as file:
+        file.write(serialize(left_schema, left_data))
+    with open(right_file_name, 'wb') as file:
+        file.write(serialize(right_schema, right_data))
+
+    result_file_name = merge_join(
+        left_file_name, left_schema, [0, 1], right_file_name, right_schema, [0, 1], tmp_directory, 2 ** 16, how,
+        fan_in=4
+    )
+    assert os.listdir(tmp_directory) == [path.basename(result_file_name)]
+    with open(result_file_name, 'rb') as result_file:
+        new_data, byte_tail = deserialize(left_schema + right_schema, result_file.read())
+        assert len(byte_tail) == 0
+    os.remove(result_file_name)
+
+    expected = join(left_data, right_data, how)
+    assert len(new_data) == len(expected)
+    assert sorted(map(tuple, new_data), key=str) == sorted(map(tuple, expected), key=str)
+    keys = [x[:2] if x[0] is not None else x[3:5] for x in new_data]
+    keys = [x for x in keys if None not in x]
+    assert keys == sorted(keys)
+
+
+def test_merge_join_sorted():
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_join_sorted_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    left_file_name = path.join('.', 'test', 'data', 'test_join_left')
+    right_file_name = path.join('.', 'test', 'data', 'test_join_right')
+    schema, left_data = generate_join_data(2000, 100, 3)
+    _, right_data = generate_join_data(2000, 100, 4)
+    left_data = [x for x in left_data if x[1] is not None]
+
+    with open(left_file_name, 'wb') as file:
+        file.write(serialize(schema, left_data))
+    sorted_left_file_name = merge_sort(left_file_name, schema, [1], tmp_directory, 2 ** 14)
+    with open(right_file_name, 'wb') as file:
+        file.write(serialize(schema, right_data))
+
+    result_file_name = merge_join(
+        sorted_left_file_name, schema, [1], right_file_name, schema, [1], tmp_directory, 2 ** 16, is_left_sorted=True
+    )
+    assert sorted(os.listdir(tmp_directory)) == sorted(map(path.basename, [sorted_left_file_name, result_file_name]))
+    with open(result_file_name, 'rb') as result_file:
+        new_data, byte_tail = deserialize(schema + schema, result_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_left_file_name)
+    os.remove(result_file_name)
+
+    expected = [x + y for x in left_data for y in right_data if x[1] == y[1]]
+    assert len(new_data) == len(expected)
+    assert [x[1] for x in new_data] == sorted(x[1] for x in expected)
+    assert check_equal_data(sorted(expected, key=lambda x: (x[2], x[5])), sorted(new_data, key=lambda x: (x[2], x[5])))
+
+
+def test_merge_join_tuple_schema():
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_join_tuple_schema_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    left_file_name = path.join('.', 'test', 'data', 'test_join_left')
+    right_file_name = path.join('.', 'test', 'data', 'test_join_right')
+    schema, left_data = generate_join_data(500, 50, 5)
+    _, right_data = generate_join_data(500, 50, 6)
+
+    with open(left_file_name, 'wb') as file:
+        file.write(serialize(schema, left_data))
+    with open(right_file_name, 'wb') as file:
+        file.write(serialize(schema, right_data))
+
+    # schema type allows lists and tuples
+    result_file_name = merge_join(
+        left_file_name, tuple(schema), [0, 1], right_file_name, schema, [0, 1], tmp_directory, 2 ** 16
+    )
+    with open(result_file_name, 'rb') as result_file:
+        new_data, byte_tail = deserialize(schema + schema, result_file.read())
+        assert len(byte_tail) == 0
+    os.remove(result_file_name)
+
+    expected = join(left_data, right_data, 'inner')
+    assert sorted(map(tuple, new_data), key=str) == sorted(map(tuple, expected), key=str)
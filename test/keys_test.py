@@ -0,0 +1,50 @@
+import random
+
+from algorithms import CellType, SortKey, build_key_encoder
+
+
+def test_key_encoder_order():
+    """Test case for order of normalized keys for every cell type.
+
+    :return:
+    """
+    values = [
+        (CellType.SIGNED_CHAR, [-128, -1, 0, 1, 127]),
+        (CellType.UNSIGNED_CHAR, [0, 1, 255]),
+        (CellType.SHORT, [-2 ** 15, -300, 0, 300, 2 ** 15 - 1]),
+        (CellType.INT, [-2 ** 31, -70000, -1, 0, 1, 70000, 2 ** 31 - 1]),
+        (CellType.UNSIGNED_INT, [0, 255, 256, 2 ** 32 - 1]),
+        (CellType.LONG_LONG, [-2 ** 63, -2 ** 40, 0, 2 ** 40, 2 ** 63 - 1]),
+        (CellType.UNSIGNED_LONG_LONG, [0, 2 ** 40, 2 ** 64 - 1]),
+        (CellType.HALF_FLOAT, [-65504.0, -1.5, -0.0, 0.5, 2.0, 65504.0]),
+        (CellType.FLOAT, [float('-inf'), -1e30, -1.0, -1e-30, 0.0, 1e-30, 1.0, 1e30, float('inf')]),
+        (CellType.DOUBLE, [float('-inf'), -1e300, -2.5, -1e-300, 0.0, 1e-300, 2.5, 1e300, float('inf')]),
+        (CellType.BOOL, [False, True]),
+        (CellType.CHAR, ['\x00', 'a', 'b', 'z']),
+        (CellType.STRING, ['', '\x00', '\x00\x00', '\x00a', 'a', 'a\x00', 'ab', 'b', 'юникод']),
+    ]
+    for cell_type, cell_values in values:
+        for is_ascending_order in (True, False):
+            for is_nulls_first in (True, False):
+                encode = build_key_encoder([cell_type], [SortKey(0, is_ascending_order, is_nulls_first)])
+                rows = [[None]] + [[x] for x in cell_values]
+                random.Random(0).shuffle(rows)
+
+                expected = sorted([x for x in rows if x[0] is not None], reverse=not is_ascending_order)
+                expected = [[None]] + expected if is_nulls_first else expected + [[None]]
+                assert sorted(rows, key=encode) == expected, cell_type
+
+
+def test_key_encoder_composite():
+    """Test case for composite keys with mixed orders.
+
+    :return:
+    """
+    schema = [CellType.STRING, CellType.INT, CellType.DOUBLE]
+    rng = random.Random(1)
+    rows = [
+        [rng.choice(['', 'a', 'a\x00', 'ab', 'b']), rng.randint(-3, 3), rng.choice([-1.5, 0.0, 2.0])]
+        for _ in range(500)
+    ]
+    encode = build_key_encoder(schema, [SortKey(0), SortKey(1, False), SortKey(2)])
+    assert sorted(rows, key=encode) == sorted(rows, key=lambda x: (x[0], -x[1], x[2]))
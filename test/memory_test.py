@@ -0,0 +1,100 @@
+import os
+import random
+import tracemalloc
+from os import path
+
+from algorithms import CellType, serialize, deserialize, merge_sort, plan_memory, SortKey, SortStats
+from algorithms.memory import MIN_READ_BUFFER_SIZE
+from util import generate_ordered_data, check_equal_data
+import pytest
+
+
+@pytest.fixture
+def ordered_data():
+    return generate_ordered_data()
+
+
+def test_plan_memory(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_plan_memory')
+    schema, data = ordered_data
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+    sort_keys = [SortKey(16), SortKey(9, False, True)]
+
+    for memory_limit, workers in [(2 ** 26, 1), (2 ** 24, 1), (2 ** 25, 2)]:
+        plan = plan_memory(file_name, schema, sort_keys, memory_limit, workers=workers)
+        assert plan.memory_per_byte > 2
+        assert plan.block_size * plan.memory_per_byte < memory_limit / workers
+        assert plan.runs == -(-os.path.getsize(file_name) // plan.block_size)
+        assert plan.fan_in ** plan.passes >= plan.runs
+        assert plan.passes == 0 or (plan.block_size // MIN_READ_BUFFER_SIZE) ** (plan.passes - 1) < plan.runs
+        assert plan.read_buffer_size >= MIN_READ_BUFFER_SIZE
+
+    assert plan_memory(file_name, schema, sort_keys, 2 ** 26).passes == 1
+    compact_plan = plan_memory(file_name, schema, sort_keys, 2 ** 24, compact=True)
+    assert compact_plan.block_size > 2 * plan_memory(file_name, schema, sort_keys, 2 ** 24).block_size
+    runs = plan_memory(file_name, schema, sort_keys, 2 ** 24).runs
+    assert plan_memory(file_name, schema, sort_keys, 2 ** 24, replacement_selection=True).runs == -(-runs // 2)
+
+    with pytest.raises(AssertionError):
+        plan_memory(file_name, schema, sort_keys, 2 ** 22)
+
+
+def test_merge_sort_memory_limit(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_memory_limit')
+    schema, data = ordered_data
+    data = data[::-3]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_memory_limit_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    memory_limit, stats = 2 ** 24, SortStats()
+    tracemalloc.start()
+    try:
+        sorted_file_name = merge_sort(file_name, schema, [16, 9], tmp_directory, None, memory_limit=memory_limit,
+                                      sort_stats=stats)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert stats.runs > 1 and peak_memory < memory_limit
+
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_file_name)
+
+    data.sort(key=lambda x: (x[16], x[9]))
+    assert check_equal_data(data, new_data)
+
+
+def test_merge_sort_small_memory_limit():
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_small_memory_limit')
+    schema = [CellType.INT, CellType.INT]
+    random_ = random.Random(5)
+    data = [[random_.randrange(-2 ** 31, 2 ** 31), i] for i in range(150000)]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    # sample of planner decodes only its rows, not a whole read window
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_small_memory_limit_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    memory_limit = 3 * 2 ** 20
+    tracemalloc.start()
+    try:
+        sorted_file_name = merge_sort(file_name, schema, [0], tmp_directory, None, memory_limit=memory_limit)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak_memory < memory_limit
+
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+    os.remove(sorted_file_name)
+
+    data.sort(key=lambda x: x[0])
+    assert new_data == data
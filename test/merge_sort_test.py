@@ -1,6 +1,13 @@
+import importlib
+import os
+import random
 from os import path
 
-from algorithms import serialize, deserialize, SortInfo, merge_sort, split_file, merge_files
+from algorithms import (
+    serialize, deserialize, SortKey, SortInfo, merge_sort, iter_sorted, top_k, split_file, split_segments, merge_files,
+    DISTINCT_KEYS, DISTINCT_ROWS, SortStats, PHASES, RUN_EVENT, MERGE_EVENT, CellType, scan_natural_runs,
+    ASCENDING_RUN, DESCENDING_RUN, UNSORTED_RUN,
+)
 from util import generate_ordered_data, check_equal_data
 import pytest
 
@@ -18,20 +25,26 @@ def test_split_merge(ordered_data):
         raw_data = serialize(schema, data)
         file.write(raw_data)
 
-    info = SortInfo(schema, 16, path.join('.', 'test', 'data'), 2 ** 23, True, file_name)
-    first_file_name, second_file_name = split_file(file_name, info)
-    with open(first_file_name, 'rb') as first_file, \
-            open(second_file_name, 'rb') as second_file:
-        first_data, byte_tail = deserialize(schema, first_file.read())
-        assert len(byte_tail) == 0
-        second_data, byte_tail = deserialize(schema, second_file.read())
-        assert len(byte_tail) == 0
+    info = SortInfo(schema, [SortKey(16)], path.join('.', 'test', 'data'), 2 ** 23, file_name)
+    first_segment, second_segment = split_file(file_name, info)
+    assert first_segment.start == 0 and first_segment.end == second_segment.start
+    assert second_segment.end == len(raw_data)
+
+    first_data, byte_tail = deserialize(schema, raw_data[first_segment.start:first_segment.end])
+    assert len(byte_tail) == 0
+    second_data, byte_tail = deserialize(schema, raw_data[second_segment.start:second_segment.end])
+    assert len(byte_tail) == 0
 
     new_data = first_data + second_data
     assert len(data) == len(new_data)
     assert check_equal_data(data, new_data)
 
-    merged_file_name = merge_files(first_file_name, second_file_name, info)
+    segments = split_segments(file_name, 2 ** 20)
+    assert all(x.end - x.start <= 2 ** 20 for x in segments)
+    assert [x.start for x in segments[1:]] == [x.end for x in segments[:-1]]
+    assert sum(len(deserialize(schema, raw_data[x.start:x.end])[0]) for x in segments) == len(data)
+
+    merged_file_name = merge_files(first_segment, second_segment, info)
     with open(merged_file_name, 'rb') as merged_file:
         new_data, byte_tail = deserialize(schema, merged_file.read())
         assert len(byte_tail) == 0
@@ -59,3 +72,283 @@ def test_merge_sort(ordered_data):
         for schema_sort_index in reversed(schema_sort_indexes):
             data.sort(key=lambda x: x[schema_sort_index])
         assert check_equal_data(data, new_data)
+
+
+def test_merge_sort_mixed_order(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_mixed_order')
+    schema, data = ordered_data
+    data = data[::7]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sort_keys = [SortKey(16, False), SortKey(5), SortKey(0, False)]
+    sorted_file_name = merge_sort(
+        file_name, schema, sort_keys, path.join('.', 'test', 'data'), 2 ** 19, fan_in=3, workers=2
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+        assert len(new_data) == len(data)
+
+    for sort_key in reversed(sort_keys):
+        data.sort(key=lambda x: x[sort_key.index], reverse=not sort_key.is_ascending_order)
+    assert check_equal_data(data, new_data)
+
+
+def test_merge_sort_replacement_selection(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_replacement_selection')
+    schema, data = ordered_data
+    data = random.Random(1).sample(data[::5], len(data[::5]))
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sorted_file_name = merge_sort(
+        file_name, schema, [SortKey(16), SortKey(2, False)], path.join('.', 'test', 'data'), 2 ** 19,
+        fan_in=4, replacement_selection=True, raw_merge=False
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+        assert len(new_data) == len(data)
+
+    data.sort(key=lambda x: (x[16], -x[2]))
+    assert check_equal_data(data, new_data)
+
+
+def test_iter_sorted(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_iter_sorted')
+    schema, data = ordered_data
+    data = data[::-9]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_iter_sorted_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    rows = iter_sorted(file_name, schema, [9, 16], tmp_directory, 2 ** 18, fan_in=2)
+    first_row = next(rows)
+    assert len(os.listdir(tmp_directory)) == 2
+
+    new_data = [first_row] + list(rows)
+    assert len(os.listdir(tmp_directory)) == 0
+
+    data.sort(key=lambda x: (x[9], x[16]))
+    assert check_equal_data(data, new_data)
+
+
+def test_merge_sort_nulls(ordered_data):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_nulls')
+    schema, data = ordered_data
+    data = data[::11]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sort_keys = [SortKey(14, is_nulls_first=False), SortKey(13, True, True), SortKey(0)]
+    sorted_file_name = merge_sort(file_name, schema, sort_keys, path.join('.', 'test', 'data'), 2 ** 18, fan_in=3)
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+        assert len(new_data) == len(data)
+
+    data.sort(key=lambda x: x[0])
+    data.sort(key=lambda x: -1 if x[13] is None else x[13])
+    data.sort(key=lambda x: (x[14] is None, '' if x[14] is None else x[14]))
+    assert check_equal_data(data, new_data)
+
+
+@pytest.mark.parametrize('k, block_size', [(1000, 2 ** 18), (5000, 2 ** 16), (0, 2 ** 16)])
+def test_top_k(ordered_data, k, block_size):
+    file_name = path.join('.', 'test', 'data', 'test_top_k')
+    schema, data = ordered_data
+    data = data[::-3]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_top_k_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    sort_keys = [SortKey(16, False), SortKey(11, True, False)]
+    new_data = list(top_k(file_name, schema, sort_keys, k, tmp_directory, block_size, fan_in=4))
+    assert len(os.listdir(tmp_directory)) == 0
+
+    data.sort(key=lambda x: (x[11] is None, 0 if x[11] is None else x[11]))
+    data.sort(key=lambda x: x[16], reverse=True)
+    assert len(new_data) == k
+    assert check_equal_data(data[:k], new_data)
+
+
+@pytest.mark.parametrize('k, is_sorted', [(100, False), (1500, True)])
+def test_top_k_decoded_size(ordered_data, monkeypatch, k, is_sorted):
+    file_name = path.join('.', 'test', 'data', 'test_top_k')
+    schema, data = ordered_data
+    data = data[::-3]
+    raw_data = serialize(schema, data)
+
+    with open(file_name, 'wb') as file:
+        file.write(raw_data)
+
+    # serialized k rows fit into block, but decoded rows of heap are several times bigger
+    block_size = 2 ** 18
+    assert k * len(raw_data) // len(data) < block_size // 2
+    merge_sort_module = importlib.import_module('algorithms.merge_sort')
+    iter_sorted_, sorted_calls = merge_sort_module._iter_sorted, []
+
+    def counted_iter_sorted(*args):
+        sorted_calls.append(args)
+        return iter_sorted_(*args)
+
+    monkeypatch.setattr(merge_sort_module, '_iter_sorted', counted_iter_sorted)
+    tmp_directory = path.join('.', 'test', 'data', 'test_top_k_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    new_data = list(top_k(file_name, schema, [16], k, tmp_directory, block_size))
+    assert len(os.listdir(tmp_directory)) == 0
+    assert len(sorted_calls) == int(is_sorted)
+
+    data.sort(key=lambda x: x[16])
+    assert [x[16] for x in new_data] == [x[16] for x in data[:k]]
+
+
+def add_count(row, other_row):
+    return row[:9] + [row[9] + other_row[9]] + row[10:]
+
+
+@pytest.mark.parametrize('distinct, combine, raw_merge, replacement_selection', [
+    (DISTINCT_KEYS, None, True, False), (DISTINCT_ROWS, None, True, True), (DISTINCT_ROWS, None, False, False),
+    (None, add_count, True, False), (None, add_count, False, True),
+])
+def test_merge_sort_distinct(ordered_data, distinct, combine, raw_merge, replacement_selection):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_distinct')
+    schema, data = ordered_data
+    data = data[::19] * 3
+    random.Random(5).shuffle(data)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sorted_file_name = merge_sort(
+        file_name, schema, [16, 0], path.join('.', 'test', 'data'), 2 ** 16, fan_in=3, raw_merge=raw_merge,
+        replacement_selection=replacement_selection, workers=2, distinct=distinct, combine=combine
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+
+    groups = {}
+    for row in data:
+        groups.setdefault((row[16], row[0]), []).append(row)
+    assert [(x[16], x[0]) for x in new_data] == sorted(
+        x for x, rows in groups.items() for _ in range(len(set(map(tuple, rows))) if distinct == DISTINCT_ROWS else 1)
+    )
+    if distinct == DISTINCT_ROWS:
+        assert len(set(map(tuple, new_data))) == len(new_data)
+    if combine is not None:
+        assert [x[9] for x in new_data] == [sum(x[9] for x in groups[(x[16], x[0])]) for x in new_data]
+
+
+@pytest.mark.parametrize('workers, replacement_selection', [(1, False), (2, False), (1, True)])
+def test_merge_sort_stats(ordered_data, workers, replacement_selection):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_stats')
+    schema, data = ordered_data
+    data = data[::-3]
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_stats_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    stats, events = SortStats(), []
+    sorted_file_name = merge_sort(
+        file_name, schema, [9, 16], tmp_directory, 2 ** 18, fan_in=3, workers=workers,
+        replacement_selection=replacement_selection, sort_stats=stats, progress=events.append
+    )
+    os.remove(sorted_file_name)
+
+    assert stats.runs > 3 and stats.merge_passes >= 2
+    assert [x.kind for x in events] == [RUN_EVENT] * stats.runs + [MERGE_EVENT] * sum(x.runs for x in stats.passes[1:])
+    assert [x.pass_number for x in events] == sorted(x.pass_number for x in events)
+    assert events[-1].file_name == sorted_file_name and events[-1].stats is stats
+    assert stats.passes[0].read_bytes == os.path.getsize(file_name)
+    assert stats.passes[-1].runs == 1 and stats.passes[-1].written_bytes == events[-1].size
+    assert stats.passes[-1].read_bytes == stats.passes[0].written_bytes == os.path.getsize(file_name)
+    assert stats.temp_files == 1 and stats.temp_bytes == events[-1].size
+    assert stats.peak_temp_files >= stats.runs and stats.peak_temp_bytes >= stats.passes[0].written_bytes
+    assert all(getattr(stats, f'{x}_seconds') >= 0 for x in PHASES)
+    assert stats.sort_seconds > 0 and stats.compare_seconds > 0 and stats.write_seconds > 0
+
+    stats, events = SortStats(), []
+    rows = list(iter_sorted(
+        file_name, schema, [9, 16], tmp_directory, 2 ** 18, fan_in=3, sort_stats=stats, progress=events.append
+    ))
+    assert len(rows) == len(data) and len(os.listdir(tmp_directory)) == 0
+    assert events[-1].kind == MERGE_EVENT and events[-1].file_name is None
+    assert stats.passes[-1].written_bytes == 0 and stats.temp_files == 0
+
+
+@pytest.mark.parametrize('shape', ['sorted', 'reversed', 'mixed', 'duplicates', 'random'])
+@pytest.mark.parametrize('workers, compression', [(1, None), (2, 'zlib')])
+def test_merge_sort_natural_runs(shape, workers, compression):
+    file_name = path.join('.', 'test', 'data', 'test_merge_sort_natural_runs')
+    # reversed rows of fixed size are reversed as numpy array
+    schema = [CellType.INT, CellType.LONG_LONG if shape == 'reversed' else CellType.STRING]
+    data = [[i // 3 if shape == 'duplicates' else i, i if shape == 'reversed' else str(i)] for i in range(30000)]
+    random_ = random.Random(0)
+    if shape in ('reversed', 'duplicates'):
+        data.reverse()
+    elif shape == 'mixed':
+        middle = data[10000:20000]
+        random_.shuffle(middle)
+        data = data[:10000] + middle + data[20000:][::-1]
+    elif shape == 'random':
+        random_.shuffle(data)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    block_size = 2 ** 15
+    info = SortInfo(schema, [SortKey(0)], path.join('.', 'test', 'data'), block_size, file_name)
+    runs = scan_natural_runs(file_name, info)
+    if shape in ('duplicates', 'random'):
+        assert runs is None
+    else:
+        assert [x.segment.start for x in runs[1:]] == [x.segment.end for x in runs[:-1]]
+        assert runs[0].segment.start == 0 and runs[-1].segment.end == os.path.getsize(file_name)
+        assert [x.order for x in runs] == {
+            'sorted': [ASCENDING_RUN], 'reversed': [DESCENDING_RUN],
+            'mixed': [ASCENDING_RUN, UNSORTED_RUN, DESCENDING_RUN],
+        }[shape]
+
+    tmp_directory = path.join('.', 'test', 'data', 'test_merge_sort_natural_runs_tmp')
+    os.makedirs(tmp_directory, exist_ok=True)
+    stats = SortStats()
+    sorted_file_name = merge_sort(
+        file_name, schema, [0], tmp_directory, block_size, workers=workers, compression=compression,
+        sort_stats=stats, natural_runs=True
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+
+    # sorted input is copied, so result is always owned by caller
+    assert os.listdir(tmp_directory) == [path.basename(sorted_file_name)]
+    os.remove(sorted_file_name)
+    assert path.exists(file_name)
+    if shape == 'sorted' and compression is None:
+        assert stats.runs == 0 and stats.merge_passes == 0
+    if shape == 'reversed':
+        assert stats.runs == 1 and stats.merge_passes == int(compression is not None)
+    if shape in ('duplicates', 'random'):
+        assert stats.runs == len(split_segments(file_name, block_size))
+
+    rows = list(iter_sorted(
+        file_name, schema, [0], tmp_directory, block_size, workers=workers, compression=compression,
+        natural_runs=True
+    ))
+    assert len(os.listdir(tmp_directory)) == 0
+
+    # sort is stable
+    data.sort(key=lambda x: x[0])
+    assert check_equal_data(data, new_data)
+    assert check_equal_data(data, rows)
@@ -0,0 +1,70 @@
+import os
+import random
+import shutil
+from os import path
+
+from algorithms import CellType, SortKey, SegmentStore, serialize
+from util import check_equal_data
+import pytest
+
+
+@pytest.fixture
+def store_directory():
+    directory = path.join('.', 'test', 'data', 'test_segment_store')
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    yield directory
+    shutil.rmtree(directory)
+
+
+@pytest.mark.parametrize('tier_size', [2, 4])
+def test_segment_store(store_directory, tier_size):
+    schema = [CellType.INT, CellType.STRING, CellType.DOUBLE]
+    sort_keys = [SortKey(0, False, False), SortKey(2, True, True)]
+    random_ = random.Random(0)
+    batch_file_name = path.join('.', 'test', 'data', 'test_segment_store_batch')
+
+    store = SegmentStore(store_directory, schema, sort_keys, 2 ** 14, tier_size=tier_size)
+    assert list(store.iter_rows()) == []
+
+    data = []
+    for batch_number in range(20):
+        batch = [
+            [random_.randrange(50), f'{batch_number}_{i}', random_.choice([None, random_.random()])]
+            for i in range(random_.randrange(500, 1500))
+        ]
+        with open(batch_file_name, 'wb') as file:
+            file.write(serialize(schema, batch))
+        store.add(batch_file_name)
+        data.extend(batch)
+
+        # every tier has at most tier size minus one segments, old segments have higher tiers
+        tiers = store.tiers
+        assert all(tiers.count(x) < tier_size for x in tiers)
+        assert tiers == sorted(tiers, reverse=True)
+        assert sorted(os.listdir(store_directory)) == sorted(
+            [path.basename(x) for x in store.segments] + ['MANIFEST']
+        )
+
+    with open(batch_file_name, 'wb'):
+        pass
+    store.add(batch_file_name)
+    os.remove(batch_file_name)
+
+    # rows with equal keys are in order of batches
+    data.sort(key=lambda x: (x[2] is not None, x[2] or 0.0))
+    data.sort(key=lambda x: x[0], reverse=True)
+    assert check_equal_data(data, list(store.iter_rows()))
+
+    store = SegmentStore(store_directory, schema, sort_keys, 2 ** 14, tier_size=tier_size)
+    assert len(store.segments) == len(tiers) and store.tiers == tiers
+    assert check_equal_data(data, [x for batch in store.iter_rows(batches=True) for x in batch])
+
+    store.compact()
+    assert len(store.segments) == 1 and store.tiers == [max(tiers)]
+    assert check_equal_data(data, list(store.iter_rows()))
+
+    with pytest.raises(AssertionError):
+        SegmentStore(store_directory, schema[:2] + [CellType.FLOAT], sort_keys, 2 ** 14, tier_size=tier_size)
+    with pytest.raises(AssertionError):
+        SegmentStore(store_directory, schema, [SortKey(0)], 2 ** 14, tier_size=tier_size)
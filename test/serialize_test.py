@@ -1,6 +1,6 @@
 from os import path
 
-from algorithms import serialize, deserialize
+from algorithms import CellType, RowCodec, serialize, deserialize, iter_rows
 from util import generate_ordered_data, check_equal_data
 
 
@@ -37,3 +37,65 @@ def test_serialize():
 
     assert len(data) == len(new_data)
     assert check_equal_data(data, new_data)
+
+
+def test_serialize_special_cells():
+    """Test case for nulls, empty and multi-byte strings, bytes.
+
+    :return:
+    """
+    schema = [CellType.STRING, CellType.INT, CellType.CHAR, CellType.DOUBLE, CellType.BYTES, CellType.STRING]
+    data = [
+        ['', None, 'a', 1.5, b'', ''],
+        [None, 3, None, None, b'\x00\x01', 'xyz'],
+        ['юникод', -1, 'b', None, None, None],
+    ]
+
+    raw_data = serialize(schema, data)
+    new_data, byte_tail = deserialize(schema, raw_data + raw_data[:7])
+    assert byte_tail == raw_data[:7]
+    assert new_data == data
+
+    rows, row_end = RowCodec(schema).decode(raw_data, 0, len(raw_data) - 1)
+    assert rows == data[:-1]
+    assert row_end == len(serialize(schema, data[:-1]))
+
+
+def test_iter_rows():
+    """Test case for lazy read of rows by blocks.
+
+    :return:
+    """
+    schema, data = generate_ordered_data()
+    data = data[::10]
+
+    file_name = path.join('.', 'test', 'data', 'test_iter_rows')
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    new_data = list(iter_rows(file_name, schema, 2 ** 12))
+    assert len(data) == len(new_data)
+    assert check_equal_data(data, new_data)
+
+    with open(file_name, 'rb') as file:
+        batches = list(iter_rows(file, schema, 2 ** 16, batches=True))
+    assert len(batches) > 1
+    assert sum(len(x) for x in batches) == len(data)
+
+
+def test_cell_reader():
+    """Test case for decode of some cells without decode of row.
+
+    :return:
+    """
+    schema, data = generate_ordered_data()
+    data = data[:100]
+    codec = RowCodec(schema)
+    raw_data = serialize(schema, data)
+
+    read_cells = codec.build_cell_reader([16, 0, 14, 13])
+    index = 0
+    for row in data:
+        assert read_cells(memoryview(raw_data), index + codec.row_length.size) == [row[16], row[0], row[14], row[13]]
+        index += codec.row_length.unpack_from(raw_data, index)[0]
+    assert index == len(raw_data)
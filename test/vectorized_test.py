@@ -0,0 +1,121 @@
+import random
+from os import path
+
+import pytest
+
+from algorithms import CellType, SortKey, RowCodec, serialize, deserialize, merge_sort, DISTINCT_KEYS, DISTINCT_ROWS
+from util import check_equal_data
+
+np = pytest.importorskip('numpy')
+
+
+def generate_numeric_data(rows_number: int, null_rate: float = 0.0) -> tuple[list, list[list]]:
+    """Generate rows of schema with fixed size cells.
+
+    :param rows_number: number of rows.
+    :param null_rate: part of null cells.
+    :return:
+    """
+    schema = [CellType.CHAR, CellType.INT, CellType.UNSIGNED_SHORT, CellType.DOUBLE, CellType.BOOL, CellType.FLOAT]
+    rng = random.Random(3)
+    data = []
+    for _ in range(rows_number):
+        row = [
+            rng.choice('abc'), rng.randint(-2 ** 31, 2 ** 31 - 1), rng.randint(0, 10),
+            rng.uniform(-1e6, 1e6), rng.random() < 0.5, float(rng.randint(-5, 5)),
+        ]
+        data.append([None if rng.random() < null_rate else x for x in row])
+    return schema, data
+
+
+def test_arrays_round_trip():
+    schema, data = generate_numeric_data(1000)
+    codec = RowCodec(schema)
+    assert codec.arrays is not None
+    assert RowCodec([CellType.INT, CellType.STRING]).arrays is None
+
+    raw_data = serialize(schema, data)
+    assert len(raw_data) == codec.arrays.row_size * len(data)
+    assert len(codec.arrays.view(raw_data)) == len(data)
+
+    new_data, byte_tail = deserialize(schema, raw_data + raw_data[:5])
+    assert byte_tail == raw_data[:5]
+    assert check_equal_data(data, new_data)
+
+    schema, data = generate_numeric_data(1000, 0.001)
+    raw_data = serialize(schema, data)
+    assert 0 < len(codec.arrays.view(raw_data)) < len(data)
+    new_data, byte_tail = deserialize(schema, raw_data)
+    assert len(byte_tail) == 0
+    assert check_equal_data(data, new_data)
+
+
+def test_arrays_zero_char():
+    schema = [CellType.CHAR, CellType.INT]
+    data = [['\x00' if i % 2 == 0 else 'a', i] for i in range(40)]
+    assert RowCodec(schema).arrays is not None
+
+    new_data, byte_tail = deserialize(schema, serialize(schema, data))
+    assert len(byte_tail) == 0
+    assert new_data == data
+
+
+@pytest.mark.parametrize('cell_type, value', [
+    (CellType.FLOAT, 1e300), (CellType.HALF_FLOAT, 1e10), (CellType.INT, 2 ** 40), (CellType.UNSIGNED_CHAR, -1),
+    (CellType.SHORT, 1.5), (CellType.DOUBLE, 2 ** 2000),
+])
+def test_arrays_bad_values(cell_type, value):
+    schema = [CellType.INT, cell_type]
+    assert RowCodec(schema).arrays is not None
+
+    # error of bad value is the same for one row and for vectorized rows
+    with pytest.raises(Exception) as error:
+        serialize(schema, [[0, value]])
+    for rows_number in (1, 40):
+        with pytest.raises(type(error.value)):
+            serialize(schema, [[i, value] for i in range(rows_number)])
+
+    data = [[i, 1.5 if cell_type in (CellType.FLOAT, CellType.HALF_FLOAT, CellType.DOUBLE) else 1] for i in range(40)]
+    assert deserialize(schema, serialize(schema, data))[0] == data
+
+
+def test_arrays_merge_sort():
+    file_name = path.join('.', 'test', 'data', 'test_arrays_merge_sort')
+    schema, data = generate_numeric_data(20000)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sort_keys = [SortKey(0, False), SortKey(2), SortKey(4, False), SortKey(5, False)]
+    sorted_file_name = merge_sort(file_name, schema, sort_keys, path.join('.', 'test', 'data'), 2 ** 16, fan_in=4)
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+
+    data.sort(key=lambda x: (-ord(x[0]), x[2], not x[4], -x[5]))
+    assert check_equal_data(data, new_data)
+
+
+@pytest.mark.parametrize('distinct', [DISTINCT_KEYS, DISTINCT_ROWS])
+def test_arrays_distinct(distinct):
+    file_name = path.join('.', 'test', 'data', 'test_arrays_distinct')
+    schema, data = generate_numeric_data(5000)
+    data = [x[:1] + [0] + x[2:3] + [0.0] + x[4:] for x in data] * 2
+    random.Random(7).shuffle(data)
+
+    with open(file_name, 'wb') as file:
+        file.write(serialize(schema, data))
+
+    sort_keys = [SortKey(0), SortKey(2, False)]
+    sorted_file_name = merge_sort(
+        file_name, schema, sort_keys, path.join('.', 'test', 'data'), 2 ** 16, fan_in=4, distinct=distinct
+    )
+    with open(sorted_file_name, 'rb') as sorted_file:
+        new_data, byte_tail = deserialize(schema, sorted_file.read())
+        assert len(byte_tail) == 0
+
+    if distinct == DISTINCT_KEYS:
+        assert [(x[0], x[2]) for x in new_data] == sorted({(x[0], x[2]) for x in data}, key=lambda x: (x[0], -x[1]))
+    else:
+        assert sorted(map(tuple, new_data)) == sorted(set(map(tuple, data)))
+        assert new_data == sorted(new_data, key=lambda x: (x[0], -x[2]))